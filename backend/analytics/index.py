@@ -0,0 +1,446 @@
+import json
+import os
+import gzip
+import base64
+import functools
+import time
+import psycopg2
+import jwt
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+}
+
+# Сколько курсов из журнала пересчитывается за одну транзакцию и время работы одного вызова пересчета
+ANALYTICS_REFRESH_BATCH = int(os.environ.get('ANALYTICS_REFRESH_BATCH', '200'))
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get('ANALYTICS_REFRESH_SECONDS', '20'))
+
+# Одна строка на назначение; статусы считаются по назначению и прогрессу
+ROLLUP_SOURCE_SQL = (
+    "SELECT ca.course_id, COALESCE(u.department, '') AS department, "
+    "(COALESCE(cp.completed, FALSE) OR ca.status = 'completed') AS is_completed, "
+    "(COALESCE(cp.completed_lessons, 0) > 0 OR ca.status = 'in_progress') AS is_started, "
+    "(ca.status = 'overdue' OR ca.due_date < %(now)s) AS is_late, "
+    "ca.due_date, cp.test_score, "
+    "EXTRACT(EPOCH FROM cp.completed_at - cp.started_at) / 3600 AS hours_to_complete "
+    "FROM course_assignments ca "
+    "JOIN users u ON u.id = ca.user_id "
+    "LEFT JOIN course_progress cp ON cp.user_id = ca.user_id AND cp.course_id = ca.course_id "
+    "WHERE ca.course_id = ANY(%(course_ids)s)"
+)
+ROLLUP_AGGREGATES = (
+    "COUNT(r.course_id), "
+    "COUNT(*) FILTER (WHERE r.is_started AND NOT r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_late AND NOT r.is_completed), "
+    "ROUND(AVG(r.test_score), 2), "
+    "ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY r.hours_to_complete) "
+    "FILTER (WHERE r.is_completed AND r.hours_to_complete IS NOT NULL)::numeric, 2)"
+)
+STATS_COLUMNS = (
+    "COALESCE(s.assigned, 0), COALESCE(s.in_progress, 0), COALESCE(s.completed, 0), COALESCE(s.overdue, 0), "
+    "s.avg_test_score, s.median_hours_to_complete"
+)
+
+def get_db_connection():
+    dsn = os.environ['DATABASE_URL']
+    return psycopg2.connect(dsn)
+
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
+def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except:
+        return None
+    if is_token_revoked(payload):
+        return None
+    return payload
+
+def require_admin(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    if not auth_token:
+        return None, {'statusCode': 401, 'error': 'Токен отсутствует'}
+    
+    payload = verify_jwt_token(auth_token)
+    if not payload:
+        return None, {'statusCode': 401, 'error': 'Недействительный токен'}
+    
+    if payload.get('role') != 'admin':
+        return None, {'statusCode': 403, 'error': 'Доступ запрещен. Требуются права администратора'}
+    
+    return payload, None
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+
+def refresh_rollups(conn, limit: int = ANALYTICS_REFRESH_BATCH) -> int:
+    '''
+    Пересчитывает витрины для курсов из журнала analytics_changes и курсов, у которых
+    наступил срок незавершенного назначения. Строки журнала забираются с SKIP LOCKED,
+    поэтому параллельные вызовы берут разные строки и не ждут друг друга. Удаляются только
+    записи, видимые снимку пересчета: запись транзакции, изменения которой в снимок
+    не попали, остается в журнале. Возвращает число курсов
+    '''
+    now = datetime.utcnow()
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM analytics_changes WHERE id IN ("
+        "SELECT id FROM analytics_changes ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+        ") RETURNING course_id",
+        (limit,)
+    )
+    course_ids = {row[0] for row in cur.fetchall()}
+    cur.execute(
+        "SELECT course_id FROM course_stats WHERE next_due_at <= %s LIMIT %s",
+        (now, limit)
+    )
+    course_ids = sorted(course_ids | {row[0] for row in cur.fetchall()})
+    
+    if not course_ids:
+        conn.commit()
+        cur.close()
+        return 0
+    
+    # Строки одного курса могут достаться разным вызовам: пересчет курса сериализуется
+    # блокировкой на время транзакции, взятой в порядке id против взаимоблокировок
+    cur.execute(
+        "SELECT pg_advisory_xact_lock(hashtext('analytics:' || course_id)) FROM unnest(%s::varchar[]) AS course_id",
+        (course_ids,)
+    )
+    
+    params = {'now': now, 'course_ids': course_ids}
+    cur.execute("DELETE FROM course_department_stats WHERE course_id = ANY(%(course_ids)s)", params)
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_department_stats (course_id, department, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, refreshed_at) "
+        f"SELECT r.course_id, r.department, {ROLLUP_AGGREGATES}, %(now)s FROM r GROUP BY r.course_id, r.department",
+        params
+    )
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_stats (course_id, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, next_due_at, refreshed_at) "
+        f"SELECT c.id, {ROLLUP_AGGREGATES}, "
+        "MIN(r.due_date) FILTER (WHERE NOT r.is_completed AND NOT r.is_late), %(now)s "
+        "FROM courses c LEFT JOIN r ON r.course_id = c.id "
+        "WHERE c.id = ANY(%(course_ids)s) GROUP BY c.id "
+        "ON CONFLICT (course_id) DO UPDATE SET assigned = EXCLUDED.assigned, in_progress = EXCLUDED.in_progress, "
+        "completed = EXCLUDED.completed, overdue = EXCLUDED.overdue, avg_test_score = EXCLUDED.avg_test_score, "
+        "median_hours_to_complete = EXCLUDED.median_hours_to_complete, next_due_at = EXCLUDED.next_due_at, "
+        "refreshed_at = EXCLUDED.refreshed_at",
+        params
+    )
+    conn.commit()
+    cur.close()
+    return len(course_ids)
+
+def format_stats(row: tuple) -> Dict[str, Any]:
+    # row: assigned, in_progress, completed, overdue, avg_test_score, median_hours_to_complete
+    assigned = row[0]
+    return {
+        'assigned': assigned,
+        'inProgress': row[1],
+        'completed': row[2],
+        'overdue': row[3],
+        'completionRate': round(row[2] * 100 / assigned, 1) if assigned else 0,
+        'avgTestScore': float(row[4]) if row[4] is not None else None,
+        'medianHoursToComplete': float(row[5]) if row[5] is not None else None,
+    }
+
+@with_compression
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Аналитика по курсам (только админ), читается из витрин course_stats и course_department_stats
+    GET / - сводка по всем курсам
+    GET ?courseId=x - сводка по курсу с разбивкой по отделам
+    GET ?department=x - сводка по курсам для одного отдела
+    POST ?action=refresh - пересчитать весь журнал изменений; в обычной работе витрины
+    догоняют функции progress и assignments, пересчитывая небольшую пачку после записи
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = event.get('headers', {})
+    query_params = event.get('queryStringParameters', {}) or {}
+    course_id = query_params.get('courseId')
+    department = query_params.get('department')
+    action = query_params.get('action', '')
+    
+    payload, admin_error = require_admin(headers)
+    if admin_error:
+        return {
+            'statusCode': admin_error['statusCode'],
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'refresh':
+        conn = get_db_connection()
+        track_activity(conn, payload['user_id'])
+        
+        # Параллельные вызовы разбирают журнал непересекающимися пачками
+        started = time.monotonic()
+        refreshed_count = 0
+        has_more = True
+        while has_more and time.monotonic() - started < ANALYTICS_REFRESH_SECONDS:
+            batch_count = refresh_rollups(conn)
+            refreshed_count += batch_count
+            # Повторы курса в журнале сокращают пачку, поэтому признак конца - пустая пачка
+            has_more = batch_count > 0
+        
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'refreshed': refreshed_count, 'hasMore': has_more}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
+    cur = conn.cursor()
+    
+    if course_id:
+        cur.execute(
+            f"SELECT c.title, {STATS_COLUMNS}, s.refreshed_at "
+            "FROM courses c LEFT JOIN course_stats s ON s.course_id = c.id WHERE c.id = %s",
+            (course_id,)
+        )
+        course = cur.fetchone()
+        
+        if not course:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Курс не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        cur.execute(
+            f"SELECT s.department, {STATS_COLUMNS} "
+            "FROM course_department_stats s WHERE s.course_id = %s ORDER BY s.department",
+            (course_id,)
+        )
+        departments = [{'department': row[0] or None, **format_stats(row[1:])} for row in cur.fetchall()]
+        
+        cur.close()
+        conn.close()
+        
+        course_data = {
+            'courseId': course_id,
+            'title': course[0],
+            **format_stats(course[1:7]),
+            'refreshedAt': course[7].isoformat() if course[7] else None,
+            'departments': departments
+        }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'course': course_data}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if department is not None:
+        cur.execute(
+            f"SELECT c.id, c.title, {STATS_COLUMNS} "
+            "FROM course_department_stats s JOIN courses c ON c.id = s.course_id "
+            "WHERE s.department = %s ORDER BY c.title",
+            (department,)
+        )
+    else:
+        cur.execute(
+            f"SELECT c.id, c.title, {STATS_COLUMNS} "
+            "FROM courses c LEFT JOIN course_stats s ON s.course_id = c.id ORDER BY c.title"
+        )
+    courses = [{'courseId': row[0], 'title': row[1], **format_stats(row[2:])} for row in cur.fetchall()]
+    
+    cur.close()
+    conn.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'courses': courses}, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
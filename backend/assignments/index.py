@@ -1,14 +1,68 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import io
+import time
 import psycopg2
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable
 from pydantic import BaseModel, Field
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+# Пересчет витрин аналитики после записи (та же логика, что в backend/analytics): небольшая
+# пачка курсов из журнала, не чаще раза в ANALYTICS_REFRESH_INTERVAL секунд на экземпляр
+ANALYTICS_REFRESH_BATCH = int(os.environ.get('ANALYTICS_WRITE_REFRESH_BATCH', '5'))
+ANALYTICS_REFRESH_INTERVAL = float(os.environ.get('ANALYTICS_REFRESH_INTERVAL', '30'))
+_analytics_refresh_state: Dict[str, float] = {'refreshed_at': float('-inf')}
+
+# Одна строка на назначение; статусы считаются по назначению и прогрессу
+ROLLUP_SOURCE_SQL = (
+    "SELECT ca.course_id, COALESCE(u.department, '') AS department, "
+    "(COALESCE(cp.completed, FALSE) OR ca.status = 'completed') AS is_completed, "
+    "(COALESCE(cp.completed_lessons, 0) > 0 OR ca.status = 'in_progress') AS is_started, "
+    "(ca.status = 'overdue' OR ca.due_date < %(now)s) AS is_late, "
+    "ca.due_date, cp.test_score, "
+    "EXTRACT(EPOCH FROM cp.completed_at - cp.started_at) / 3600 AS hours_to_complete "
+    "FROM course_assignments ca "
+    "JOIN users u ON u.id = ca.user_id "
+    "LEFT JOIN course_progress cp ON cp.user_id = ca.user_id AND cp.course_id = ca.course_id "
+    "WHERE ca.course_id = ANY(%(course_ids)s)"
+)
+ROLLUP_AGGREGATES = (
+    "COUNT(r.course_id), "
+    "COUNT(*) FILTER (WHERE r.is_started AND NOT r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_late AND NOT r.is_completed), "
+    "ROUND(AVG(r.test_score), 2), "
+    "ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY r.hours_to_complete) "
+    "FILTER (WHERE r.is_completed AND r.hours_to_complete IS NOT NULL)::numeric, 2)"
+)
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+}
+
+# Строк за одну выборку серверного курсора при потоковом кодировании списков
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', '2000'))
 
 class AssignCourseRequest(BaseModel):
     courseId: str = Field(..., min_length=1)
@@ -20,12 +74,92 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_admin(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -53,6 +187,178 @@ def format_assignment_response(assignment_row: tuple) -> Dict[str, Any]:
         'notes': assignment_row[7],
     }
 
+def stream_json_body(conn, key: str, query: str, params: Any, format_row: Callable[[tuple], Any],
+                     extra: Optional[Callable[[], Dict[str, Any]]] = None) -> str:
+    '''
+    Собирает тело {"key": [...], **extra()} построчно через именованный (серверный) курсор:
+    в памяти нет списков кортежей и словарей, только itersize строк выборки и готовый текст.
+    Пиковая память снижается, но не постоянна: функция отдает тело одной строкой, поэтому текст
+    и его копия в str растут с числом строк. Объем ответа ограничивают только страницы (limit/offset).
+    extra вызывается после выборки, когда известны итоги по строкам
+    '''
+    # UTF-8 в байтовом буфере компактнее, чем str с кириллицей (2-4 байта на символ)
+    buffer = io.BytesIO()
+    buffer.write(json.dumps(key).encode('utf-8').join((b'{', b': [')))
+    with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as stream_cur:
+        stream_cur.itersize = STREAM_ITERSIZE
+        stream_cur.execute(query, params)
+        for index, row in enumerate(stream_cur):
+            if index:
+                buffer.write(b', ')
+            buffer.write(json.dumps(format_row(row), ensure_ascii=False).encode('utf-8'))
+    buffer.write(b']')
+    extra_data = extra() if extra else None
+    if extra_data:
+        buffer.write(b', ' + json.dumps(extra_data, ensure_ascii=False)[1:-1].encode('utf-8'))
+    buffer.write(b'}')
+    return str(buffer.getbuffer(), 'utf-8')
+
+def mark_analytics_changed(cur, course_id: str) -> None:
+    # Курс попадает в журнал пересчета витрин аналитики (backend/analytics). Журнал только
+    # дописывается: пересчет удаляет лишь видимые ему строки, и запись незавершенной транзакции
+    # останется до следующего пересчета
+    cur.execute(
+        "INSERT INTO analytics_changes (course_id, changed_at) VALUES (%s, %s)",
+        (course_id, datetime.utcnow())
+    )
+
+def refresh_rollups(conn, limit: int) -> int:
+    '''
+    Пересчитывает витрины для курсов из журнала analytics_changes и курсов, у которых
+    наступил срок незавершенного назначения. Строки журнала забираются с SKIP LOCKED,
+    поэтому параллельные вызовы берут разные строки и не ждут друг друга. Удаляются только
+    записи, видимые снимку пересчета: запись транзакции, изменения которой в снимок
+    не попали, остается в журнале. Возвращает число курсов
+    '''
+    now = datetime.utcnow()
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM analytics_changes WHERE id IN ("
+        "SELECT id FROM analytics_changes ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+        ") RETURNING course_id",
+        (limit,)
+    )
+    course_ids = {row[0] for row in cur.fetchall()}
+    cur.execute(
+        "SELECT course_id FROM course_stats WHERE next_due_at <= %s LIMIT %s",
+        (now, limit)
+    )
+    course_ids = sorted(course_ids | {row[0] for row in cur.fetchall()})
+    
+    if not course_ids:
+        conn.commit()
+        cur.close()
+        return 0
+    
+    # Строки одного курса могут достаться разным вызовам: пересчет курса сериализуется
+    # блокировкой на время транзакции, взятой в порядке id против взаимоблокировок
+    cur.execute(
+        "SELECT pg_advisory_xact_lock(hashtext('analytics:' || course_id)) FROM unnest(%s::varchar[]) AS course_id",
+        (course_ids,)
+    )
+    
+    params = {'now': now, 'course_ids': course_ids}
+    cur.execute("DELETE FROM course_department_stats WHERE course_id = ANY(%(course_ids)s)", params)
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_department_stats (course_id, department, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, refreshed_at) "
+        f"SELECT r.course_id, r.department, {ROLLUP_AGGREGATES}, %(now)s FROM r GROUP BY r.course_id, r.department",
+        params
+    )
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_stats (course_id, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, next_due_at, refreshed_at) "
+        f"SELECT c.id, {ROLLUP_AGGREGATES}, "
+        "MIN(r.due_date) FILTER (WHERE NOT r.is_completed AND NOT r.is_late), %(now)s "
+        "FROM courses c LEFT JOIN r ON r.course_id = c.id "
+        "WHERE c.id = ANY(%(course_ids)s) GROUP BY c.id "
+        "ON CONFLICT (course_id) DO UPDATE SET assigned = EXCLUDED.assigned, in_progress = EXCLUDED.in_progress, "
+        "completed = EXCLUDED.completed, overdue = EXCLUDED.overdue, avg_test_score = EXCLUDED.avg_test_score, "
+        "median_hours_to_complete = EXCLUDED.median_hours_to_complete, next_due_at = EXCLUDED.next_due_at, "
+        "refreshed_at = EXCLUDED.refreshed_at",
+        params
+    )
+    conn.commit()
+    cur.close()
+    return len(course_ids)
+
+def refresh_rollups_if_due(conn) -> None:
+    # Вызывается после commit записи. Сбой пересчета не влияет на ответ: строки журнала
+    # вернутся при откате и достанутся следующему вызову
+    now = time.monotonic()
+    if ANALYTICS_REFRESH_BATCH <= 0 or now - _analytics_refresh_state['refreshed_at'] < ANALYTICS_REFRESH_INTERVAL:
+        return
+    _analytics_refresh_state['refreshed_at'] = now
+    try:
+        refresh_rollups(conn, ANALYTICS_REFRESH_BATCH)
+    except psycopg2.Error:
+        conn.rollback()
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Назначение курсов студентам (только админ)
@@ -93,16 +399,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
     cur = conn.cursor()
     
     if method == 'GET' and user_id_param:
-        cur.execute(
+        assignments_body = stream_json_body(
+            conn, 'assignments',
             "SELECT id, course_id, user_id, assigned_by, assigned_at, due_date, status, notes "
             "FROM course_assignments WHERE user_id = %s ORDER BY assigned_at DESC",
-            (user_id_param,)
+            (user_id_param,),
+            format_assignment_response
         )
-        assignments = cur.fetchall()
-        assignments_list = [format_assignment_response(a) for a in assignments]
         
         cur.close()
         conn.close()
@@ -110,18 +417,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'assignments': assignments_list}, ensure_ascii=False),
+            'body': assignments_body,
             'isBase64Encoded': False
         }
     
     if method == 'GET' and course_id_param:
-        cur.execute(
+        assignments_body = stream_json_body(
+            conn, 'assignments',
             "SELECT id, course_id, user_id, assigned_by, assigned_at, due_date, status, notes "
             "FROM course_assignments WHERE course_id = %s ORDER BY assigned_at DESC",
-            (course_id_param,)
+            (course_id_param,),
+            format_assignment_response
         )
-        assignments = cur.fetchall()
-        assignments_list = [format_assignment_response(a) for a in assignments]
         
         cur.close()
         conn.close()
@@ -129,7 +436,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'assignments': assignments_list}, ensure_ascii=False),
+            'body': assignments_body,
             'isBase64Encoded': False
         }
     
@@ -169,7 +476,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "ON CONFLICT (course_id, user_id) DO NOTHING",
             (str(uuid.uuid4()), assign_req.courseId, assign_req.userId, now, now, now, assign_req.courseId)
         )
+        mark_analytics_changed(cur, assign_req.courseId)
         conn.commit()
+        refresh_rollups_if_due(conn)
         
         assignment_data = format_assignment_response(new_assignment)
         
@@ -193,7 +502,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "DELETE FROM course_assignments WHERE course_id = %s AND user_id = %s",
             (course_id_param, user_id_param)
         )
+        mark_analytics_changed(cur, course_id_param)
         conn.commit()
+        refresh_rollups_if_due(conn)
         
         cur.close()
         conn.close()
@@ -231,7 +542,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "DELETE FROM course_assignments WHERE id = %s",
             (assignment_id,)
         )
+        mark_analytics_changed(cur, assignment[0])
         conn.commit()
+        refresh_rollups_if_due(conn)
         
         cur.close()
         conn.close()
@@ -1,5 +1,9 @@
 import json
 import os
+import time
+import hashlib
+import secrets
+import uuid
 import psycopg2
 import bcrypt
 import jwt
@@ -9,12 +13,30 @@ from pydantic import BaseModel, EmailStr, Field, ValidationError
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
-JWT_EXPIRATION_HOURS = 24
+ACCESS_TOKEN_EXPIRATION_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRATION_MINUTES', '15'))
+REFRESH_TOKEN_EXPIRATION_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRATION_DAYS', '30'))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', '60'))
+PROFILE_INVALIDATION_INTERVAL = int(os.environ.get('PROFILE_INVALIDATION_INTERVAL', '5'))
+_profile_cache: Dict[str, tuple[float, str, str]] = {}
+_profile_invalidation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+# Хеш для проверки несуществующих email: время ответа не выдает, есть ли пользователь
+DUMMY_PASSWORD_HASH = bcrypt.hashpw(b'dummy-password', bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
 
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=1)
 
+class RefreshRequest(BaseModel):
+    refreshToken: str = Field(..., min_length=1)
+
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -32,23 +54,183 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    if note_activity(user_id):
+        flush_activity(conn)
+
+def note_activity(user_id: str) -> bool:
+    # Запоминает отметку в памяти; True - пора сбросить накопленные отметки в БД
+    _activity_pending[user_id] = datetime.utcnow()
+    return time.monotonic() - _activity_flushed_at.get(user_id, float('-inf')) >= ACTIVITY_FLUSH_INTERVAL
+
+def flush_activity(conn) -> None:
+    now = time.monotonic()
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def profile_invalidations_due() -> bool:
+    return time.monotonic() - _profile_invalidation_state['checked_at'] >= PROFILE_INVALIDATION_INTERVAL
+
+def refresh_profile_invalidations(conn) -> None:
+    '''
+    Сбрасывает кэш профилей, измененных функцией users: она обновляет users.updated_at
+    при изменении профиля, роли, пароля и активности
+    '''
+    now = time.monotonic()
+    if not profile_invalidations_due():
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _profile_invalidation_state['since']
+    if since is not None and _profile_cache:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id FROM users WHERE updated_at > %s",
+            (since - timedelta(seconds=PROFILE_INVALIDATION_INTERVAL),)
+        )
+        for (user_id,) in cur.fetchall():
+            _profile_cache.pop(user_id, None)
+        cur.close()
+    
+    _profile_invalidation_state['checked_at'] = now
+    _profile_invalidation_state['since'] = utc_now
+
+def get_cached_profile(user_id: str) -> Optional[tuple[str, str]]:
+    cached = _profile_cache.get(user_id)
+    if not cached:
+        return None
+    if cached[0] <= time.monotonic():
+        _profile_cache.pop(user_id, None)
+        return None
+    return cached[1], cached[2]
+
+def cache_profile(user_id: str, body: str) -> str:
+    etag = '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+    _profile_cache[user_id] = (time.monotonic() + PROFILE_CACHE_TTL, body, etag)
+    return etag
+
+def get_bcrypt_rounds(password_hash: str) -> Optional[int]:
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
 def create_jwt_token(user_id: str, email: str, role: str) -> str:
     payload = {
         'user_id': user_id,
         'email': email,
         'role': role,
-        'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+        'jti': str(uuid.uuid4()),
+        'exp': datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def hash_refresh_token(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+
+def issue_refresh_token(cur, user_id: str, family_id: str) -> tuple[str, str]:
+    refresh_token = secrets.token_urlsafe(48)
+    token_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    cur.execute(
+        "INSERT INTO refresh_tokens (id, user_id, family_id, token_hash, expires_at, created_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        (token_id, user_id, family_id, hash_refresh_token(refresh_token),
+         now + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS), now)
+    )
+    return token_id, refresh_token
+
+def revoke_access_token(cur, payload: Dict[str, Any]) -> None:
+    jti = payload.get('jti')
+    if not jti:
+        return
+    expires_at = datetime.utcfromtimestamp(payload['exp'])
+    cur.execute(
+        "INSERT INTO revoked_tokens (jti, user_id, expires_at, revoked_at) VALUES (%s, %s, %s, %s) "
+        "ON CONFLICT (jti) DO NOTHING",
+        (jti, payload.get('user_id'), expires_at, datetime.utcnow())
+    )
+    _revoked_tokens[jti] = expires_at
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def format_user_response(user_row: tuple) -> Dict[str, Any]:
     return {
@@ -68,7 +250,7 @@ def format_user_response(user_row: tuple) -> Dict[str, Any]:
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Аутентификация пользователей: вход, выход, проверка токена
-    Endpoints: POST ?action=login, POST ?action=logout, GET ?action=me
+    Endpoints: POST ?action=login, POST ?action=refresh, POST ?action=logout, GET ?action=me
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -78,7 +260,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -105,6 +287,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user = cur.fetchone()
         
         if not user:
+            bcrypt.checkpw(login_req.password.encode('utf-8'), DUMMY_PASSWORD_HASH)
             cur.close()
             conn.close()
             return {
@@ -137,14 +320,88 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         print(f"[DEBUG] Login successful for user: {user[1]}")
         
+        if get_bcrypt_rounds(password_hash) != BCRYPT_ROUNDS:
+            new_password_hash = bcrypt.hashpw(
+                login_req.password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+            ).decode('utf-8')
+            cur.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (new_password_hash, user[0])
+            )
+            conn.commit()
+        
+        track_activity(conn, user[0])
+        
+        token = create_jwt_token(user[0], user[1], user[3])
+        _, refresh_token = issue_refresh_token(cur, user[0], str(uuid.uuid4()))
+        conn.commit()
+        user_data = format_user_response(user[:11])
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'token': token,
+                'refreshToken': refresh_token,
+                'expiresIn': ACCESS_TOKEN_EXPIRATION_MINUTES * 60,
+                'user': user_data
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'refresh':
+        body_data = json.loads(event.get('body', '{}'))
+        try:
+            refresh_req = RefreshRequest(**body_data)
+        except ValidationError:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Не передан refresh-токен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
         cur.execute(
-            "UPDATE users SET last_active = %s WHERE id = %s",
-            (datetime.utcnow(), user[0])
+            "SELECT rt.id, rt.family_id, rt.expires_at, rt.revoked_at, u.id, u.email, u.role, u.is_active "
+            "FROM refresh_tokens rt JOIN users u ON u.id = rt.user_id "
+            "WHERE rt.token_hash = %s FOR UPDATE OF rt",
+            (hash_refresh_token(refresh_req.refreshToken),)
+        )
+        stored = cur.fetchone()
+        now = datetime.utcnow()
+        
+        if stored and stored[3] is not None:
+            # Повторное использование уже замененного токена: отзываем всю цепочку
+            cur.execute(
+                "UPDATE refresh_tokens SET revoked_at = %s WHERE family_id = %s AND revoked_at IS NULL",
+                (now, stored[1])
+            )
+            conn.commit()
+        
+        if not stored or stored[3] is not None or stored[2] <= now or not stored[7]:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Недействительный токен обновления'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        new_token_id, new_refresh_token = issue_refresh_token(cur, stored[4], stored[1])
+        cur.execute(
+            "UPDATE refresh_tokens SET revoked_at = %s, replaced_by = %s WHERE id = %s",
+            (now, new_token_id, stored[0])
         )
         conn.commit()
         
-        token = create_jwt_token(user[0], user[1], user[3])
-        user_data = format_user_response(user[:11])
+        token = create_jwt_token(stored[4], stored[5], stored[6])
         
         cur.close()
         conn.close()
@@ -152,11 +409,48 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'token': token, 'user': user_data}, ensure_ascii=False),
+            'body': json.dumps({
+                'token': token,
+                'refreshToken': new_refresh_token,
+                'expiresIn': ACCESS_TOKEN_EXPIRATION_MINUTES * 60
+            }, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
     if method == 'POST' and action == 'logout':
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        body_data = json.loads(event.get('body') or '{}')
+        refresh_token = body_data.get('refreshToken')
+        
+        payload = None
+        if auth_token:
+            try:
+                payload = jwt.decode(
+                    auth_token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={'verify_exp': False}
+                )
+            except jwt.InvalidTokenError:
+                payload = None
+        
+        if payload or refresh_token:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            now = datetime.utcnow()
+            
+            if payload and datetime.utcfromtimestamp(payload.get('exp', 0)) > now:
+                revoke_access_token(cur, payload)
+            
+            if refresh_token:
+                cur.execute(
+                    "UPDATE refresh_tokens SET revoked_at = %s "
+                    "WHERE family_id = (SELECT family_id FROM refresh_tokens WHERE token_hash = %s) "
+                    "AND revoked_at IS NULL",
+                    (now, hash_refresh_token(refresh_token))
+                )
+            
+            conn.commit()
+            cur.close()
+            conn.close()
+        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
@@ -211,33 +505,69 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Соединение открывается только для сброса отметок активности, опроса изменений
+        # профилей или промаха кэша: повторные запросы из кэша обходятся без БД
+        conn = None
+        if note_activity(payload['user_id']):
+            conn = get_db_connection()
+            flush_activity(conn)
+        if profile_invalidations_due():
+            conn = conn or get_db_connection()
+            refresh_profile_invalidations(conn)
         
-        cur.execute(
-            "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
-            "registration_date, last_active FROM users WHERE id = %s",
-            (payload['user_id'],)
-        )
-        user = cur.fetchone()
+        cached = get_cached_profile(payload['user_id'])
+        if cached:
+            body, etag = cached
+        else:
+            conn = conn or get_db_connection()
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
+                "registration_date, last_active FROM users WHERE id = %s",
+                (payload['user_id'],)
+            )
+            user = cur.fetchone()
+            cur.close()
+            
+            if not user:
+                conn.close()
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Пользователь не найден'}, ensure_ascii=False),
+                    'isBase64Encoded': False
+                }
+            
+            body = json.dumps({'user': format_user_response(user)}, ensure_ascii=False)
+            etag = cache_profile(payload['user_id'], body)
         
-        cur.close()
-        conn.close()
+        if conn is not None:
+            conn.close()
         
-        if not user:
+        if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+        if if_none_match == etag:
             return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Пользователь не найден'}, ensure_ascii=False),
+                'statusCode': 304,
+                'headers': {
+                    'ETag': etag,
+                    'Cache-Control': 'private, no-cache',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag'
+                },
+                'body': '',
                 'isBase64Encoded': False
             }
         
-        user_data = format_user_response(user)
-        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'user': user_data}, ensure_ascii=False),
+            'headers': {
+                'Content-Type': 'application/json; charset=utf-8',
+                'ETag': etag,
+                'Cache-Control': 'private, no-cache',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'ETag'
+            },
+            'body': body,
             'isBase64Encoded': False
         }
     
@@ -0,0 +1,568 @@
+import json
+import os
+import gzip
+import base64
+import functools
+import time
+import psycopg2
+import psycopg2.pool
+import jwt
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Callable
+from pydantic import BaseModel, Field, ValidationError
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'POST': 6,
+}
+
+ASSIGNMENT_CACHE_TTL = int(os.environ.get('ASSIGNMENT_CACHE_TTL', '30'))
+_assigned_courses: Dict[str, tuple[float, frozenset]] = {}
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+# Число соединений пула инстанса; 1 - все подзапросы последовательно на одном соединении
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '4'))
+_connection_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    function: str = Field(..., min_length=1)
+    method: str = Field(default='GET')
+    query: Dict[str, Any] = Field(default_factory=dict)
+    body: Optional[Dict[str, Any]] = None
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+def get_db_connection():
+    dsn = os.environ['DATABASE_URL']
+    return psycopg2.connect(dsn)
+
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
+def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except:
+        return None
+    if is_token_revoked(payload):
+        return None
+    return payload
+
+def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    if not auth_token:
+        return None, {'statusCode': 401, 'error': 'Токен отсутствует'}
+    
+    payload = verify_jwt_token(auth_token)
+    if not payload:
+        return None, {'statusCode': 401, 'error': 'Недействительный токен'}
+    
+    return payload, None
+
+def cache_assigned_courses(user_id: str, course_ids: Optional[List[str]]) -> frozenset:
+    assigned = frozenset(course_ids or [])
+    _assigned_courses[user_id] = (time.monotonic(), assigned)
+    return assigned
+
+def get_cached_assigned_courses(user_id: str) -> Optional[frozenset]:
+    entry = _assigned_courses.get(user_id)
+    if entry and time.monotonic() - entry[0] < ASSIGNMENT_CACHE_TTL:
+        return entry[1]
+    return None
+
+def has_course_access(cur, payload: Dict[str, Any], course_id: str) -> bool:
+    if payload.get('role') == 'admin':
+        return True
+    # Доверяем только положительному ответу кэша: новое назначение видно сразу, снятое - через TTL
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None and course_id in assigned:
+        return True
+    cur.execute(
+        "SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s)",
+        (payload['user_id'],)
+    )
+    return course_id in cache_assigned_courses(payload['user_id'], cur.fetchone()[0])
+
+def fetch_with_course_access(cur, payload: Dict[str, Any], query: str, params: tuple) -> tuple[Optional[tuple], bool]:
+    '''
+    Выбирает одну запись (первая колонка - course_id) вместе с проверкой назначения курса.
+    Без свежего кэша назначения загружаются в том же запросе
+    '''
+    if payload.get('role') == 'admin':
+        cur.execute(query, params)
+        return cur.fetchone(), True
+    
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None:
+        cur.execute(query, params)
+        row = cur.fetchone()
+        if row is None or row[0] in assigned:
+            return row, row is not None
+    
+    cur.execute(
+        f"WITH entity AS ({query}) "
+        "SELECT entity.*, assigned.course_ids "
+        "FROM (SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s) AS course_ids) assigned "
+        "LEFT JOIN entity ON TRUE",
+        (*params, payload['user_id'])
+    )
+    row = cur.fetchone()
+    assigned = cache_assigned_courses(payload['user_id'], row[-1])
+    if row[0] is None:
+        return None, False
+    return row[:-1], row[0] in assigned
+
+def format_course_response(course_row: tuple) -> Dict[str, Any]:
+    return {
+        'id': course_row[0],
+        'title': course_row[1],
+        'description': course_row[2],
+        'duration': course_row[3],
+        'lessonsCount': course_row[4],
+        'category': course_row[5],
+        'image': course_row[6],
+        'published': course_row[7],
+        'passScore': course_row[8],
+        'level': course_row[9],
+        'instructor': course_row[10],
+        'status': course_row[11],
+        'startDate': course_row[12].isoformat() if course_row[12] else None,
+        'endDate': course_row[13].isoformat() if course_row[13] else None,
+        'accessType': course_row[14],
+    }
+
+def format_progress_response(progress_row: tuple) -> Dict[str, Any]:
+    return {
+        'courseId': progress_row[0],
+        'userId': progress_row[1],
+        'completedLessons': progress_row[2],
+        'totalLessons': progress_row[3],
+        'testScore': progress_row[4],
+        'completed': progress_row[5],
+        'completedLessonIds': progress_row[6] if progress_row[6] else [],
+        'lastAccessedLesson': progress_row[7],
+        'startedAt': progress_row[8].isoformat() if progress_row[8] else None,
+    }
+
+def format_assignment_response(assignment_row: tuple) -> Dict[str, Any]:
+    return {
+        'id': assignment_row[0],
+        'courseId': assignment_row[1],
+        'userId': assignment_row[2],
+        'assignedBy': assignment_row[3],
+        'assignedAt': assignment_row[4].isoformat() if assignment_row[4] else None,
+        'dueDate': assignment_row[5].isoformat() if assignment_row[5] else None,
+        'status': assignment_row[6],
+        'notes': assignment_row[7],
+    }
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+
+def get_connection_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    '''
+    Пул соединений живет между вызовами теплого инстанса, поэтому пакет
+    не открывает новое соединение на каждый подзапрос
+    '''
+    global _connection_pool
+    if _connection_pool is None or _connection_pool.closed:
+        _connection_pool = psycopg2.pool.ThreadedConnectionPool(1, BATCH_MAX_WORKERS, os.environ['DATABASE_URL'])
+    return _connection_pool
+
+def batch_courses(cur, payload: Dict[str, Any], query: Dict[str, Any]) -> tuple[int, Dict[str, Any]]:
+    course_id = query.get('id')
+    
+    if not course_id:
+        if payload.get('role') == 'admin':
+            cur.execute(
+                "SELECT id, title, description, duration, lessons_count, category, image, published, "
+                "pass_score, level, instructor, status, start_date, end_date, access_type "
+                "FROM courses ORDER BY created_at DESC"
+            )
+        else:
+            cur.execute(
+                "SELECT c.id, c.title, c.description, c.duration, c.lessons_count, c.category, c.image, "
+                "c.published, c.pass_score, c.level, c.instructor, c.status, c.start_date, c.end_date, c.access_type "
+                "FROM courses c "
+                "INNER JOIN course_assignments ca ON c.id = ca.course_id "
+                "WHERE ca.user_id = %s "
+                "ORDER BY ca.assigned_at DESC",
+                (payload['user_id'],)
+            )
+        return 200, {'courses': [format_course_response(course) for course in cur.fetchall()]}
+    
+    course, has_access = fetch_with_course_access(
+        cur, payload,
+        "SELECT id, title, description, duration, lessons_count, category, image, published, "
+        "pass_score, level, instructor, status, start_date, end_date, access_type "
+        "FROM courses WHERE id = %s",
+        (course_id,)
+    )
+    if not course:
+        return 404, {'error': 'Курс не найден'}
+    if not has_access:
+        return 403, {'error': 'Доступ к курсу запрещен'}
+    
+    return 200, {'course': format_course_response(course)}
+
+def batch_progress(cur, payload: Dict[str, Any], query: Dict[str, Any]) -> tuple[int, Dict[str, Any]]:
+    user_id = query.get('userId')
+    course_id = query.get('courseId')
+    
+    if payload.get('role') != 'admin' and user_id != payload['user_id']:
+        return 403, {'error': 'Доступ запрещен'}
+    if not user_id:
+        return 404, {'error': 'Маршрут не найден'}
+    
+    if course_id:
+        cur.execute(
+            "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
+            "completed_lesson_ids, last_accessed_lesson, started_at "
+            "FROM course_progress WHERE user_id = %s AND course_id = %s",
+            (user_id, course_id)
+        )
+        progress = cur.fetchone()
+        if not progress:
+            return 404, {'error': 'Прогресс не найден'}
+        return 200, {'progress': format_progress_response(progress)}
+    
+    cur.execute(
+        "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
+        "completed_lesson_ids, last_accessed_lesson, started_at "
+        "FROM course_progress WHERE user_id = %s ORDER BY started_at DESC",
+        (user_id,)
+    )
+    return 200, {'progress': [format_progress_response(p) for p in cur.fetchall()]}
+
+def batch_assignments(cur, payload: Dict[str, Any], query: Dict[str, Any]) -> tuple[int, Dict[str, Any]]:
+    if payload.get('role') != 'admin':
+        return 403, {'error': 'Доступ запрещен. Требуются права администратора'}
+    
+    if query.get('userId'):
+        cur.execute(
+            "SELECT id, course_id, user_id, assigned_by, assigned_at, due_date, status, notes "
+            "FROM course_assignments WHERE user_id = %s ORDER BY assigned_at DESC",
+            (query['userId'],)
+        )
+    elif query.get('courseId'):
+        cur.execute(
+            "SELECT id, course_id, user_id, assigned_by, assigned_at, due_date, status, notes "
+            "FROM course_assignments WHERE course_id = %s ORDER BY assigned_at DESC",
+            (query['courseId'],)
+        )
+    else:
+        return 404, {'error': 'Маршрут не найден'}
+    
+    return 200, {'assignments': [format_assignment_response(a) for a in cur.fetchall()]}
+
+def batch_rewards(cur, payload: Dict[str, Any], query: Dict[str, Any]) -> tuple[int, Dict[str, Any]]:
+    reward_id = query.get('id')
+    course_id = query.get('courseId')
+    
+    sql = (
+        "SELECT r.id, r.name, r.icon, r.color, r.course_id, r.description, r.condition, r.bonuses, "
+        "r.created_at, (SELECT COUNT(*) FROM user_rewards ur WHERE ur.reward_id = r.id) FROM rewards r"
+    )
+    if reward_id:
+        cur.execute(sql + " WHERE r.id = %s", (reward_id,))
+    elif course_id:
+        cur.execute(sql + " WHERE r.course_id = %s ORDER BY r.created_at DESC", (course_id,))
+    else:
+        cur.execute(sql + " ORDER BY r.created_at DESC")
+    
+    rewards = [{
+        'id': row[0],
+        'name': row[1],
+        'icon': row[2],
+        'color': row[3],
+        'courseId': row[4],
+        'description': row[5],
+        'condition': row[6],
+        'bonuses': row[7] if row[7] else [],
+        'createdAt': row[8].isoformat() if row[8] else None,
+        'earnedCount': row[9]
+    } for row in cur.fetchall()]
+    
+    if reward_id:
+        if not rewards:
+            return 404, {'error': 'Награда не найдена'}
+        return 200, {'reward': rewards[0]}
+    return 200, {'rewards': rewards}
+
+BATCH_ROUTES: Dict[str, Callable[..., tuple[int, Dict[str, Any]]]] = {
+    'courses': batch_courses,
+    'progress': batch_progress,
+    'assignments': batch_assignments,
+    'rewards': batch_rewards,
+}
+
+# Маршруты пакета повторяют только базовые чтения функций. fields, ids, action и прочие
+# параметры отклоняются, а не игнорируются: за ними нужно обращаться в саму функцию
+BATCH_ROUTE_PARAMS: Dict[str, frozenset] = {
+    'courses': frozenset({'id'}),
+    'progress': frozenset({'userId', 'courseId'}),
+    'assignments': frozenset({'userId', 'courseId'}),
+    'rewards': frozenset({'id', 'courseId'}),
+}
+
+def run_sub_request(sub_request: SubRequest, payload: Dict[str, Any]) -> Dict[str, Any]:
+    route = BATCH_ROUTES.get(sub_request.function)
+    if route is None:
+        return {'id': sub_request.id, 'status': 404, 'body': {'error': 'Маршрут не найден'}}
+    if sub_request.method.upper() != 'GET':
+        return {'id': sub_request.id, 'status': 405, 'body': {'error': 'В пакете поддерживаются только GET-запросы'}}
+    unsupported = sorted(set(sub_request.query) - BATCH_ROUTE_PARAMS[sub_request.function])
+    if unsupported:
+        return {'id': sub_request.id, 'status': 400,
+                'body': {'error': f"Параметры не поддерживаются в пакете: {', '.join(unsupported)}"}}
+    
+    query = {key: str(value) for key, value in sub_request.query.items()}
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            status, body = route(cur, payload, query)
+        finally:
+            cur.close()
+    except psycopg2.Error as e:
+        discard = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        status, body = 500, {'error': 'Ошибка базы данных'}
+    finally:
+        pool.putconn(conn, close=discard or bool(conn.closed))
+    
+    return {'id': sub_request.id, 'status': status, 'body': body}
+
+@with_compression
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Пакетное выполнение чтений из нескольких функций за один запрос
+    POST {"requests": [{"id", "function", "method", "query"}]} - function: courses, progress, assignments, rewards
+    Токен проверяется один раз, подзапросы выполняются параллельно на пуле соединений инстанса.
+    Подзапросы читают БД напрямую, без ETag и кэша функций; fields, ids и action не поддерживаются (400)
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = event.get('headers', {})
+    
+    payload, auth_error = require_auth(headers)
+    if auth_error:
+        return {
+            'statusCode': auth_error['statusCode'],
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': auth_error['error']}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    body_data = json.loads(event.get('body', '{}'))
+    try:
+        batch_req = BatchRequest(**body_data)
+    except ValidationError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Ошибка валидации', 'details': e.errors()}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if not batch_req.requests or len(batch_req.requests) > BATCH_MAX_REQUESTS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Пакет должен содержать от 1 до {BATCH_MAX_REQUESTS} запросов'}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        track_activity(conn, payload['user_id'])
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+    
+    workers = min(BATCH_MAX_WORKERS, len(batch_req.requests))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(lambda sub_request: run_sub_request(sub_request, payload), batch_req.requests))
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'responses': responses}, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
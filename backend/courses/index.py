@@ -1,14 +1,76 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import io
+import time
+import hashlib
 import psycopg2
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Callable
 from pydantic import BaseModel, Field
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+}
+
+# Строк за одну выборку серверного курсора при потоковом кодировании списков
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', '2000'))
+
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+ASSIGNMENT_CACHE_TTL = int(os.environ.get('ASSIGNMENT_CACHE_TTL', '30'))
+_assigned_courses: Dict[str, tuple[float, frozenset]] = {}
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_SHARED_URL = os.environ.get('CACHE_REDIS_URL')
+# Срок жизни в общем кэше только для очистки: устаревшие записи отсекает версия в ключе
+CACHE_SHARED_TTL = int(os.environ.get('CACHE_SHARED_TTL', '86400'))
+_local_cache: 'OrderedDict[str, Any]' = OrderedDict()
+_shared_cache: Any = None
+
+# Поле ответа -> колонка; порядок совпадает с format_course_response
+COURSE_FIELDS: Dict[str, Optional[str]] = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'duration': 'duration',
+    'lessonsCount': 'lessons_count',
+    'category': 'category',
+    'image': 'image',
+    'published': 'published',
+    'passScore': 'pass_score',
+    'level': 'level',
+    'instructor': 'instructor',
+    'status': 'status',
+    'startDate': 'start_date',
+    'endDate': 'end_date',
+    'accessType': 'access_type',
+}
 
 class CreateCourseRequest(BaseModel):
     title: str = Field(..., min_length=1)
@@ -40,12 +102,92 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -68,7 +210,105 @@ def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     
     return None
 
-def format_course_response(course_row: tuple) -> Dict[str, Any]:
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, Optional[str]]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?fields=a,b,c по белому списку маршрута. None - вернуть все поля
+    '''
+    raw_fields = query_params.get('fields')
+    if not raw_fields:
+        return None, None
+    
+    fields = list(dict.fromkeys(field.strip() for field in raw_fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return None, f"Недопустимые поля: {', '.join(unknown)}"
+    
+    # id всегда первая колонка: по row[0] строки сопоставляются с ids и связанными данными
+    return ['id'] + [field for field in fields if field != 'id'], None
+
+def select_columns(fields: Optional[List[str]], allowed: Dict[str, Optional[str]], prefix: str = '') -> str:
+    return ', '.join(prefix + allowed[field] for field in (fields or allowed) if allowed[field])
+
+def format_fields(row: tuple, fields: List[str], allowed: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    columns = [field for field in fields if allowed[field]]
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in zip(columns, row)
+    }
+
+def parse_ids(query_params: Dict[str, Any]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?ids=a,b,c для выборки нескольких записей одним запросом. None - параметр не передан
+    '''
+    raw_ids = query_params.get('ids')
+    if raw_ids is None:
+        return None, None
+    ids = list(dict.fromkeys(item.strip() for item in raw_ids.split(',') if item.strip()))
+    if not ids or len(ids) > MULTI_GET_MAX_IDS:
+        return None, f'Параметр ids должен содержать от 1 до {MULTI_GET_MAX_IDS} идентификаторов'
+    return ids, None
+
+def order_by_ids(rows: List[tuple], ids: List[str]) -> List[tuple]:
+    # Строки возвращаются в порядке ids из запроса; первая колонка - id (parse_fields ставит его первым)
+    rows_by_id = {row[0]: row for row in rows}
+    return [rows_by_id[item] for item in ids if item in rows_by_id]
+
+def cache_assigned_courses(user_id: str, course_ids: Optional[List[str]]) -> frozenset:
+    assigned = frozenset(course_ids or [])
+    _assigned_courses[user_id] = (time.monotonic(), assigned)
+    return assigned
+
+def get_cached_assigned_courses(user_id: str) -> Optional[frozenset]:
+    entry = _assigned_courses.get(user_id)
+    if entry and time.monotonic() - entry[0] < ASSIGNMENT_CACHE_TTL:
+        return entry[1]
+    return None
+
+def has_course_access(cur, payload: Dict[str, Any], course_id: str) -> bool:
+    if payload.get('role') == 'admin':
+        return True
+    # Доверяем только положительному ответу кэша: новое назначение видно сразу, снятое - через TTL
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None and course_id in assigned:
+        return True
+    cur.execute(
+        "SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s)",
+        (payload['user_id'],)
+    )
+    return course_id in cache_assigned_courses(payload['user_id'], cur.fetchone()[0])
+
+def fetch_with_course_access(cur, payload: Dict[str, Any], query: str, params: tuple) -> tuple[Optional[tuple], bool]:
+    '''
+    Выбирает одну запись (первая колонка - course_id) вместе с проверкой назначения курса.
+    Без свежего кэша назначения загружаются в том же запросе
+    '''
+    if payload.get('role') == 'admin':
+        cur.execute(query, params)
+        return cur.fetchone(), True
+    
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None:
+        cur.execute(query, params)
+        row = cur.fetchone()
+        if row is None or row[0] in assigned:
+            return row, row is not None
+    
+    cur.execute(
+        f"WITH entity AS ({query}) "
+        "SELECT entity.*, assigned.course_ids "
+        "FROM (SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s) AS course_ids) assigned "
+        "LEFT JOIN entity ON TRUE",
+        (*params, payload['user_id'])
+    )
+    row = cur.fetchone()
+    assigned = cache_assigned_courses(payload['user_id'], row[-1])
+    if row[0] is None:
+        return None, False
+    return row[:-1], row[0] in assigned
+
+def format_course_response(course_row: tuple, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        return format_fields(course_row, fields, COURSE_FIELDS)
     return {
         'id': course_row[0],
         'title': course_row[1],
@@ -87,11 +327,195 @@ def format_course_response(course_row: tuple) -> Dict[str, Any]:
         'accessType': course_row[14],
     }
 
+def make_etag(*parts: Any) -> str:
+    raw = '|'.join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32] + '"'
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json; charset=utf-8',
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+def is_not_modified(headers: Dict[str, Any], etag: str) -> bool:
+    return (headers.get('If-None-Match') or headers.get('if-none-match')) == etag
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    response_headers = etag_headers(etag)
+    del response_headers['Content-Type']
+    return {
+        'statusCode': 304,
+        'headers': response_headers,
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def get_shared_cache() -> Any:
+    '''
+    Общий кэш между инстансами (Redis-совместимый клиент с get/set).
+    Можно подменить через set_shared_cache, без CACHE_REDIS_URL работает только память инстанса
+    '''
+    global _shared_cache
+    if _shared_cache is None and CACHE_SHARED_URL and redis is not None:
+        _shared_cache = redis.Redis.from_url(CACHE_SHARED_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _shared_cache
+
+def set_shared_cache(client: Any) -> None:
+    global _shared_cache
+    _shared_cache = client
+
+def get_cache_version(cur, scope: str) -> int:
+    cur.execute("SELECT version FROM cache_versions WHERE scope = %s", (scope,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_cache_version(cur, *scopes: str) -> None:
+    # Вызывается в транзакции записи: новая версия видна читателям вместе с изменениями
+    for scope in scopes:
+        cur.execute(
+            "INSERT INTO cache_versions (scope, version, updated_at) VALUES (%s, 1, %s) "
+            "ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1, updated_at = EXCLUDED.updated_at",
+            (scope, datetime.utcnow())
+        )
+
+def cache_key(scope: str, version: int, *parts: Any) -> str:
+    digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f"{scope}:{version}:{digest}"
+
+def cache_get(key: str) -> Any:
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key]
+    
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    try:
+        raw_value = shared.get(key)
+    except Exception:
+        # Недоступный общий кэш не должен ломать чтение
+        return None
+    if raw_value is None:
+        return None
+    value = json.loads(raw_value)
+    cache_store_local(key, value)
+    return value
+
+def cache_store_local(key: str, value: Any) -> None:
+    _local_cache[key] = value
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > CACHE_MAX_ENTRIES:
+        _local_cache.popitem(last=False)
+
+def cache_set(key: str, value: Any) -> None:
+    cache_store_local(key, value)
+    shared = get_shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.set(key, json.dumps(value, ensure_ascii=False), ex=CACHE_SHARED_TTL)
+    except Exception:
+        pass
+
+def stream_json_body(conn, key: str, query: str, params: Any, format_row: Callable[[tuple], Any],
+                     extra: Optional[Callable[[], Dict[str, Any]]] = None) -> str:
+    '''
+    Собирает тело {"key": [...], **extra()} построчно через именованный (серверный) курсор:
+    в памяти нет списков кортежей и словарей, только itersize строк выборки и готовый текст.
+    Пиковая память снижается, но не постоянна: функция отдает тело одной строкой, поэтому текст
+    и его копия в str растут с числом строк. Объем ответа ограничивают только страницы (limit/offset).
+    extra вызывается после выборки, когда известны итоги по строкам
+    '''
+    # UTF-8 в байтовом буфере компактнее, чем str с кириллицей (2-4 байта на символ)
+    buffer = io.BytesIO()
+    buffer.write(json.dumps(key).encode('utf-8').join((b'{', b': [')))
+    with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as stream_cur:
+        stream_cur.itersize = STREAM_ITERSIZE
+        stream_cur.execute(query, params)
+        for index, row in enumerate(stream_cur):
+            if index:
+                buffer.write(b', ')
+            buffer.write(json.dumps(format_row(row), ensure_ascii=False).encode('utf-8'))
+    buffer.write(b']')
+    extra_data = extra() if extra else None
+    if extra_data:
+        buffer.write(b', ' + json.dumps(extra_data, ensure_ascii=False)[1:-1].encode('utf-8'))
+    buffer.write(b'}')
+    return str(buffer.getbuffer(), 'utf-8')
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление курсами
     GET / - все курсы (админ видит все, студент только назначенные)
     GET ?id=x - один курс
+    GET ?ids=a,b,c - несколько курсов одним запросом (студенту только назначенные)
+    GET ?fields=id,title,... - только указанные поля (для списка и одного курса)
     POST / - создать курс (только админ)
     PUT ?id=x - обновить курс (только админ)
     DELETE ?id=x - удалить курс (только админ)
@@ -104,7 +528,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -125,47 +549,133 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
     cur = conn.cursor()
     
-    if method == 'GET' and not course_id:
+    fields, fields_error = parse_fields(query_params, COURSE_FIELDS) if method == 'GET' else (None, None)
+    if fields_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    ids, ids_error = parse_ids(query_params) if method == 'GET' else (None, None)
+    if ids_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': ids_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and ids:
+        # Недоступные и несуществующие курсы попадают в missing
         if payload.get('role') == 'admin':
             cur.execute(
-                "SELECT id, title, description, duration, lessons_count, category, image, published, "
-                "pass_score, level, instructor, status, start_date, end_date, access_type "
-                "FROM courses ORDER BY created_at DESC"
+                f"SELECT {select_columns(fields, COURSE_FIELDS)} FROM courses WHERE id = ANY(%s)",
+                (ids,)
             )
         else:
             cur.execute(
-                "SELECT c.id, c.title, c.description, c.duration, c.lessons_count, c.category, c.image, "
-                "c.published, c.pass_score, c.level, c.instructor, c.status, c.start_date, c.end_date, c.access_type "
-                "FROM courses c "
-                "INNER JOIN course_assignments ca ON c.id = ca.course_id "
-                "WHERE ca.user_id = %s "
-                "ORDER BY ca.assigned_at DESC",
-                (payload['user_id'],)
+                f"SELECT {select_columns(fields, COURSE_FIELDS, 'c.')} FROM courses c "
+                "WHERE c.id = ANY(%s) AND EXISTS ("
+                "SELECT 1 FROM course_assignments ca WHERE ca.course_id = c.id AND ca.user_id = %s)",
+                (ids, payload['user_id'])
             )
+        courses = order_by_ids(cur.fetchall(), ids)
+        found_ids = {course[0] for course in courses}
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'courses': [format_course_response(course, fields) for course in courses],
+                'missing': [item for item in ids if item not in found_ids]
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and not course_id and payload.get('role') == 'admin':
+        # Каталог меняется только через POST/PUT, поэтому версия заменяет COUNT/MAX по таблице
+        version = get_cache_version(cur, 'courses')
+        etag = make_etag('courses', 'admin', fields, version)
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        # В кэше хранится уже закодированное тело ответа
+        list_key = cache_key('courses', version, 'list', fields)
+        courses_body = cache_get(list_key)
+        if courses_body is None:
+            courses_body = stream_json_body(
+                conn, 'courses',
+                f"SELECT {select_columns(fields, COURSE_FIELDS)} FROM courses ORDER BY created_at DESC",
+                None,
+                lambda course: format_course_response(course, fields)
+            )
+            cache_set(list_key, courses_body)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': etag_headers(etag),
+            'body': courses_body,
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and not course_id:
+        # Дешевая проверка версии до полной выборки
+        cur.execute(
+            "SELECT COUNT(*), MAX(c.updated_at), MAX(ca.assigned_at) FROM courses c "
+            "INNER JOIN course_assignments ca ON c.id = ca.course_id WHERE ca.user_id = %s",
+            (payload['user_id'],)
+        )
+        etag = make_etag('courses', payload.get('role'), payload['user_id'], fields, *cur.fetchone())
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        cur.execute(
+            f"SELECT {select_columns(fields, COURSE_FIELDS, 'c.')} "
+            "FROM courses c "
+            "INNER JOIN course_assignments ca ON c.id = ca.course_id "
+            "WHERE ca.user_id = %s "
+            "ORDER BY ca.assigned_at DESC",
+            (payload['user_id'],)
+        )
         
         courses = cur.fetchall()
-        courses_list = [format_course_response(course) for course in courses]
+        courses_list = [format_course_response(course, fields) for course in courses]
         
         cur.close()
         conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'headers': etag_headers(etag),
             'body': json.dumps({'courses': courses_list}, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
     if method == 'GET' and course_id:
-        cur.execute(
-            "SELECT id, title, description, duration, lessons_count, category, image, published, "
-            "pass_score, level, instructor, status, start_date, end_date, access_type "
-            "FROM courses WHERE id = %s",
+        course, has_access = fetch_with_course_access(
+            cur, payload,
+            f"SELECT id, updated_at, {select_columns(fields, COURSE_FIELDS)} FROM courses WHERE id = %s",
             (course_id,)
         )
-        course = cur.fetchone()
         
         if not course:
             cur.close()
@@ -177,29 +687,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if payload.get('role') != 'admin':
-            cur.execute(
-                "SELECT id FROM course_assignments WHERE course_id = %s AND user_id = %s",
-                (course_id, payload['user_id'])
-            )
-            if not cur.fetchone():
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Доступ к курсу запрещен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-        
-        course_data = format_course_response(course)
+        if not has_access:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ к курсу запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
         cur.close()
         conn.close()
         
+        etag = make_etag('course', course_id, course[1], fields)
+        if is_not_modified(headers, etag):
+            return not_modified_response(etag)
+        
+        course_data = format_course_response(course[2:], fields)
+        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'headers': etag_headers(etag),
             'body': json.dumps({'course': course_data}, ensure_ascii=False),
             'isBase64Encoded': False
         }
@@ -233,6 +742,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
              create_req.instructor, 'draft', create_req.accessType, now, now)
         )
         new_course = cur.fetchone()
+        bump_cache_version(cur, 'courses')
         conn.commit()
         
         course_data = format_course_response(new_course)
@@ -323,6 +833,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(query, update_values)
         updated_course = cur.fetchone()
+        bump_cache_version(cur, 'courses')
         conn.commit()
         
         if not updated_course:
@@ -1,14 +1,77 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import time
+import hashlib
 import psycopg2
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+    'PUT': 4,
+}
+
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+ASSIGNMENT_CACHE_TTL = int(os.environ.get('ASSIGNMENT_CACHE_TTL', '30'))
+_assigned_courses: Dict[str, tuple[float, frozenset]] = {}
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_SHARED_URL = os.environ.get('CACHE_REDIS_URL')
+# Срок жизни в общем кэше только для очистки: устаревшие записи отсекает версия в ключе
+CACHE_SHARED_TTL = int(os.environ.get('CACHE_SHARED_TTL', '86400'))
+_local_cache: 'OrderedDict[str, Any]' = OrderedDict()
+_shared_cache: Any = None
+
+# Поле ответа -> колонка; порядок совпадает с format_lesson_response.
+# materials - вычисляемое поле без колонки
+LESSON_FIELDS: Dict[str, Optional[str]] = {
+    'id': 'id',
+    'courseId': 'course_id',
+    'title': 'title',
+    'content': 'content',
+    'type': 'type',
+    'order': '"order"',
+    'duration': 'duration',
+    'videoUrl': 'video_url',
+    'description': 'description',
+    'requiresPrevious': 'requires_previous',
+    'testId': 'test_id',
+    'isFinalTest': 'is_final_test',
+    'finalTestRequiresAllLessons': 'final_test_requires_all_lessons',
+    'finalTestRequiresAllTests': 'final_test_requires_all_tests',
+    'materials': None,
+}
+
+# Поля оглавления курса, которое возвращает изменение порядка уроков
+OUTLINE_FIELDS = ['id', 'title', 'type', 'order', 'duration', 'requiresPrevious', 'isFinalTest']
 
 class CreateLessonRequest(BaseModel):
     courseId: str = Field(..., min_length=1)
@@ -39,6 +102,10 @@ class UpdateLessonRequest(BaseModel):
     finalTestRequiresAllLessons: Optional[bool] = None
     finalTestRequiresAllTests: Optional[bool] = None
 
+class ReorderLessonsRequest(BaseModel):
+    # Полный список уроков курса в новом порядке
+    lessonIds: List[str] = Field(..., min_length=1)
+
 class LessonMaterialRequest(BaseModel):
     title: str = Field(..., min_length=1)
     type: str = Field(..., pattern='^(pdf|doc|link|video)$')
@@ -48,12 +115,92 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -76,7 +223,109 @@ def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     
     return None
 
-def format_lesson_response(lesson_row: tuple, materials: list = None) -> Dict[str, Any]:
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, Optional[str]]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?fields=a,b,c по белому списку маршрута. None - вернуть все поля
+    '''
+    raw_fields = query_params.get('fields')
+    if not raw_fields:
+        return None, None
+    
+    fields = list(dict.fromkeys(field.strip() for field in raw_fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return None, f"Недопустимые поля: {', '.join(unknown)}"
+    
+    # id всегда первая колонка: по row[0] строки сопоставляются с ids и связанными данными
+    return ['id'] + [field for field in fields if field != 'id'], None
+
+def select_columns(fields: Optional[List[str]], allowed: Dict[str, Optional[str]], prefix: str = '') -> str:
+    return ', '.join(prefix + allowed[field] for field in (fields or allowed) if allowed[field])
+
+def format_fields(row: tuple, fields: List[str], allowed: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    columns = [field for field in fields if allowed[field]]
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in zip(columns, row)
+    }
+
+def parse_ids(query_params: Dict[str, Any]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?ids=a,b,c для выборки нескольких записей одним запросом. None - параметр не передан
+    '''
+    raw_ids = query_params.get('ids')
+    if raw_ids is None:
+        return None, None
+    ids = list(dict.fromkeys(item.strip() for item in raw_ids.split(',') if item.strip()))
+    if not ids or len(ids) > MULTI_GET_MAX_IDS:
+        return None, f'Параметр ids должен содержать от 1 до {MULTI_GET_MAX_IDS} идентификаторов'
+    return ids, None
+
+def order_by_ids(rows: List[tuple], ids: List[str]) -> List[tuple]:
+    # Строки возвращаются в порядке ids из запроса; первая колонка - id (parse_fields ставит его первым)
+    rows_by_id = {row[0]: row for row in rows}
+    return [rows_by_id[item] for item in ids if item in rows_by_id]
+
+def cache_assigned_courses(user_id: str, course_ids: Optional[List[str]]) -> frozenset:
+    assigned = frozenset(course_ids or [])
+    _assigned_courses[user_id] = (time.monotonic(), assigned)
+    return assigned
+
+def get_cached_assigned_courses(user_id: str) -> Optional[frozenset]:
+    entry = _assigned_courses.get(user_id)
+    if entry and time.monotonic() - entry[0] < ASSIGNMENT_CACHE_TTL:
+        return entry[1]
+    return None
+
+def has_course_access(cur, payload: Dict[str, Any], course_id: str) -> bool:
+    if payload.get('role') == 'admin':
+        return True
+    # Доверяем только положительному ответу кэша: новое назначение видно сразу, снятое - через TTL
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None and course_id in assigned:
+        return True
+    cur.execute(
+        "SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s)",
+        (payload['user_id'],)
+    )
+    return course_id in cache_assigned_courses(payload['user_id'], cur.fetchone()[0])
+
+def fetch_with_course_access(cur, payload: Dict[str, Any], query: str, params: tuple) -> tuple[Optional[tuple], bool]:
+    '''
+    Выбирает одну запись (первая колонка - course_id) вместе с проверкой назначения курса.
+    Без свежего кэша назначения загружаются в том же запросе
+    '''
+    if payload.get('role') == 'admin':
+        cur.execute(query, params)
+        return cur.fetchone(), True
+    
+    assigned = get_cached_assigned_courses(payload['user_id'])
+    if assigned is not None:
+        cur.execute(query, params)
+        row = cur.fetchone()
+        if row is None or row[0] in assigned:
+            return row, row is not None
+    
+    cur.execute(
+        f"WITH entity AS ({query}) "
+        "SELECT entity.*, assigned.course_ids "
+        "FROM (SELECT ARRAY(SELECT course_id FROM course_assignments WHERE user_id = %s) AS course_ids) assigned "
+        "LEFT JOIN entity ON TRUE",
+        (*params, payload['user_id'])
+    )
+    row = cur.fetchone()
+    assigned = cache_assigned_courses(payload['user_id'], row[-1])
+    if row[0] is None:
+        return None, False
+    return row[:-1], row[0] in assigned
+
+def format_lesson_response(lesson_row: tuple, materials: list = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        lesson_data = format_fields(lesson_row, fields, LESSON_FIELDS)
+        if materials is not None and 'materials' in fields:
+            lesson_data['materials'] = materials
+        return lesson_data
+    
     lesson_data = {
         'id': lesson_row[0],
         'courseId': lesson_row[1],
@@ -99,13 +348,238 @@ def format_lesson_response(lesson_row: tuple, materials: list = None) -> Dict[st
     
     return lesson_data
 
+def get_unlock_fingerprint(cur, user_id: str, course_id: str) -> tuple:
+    # Удаление прогресса при снятии назначения тоже меняет отпечаток: updated_at становится NULL
+    cur.execute(
+        "SELECT (SELECT updated_at FROM course_progress WHERE user_id = %s AND course_id = %s), "
+        "(SELECT MAX(updated_at) FROM test_attempts WHERE user_id = %s AND course_id = %s)",
+        (user_id, course_id, user_id, course_id)
+    )
+    return cur.fetchone()
+
+def compute_unlock_state(cur, user_id: str, course_id: str) -> List[Dict[str, Any]]:
+    '''
+    Доступность уроков курса для пользователя одним запросом: отметки о прохождении,
+    сданные тесты курса и условия requires_previous / итогового теста.
+    Урок считается пройденным, если он отмечен завершенным или сдан привязанный к нему тест;
+    пройденный урок не блокируется, даже если условия изменились позже
+    '''
+    cur.execute(
+        "SELECT l.id, l.requires_previous, l.is_final_test, l.final_test_requires_all_lessons, "
+        "l.final_test_requires_all_tests, l.test_id, "
+        "COALESCE(p.completed_lesson_ids ? l.id, FALSE), course_tests.ids, passed.ids "
+        "FROM lessons l "
+        "LEFT JOIN course_progress p ON p.user_id = %s AND p.course_id = l.course_id "
+        "CROSS JOIN (SELECT ARRAY(SELECT id FROM tests WHERE course_id = %s AND status = 'published' "
+        "ORDER BY id) AS ids) course_tests "
+        "CROSS JOIN (SELECT ARRAY(SELECT a.test_id FROM test_attempts a JOIN tests t ON t.id = a.test_id "
+        "WHERE a.user_id = %s AND a.passed AND t.course_id = %s) AS ids) passed "
+        "WHERE l.course_id = %s ORDER BY l.\"order\", l.id",
+        (user_id, course_id, user_id, course_id, course_id)
+    )
+    lessons = cur.fetchall()
+    if not lessons:
+        return []
+    
+    passed_tests = set(lessons[0][8])
+    done = {
+        lesson[0]: lesson[6] or (lesson[5] is not None and lesson[5] in passed_tests)
+        for lesson in lessons
+    }
+    
+    states = []
+    for index, (lesson_id, requires_previous, is_final_test, requires_all_lessons,
+                requires_all_tests, test_id, _, course_tests, _) in enumerate(lessons):
+        state: Dict[str, Any] = {'lessonId': lesson_id, 'completed': done[lesson_id], 'locked': False, 'reason': None}
+        if not done[lesson_id]:
+            remaining_lessons = [
+                other[0] for other in lessons if requires_all_lessons and not other[2] and not done[other[0]]
+            ]
+            remaining_tests = [
+                other_test for other_test in course_tests
+                if requires_all_tests and other_test != test_id and other_test not in passed_tests
+            ]
+            if requires_previous and index > 0 and not done[lessons[index - 1][0]]:
+                state.update(locked=True, reason='previous_lesson', requiredLessonId=lessons[index - 1][0])
+            elif is_final_test and remaining_lessons:
+                state.update(locked=True, reason='lessons_incomplete', remainingLessons=remaining_lessons)
+            elif is_final_test and remaining_tests:
+                state.update(locked=True, reason='tests_not_passed', remainingTests=remaining_tests)
+        states.append(state)
+    return states
+
+def make_etag(*parts: Any) -> str:
+    raw = '|'.join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32] + '"'
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json; charset=utf-8',
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+def is_not_modified(headers: Dict[str, Any], etag: str) -> bool:
+    return (headers.get('If-None-Match') or headers.get('if-none-match')) == etag
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    response_headers = etag_headers(etag)
+    del response_headers['Content-Type']
+    return {
+        'statusCode': 304,
+        'headers': response_headers,
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def get_shared_cache() -> Any:
+    '''
+    Общий кэш между инстансами (Redis-совместимый клиент с get/set).
+    Можно подменить через set_shared_cache, без CACHE_REDIS_URL работает только память инстанса
+    '''
+    global _shared_cache
+    if _shared_cache is None and CACHE_SHARED_URL and redis is not None:
+        _shared_cache = redis.Redis.from_url(CACHE_SHARED_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _shared_cache
+
+def set_shared_cache(client: Any) -> None:
+    global _shared_cache
+    _shared_cache = client
+
+def get_cache_version(cur, scope: str) -> int:
+    cur.execute("SELECT version FROM cache_versions WHERE scope = %s", (scope,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_cache_version(cur, *scopes: str) -> None:
+    # Вызывается в транзакции записи: новая версия видна читателям вместе с изменениями
+    for scope in scopes:
+        cur.execute(
+            "INSERT INTO cache_versions (scope, version, updated_at) VALUES (%s, 1, %s) "
+            "ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1, updated_at = EXCLUDED.updated_at",
+            (scope, datetime.utcnow())
+        )
+
+def get_cache_versions(cur, *scopes: str) -> List[int]:
+    cur.execute("SELECT scope, version FROM cache_versions WHERE scope = ANY(%s)", (list(scopes),))
+    versions = dict(cur.fetchall())
+    return [versions.get(scope, 0) for scope in scopes]
+
+def cache_key(scope: str, version: int, *parts: Any) -> str:
+    digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f"{scope}:{version}:{digest}"
+
+def cache_get(key: str) -> Any:
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key]
+    
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    try:
+        raw_value = shared.get(key)
+    except Exception:
+        # Недоступный общий кэш не должен ломать чтение
+        return None
+    if raw_value is None:
+        return None
+    value = json.loads(raw_value)
+    cache_store_local(key, value)
+    return value
+
+def cache_store_local(key: str, value: Any) -> None:
+    _local_cache[key] = value
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > CACHE_MAX_ENTRIES:
+        _local_cache.popitem(last=False)
+
+def cache_set(key: str, value: Any) -> None:
+    cache_store_local(key, value)
+    shared = get_shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.set(key, json.dumps(value, ensure_ascii=False), ex=CACHE_SHARED_TTL)
+    except Exception:
+        pass
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление уроками
     GET ?courseId=x - все уроки курса
     GET ?id=x - один урок
+    GET ?ids=a,b,c - несколько уроков одним запросом (студенту только из назначенных курсов)
+    GET ?fields=id,title,order,... - только указанные поля (materials - по запросу)
+    GET ?courseId=x&action=unlock&userId=y - доступность уроков курса для пользователя (userId - только админ)
     POST - создать урок (только админ)
     PUT ?id=x - обновить урок (только админ)
+    PUT ?courseId=x&action=reorder - новый порядок всех уроков курса одним запросом (только админ)
     POST ?lessonId=x&action=material - добавить материал (админ)
     '''
     method: str = event.get('httpMethod', 'GET')
@@ -116,7 +590,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -139,62 +613,177 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
     cur = conn.cursor()
     
-    if method == 'GET' and course_id:
-        if payload.get('role') != 'admin':
+    fields, fields_error = parse_fields(query_params, LESSON_FIELDS) if method == 'GET' else (None, None)
+    if fields_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    ids, ids_error = parse_ids(query_params) if method == 'GET' else (None, None)
+    if ids_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': ids_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    with_materials = fields is None or 'materials' in fields
+    
+    if method == 'GET' and ids:
+        # Недоступные и несуществующие уроки попадают в missing
+        if payload.get('role') == 'admin':
             cur.execute(
-                "SELECT id FROM course_assignments WHERE course_id = %s AND user_id = %s",
-                (course_id, payload['user_id'])
+                f"SELECT {select_columns(fields, LESSON_FIELDS)} FROM lessons WHERE id = ANY(%s)",
+                (ids,)
             )
-            if not cur.fetchone():
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Доступ к курсу запрещен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-        
-        cur.execute(
-            "SELECT id, course_id, title, content, type, \"order\", duration, video_url, "
-            "description, requires_previous, test_id, is_final_test, "
-            "final_test_requires_all_lessons, final_test_requires_all_tests "
-            "FROM lessons WHERE course_id = %s ORDER BY \"order\"",
-            (course_id,)
-        )
-        lessons = cur.fetchall()
+        else:
+            cur.execute(
+                f"SELECT {select_columns(fields, LESSON_FIELDS, 'l.')} FROM lessons l "
+                "WHERE l.id = ANY(%s) AND EXISTS ("
+                "SELECT 1 FROM course_assignments ca WHERE ca.course_id = l.course_id AND ca.user_id = %s)",
+                (ids, payload['user_id'])
+            )
+        lessons = order_by_ids(cur.fetchall(), ids)
+        found_ids = {lesson[0] for lesson in lessons}
         
-        lessons_list = []
-        for lesson in lessons:
+        materials_by_lesson: Dict[str, list] = {lesson_id: [] for lesson_id in found_ids}
+        if with_materials and lessons:
             cur.execute(
-                "SELECT id, title, type, url FROM lesson_materials WHERE lesson_id = %s",
-                (lesson[0],)
+                "SELECT lesson_id, id, title, type, url FROM lesson_materials WHERE lesson_id = ANY(%s)",
+                (list(materials_by_lesson),)
             )
-            materials_rows = cur.fetchall()
-            materials = [{'id': m[0], 'title': m[1], 'type': m[2], 'url': m[3]} for m in materials_rows]
-            lessons_list.append(format_lesson_response(lesson, materials))
+            for m in cur.fetchall():
+                materials_by_lesson[m[0]].append({'id': m[1], 'title': m[2], 'type': m[3], 'url': m[4]})
         
         cur.close()
         conn.close()
         
+        lessons_list = [
+            format_lesson_response(lesson, materials_by_lesson[lesson[0]] if with_materials else None, fields)
+            for lesson in lessons
+        ]
+        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'lessons': lessons_list,
+                'missing': [item for item in ids if item not in found_ids]
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and course_id and action == 'unlock':
+        target_user_id = query_params.get('userId') or payload['user_id']
+        if target_user_id != payload['user_id'] and payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if not has_course_access(cur, payload, course_id):
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ к курсу запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Прохождение уроков и тестов пользователя меняет updated_at его прогресса и попыток по курсу,
+        # версии lessons и tests - условия и состав курса. Отдельных версий на пару пользователь-курс нет
+        lessons_version, tests_version = get_cache_versions(cur, 'lessons', 'tests')
+        unlock_key = cache_key('lessons', lessons_version, 'unlock', target_user_id, course_id,
+                               tests_version, *get_unlock_fingerprint(cur, target_user_id, course_id))
+        states = cache_get(unlock_key)
+        if states is None:
+            states = compute_unlock_state(cur, target_user_id, course_id)
+            cache_set(unlock_key, states)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'courseId': course_id, 'userId': target_user_id, 'lessons': states}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and course_id:
+        if not has_course_access(cur, payload, course_id):
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ к курсу запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Уроки и материалы меняются только через POST/PUT, версия заменяет COUNT/MAX по таблицам
+        version = get_cache_version(cur, 'lessons')
+        etag = make_etag('lessons', course_id, fields, version)
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        list_key = cache_key('lessons', version, course_id, fields)
+        lessons_list = cache_get(list_key)
+        if lessons_list is None:
+            cur.execute(
+                f"SELECT {select_columns(fields, LESSON_FIELDS)} "
+                "FROM lessons WHERE course_id = %s ORDER BY \"order\"",
+                (course_id,)
+            )
+            lessons = cur.fetchall()
+            
+            lessons_list = []
+            for lesson in lessons:
+                materials = None
+                if with_materials:
+                    cur.execute(
+                        "SELECT id, title, type, url FROM lesson_materials WHERE lesson_id = %s",
+                        (lesson[0],)
+                    )
+                    materials_rows = cur.fetchall()
+                    materials = [{'id': m[0], 'title': m[1], 'type': m[2], 'url': m[3]} for m in materials_rows]
+                lessons_list.append(format_lesson_response(lesson, materials, fields))
+            cache_set(list_key, lessons_list)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': etag_headers(etag),
             'body': json.dumps({'lessons': lessons_list}, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
     if method == 'GET' and lesson_id:
-        cur.execute(
-            "SELECT id, course_id, title, content, type, \"order\", duration, video_url, "
-            "description, requires_previous, test_id, is_final_test, "
-            "final_test_requires_all_lessons, final_test_requires_all_tests "
+        lesson, has_access = fetch_with_course_access(
+            cur, payload,
+            f"SELECT course_id, updated_at, {select_columns(fields, LESSON_FIELDS)} "
             "FROM lessons WHERE id = %s",
             (lesson_id,)
         )
-        lesson = cur.fetchone()
         
         if not lesson:
             cur.close()
@@ -206,36 +795,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if payload.get('role') != 'admin':
-            cur.execute(
-                "SELECT id FROM course_assignments WHERE course_id = %s AND user_id = %s",
-                (lesson[1], payload['user_id'])
-            )
-            if not cur.fetchone():
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Доступ к уроку запрещен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+        if not has_access:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ к уроку запрещен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
         cur.execute(
-            "SELECT id, title, type, url FROM lesson_materials WHERE lesson_id = %s",
+            "SELECT COUNT(*), MAX(created_at) FROM lesson_materials WHERE lesson_id = %s",
             (lesson_id,)
         )
-        materials_rows = cur.fetchall()
-        materials = [{'id': m[0], 'title': m[1], 'type': m[2], 'url': m[3]} for m in materials_rows]
+        etag = make_etag('lesson', lesson_id, lesson[1], fields, *cur.fetchone())
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        materials = None
+        if with_materials:
+            cur.execute(
+                "SELECT id, title, type, url FROM lesson_materials WHERE lesson_id = %s",
+                (lesson_id,)
+            )
+            materials_rows = cur.fetchall()
+            materials = [{'id': m[0], 'title': m[1], 'type': m[2], 'url': m[3]} for m in materials_rows]
         
-        lesson_data = format_lesson_response(lesson, materials)
+        lesson_data = format_lesson_response(lesson[2:], materials, fields)
         
         cur.close()
         conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'headers': etag_headers(etag),
             'body': json.dumps({'lesson': lesson_data}, ensure_ascii=False),
             'isBase64Encoded': False
         }
@@ -275,6 +871,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             (new_material_id, lesson_id_param, material_req.title, material_req.type, material_req.url, now)
         )
         new_material = cur.fetchone()
+        bump_cache_version(cur, 'lessons')
         conn.commit()
         
         material_data = {'id': new_material[0], 'title': new_material[1], 'type': new_material[2], 'url': new_material[3]}
@@ -325,6 +922,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "UPDATE courses SET lessons_count = lessons_count + 1, updated_at = %s WHERE id = %s",
             (now, create_req.courseId)
         )
+        bump_cache_version(cur, 'lessons', 'courses')
         conn.commit()
         
         lesson_data = format_lesson_response(new_lesson, [])
@@ -339,6 +937,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'PUT' and course_id and action == 'reorder':
+        admin_error = require_admin(headers)
+        if admin_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': admin_error['statusCode'],
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        body_data = json.loads(event.get('body', '{}'))
+        reorder_req = ReorderLessonsRequest(**body_data)
+        
+        # Блокировка уроков курса: параллельное изменение порядка или добавление урока
+        # не смешается с проверенным составом
+        cur.execute(
+            f"SELECT {select_columns(OUTLINE_FIELDS, LESSON_FIELDS)} FROM lessons "
+            "WHERE course_id = %s ORDER BY id FOR UPDATE",
+            (course_id,)
+        )
+        lessons_by_id = {lesson[0]: lesson for lesson in cur.fetchall()}
+        
+        requested_ids = set(reorder_req.lessonIds)
+        unknown_ids = [item for item in reorder_req.lessonIds if item not in lessons_by_id]
+        missing_ids = [item for item in lessons_by_id if item not in requested_ids]
+        if unknown_ids or missing_ids or len(requested_ids) != len(reorder_req.lessonIds):
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'error': 'Список должен содержать каждый урок курса ровно один раз',
+                    'unknown': unknown_ids,
+                    'missing': missing_ids
+                }, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        order_index = OUTLINE_FIELDS.index('order')
+        changed = [
+            (item, position) for position, item in enumerate(reorder_req.lessonIds)
+            if lessons_by_id[item][order_index] != position
+        ]
+        if changed:
+            cur.execute(
+                "UPDATE lessons l SET \"order\" = v.position, updated_at = %s "
+                "FROM unnest(%s::varchar[], %s::integer[]) AS v(id, position) "
+                "WHERE l.id = v.id AND l.course_id = %s",
+                (datetime.utcnow(), [item for item, _ in changed], [position for _, position in changed], course_id)
+            )
+            bump_cache_version(cur, 'lessons')
+        conn.commit()
+        
+        cur.close()
+        conn.close()
+        
+        outline = []
+        for position, item in enumerate(reorder_req.lessonIds):
+            lesson_data = format_fields(lessons_by_id[item], OUTLINE_FIELDS, LESSON_FIELDS)
+            lesson_data['order'] = position
+            outline.append(lesson_data)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'lessons': outline, 'updated': len(changed)}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'PUT' and lesson_id:
         admin_error = require_admin(headers)
         if admin_error:
@@ -412,6 +1083,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(query, update_values)
         updated_lesson = cur.fetchone()
+        bump_cache_version(cur, 'lessons')
         conn.commit()
         
         if not updated_lesson:
@@ -1,34 +1,285 @@
 import json
 import os
+import re
+import gzip
+import base64
+import csv
+import functools
+import hashlib
+import io
+import random
+import time
 import psycopg2
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional
+import zipfile
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Iterator
+from xml.sax.saxutils import escape
 from pydantic import BaseModel, Field
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+# Пересчет витрин аналитики после записи (та же логика, что в backend/analytics): небольшая
+# пачка курсов из журнала, не чаще раза в ANALYTICS_REFRESH_INTERVAL секунд на экземпляр
+ANALYTICS_REFRESH_BATCH = int(os.environ.get('ANALYTICS_WRITE_REFRESH_BATCH', '5'))
+ANALYTICS_REFRESH_INTERVAL = float(os.environ.get('ANALYTICS_REFRESH_INTERVAL', '30'))
+_analytics_refresh_state: Dict[str, float] = {'refreshed_at': float('-inf')}
+
+# Одна строка на назначение; статусы считаются по назначению и прогрессу
+ROLLUP_SOURCE_SQL = (
+    "SELECT ca.course_id, COALESCE(u.department, '') AS department, "
+    "(COALESCE(cp.completed, FALSE) OR ca.status = 'completed') AS is_completed, "
+    "(COALESCE(cp.completed_lessons, 0) > 0 OR ca.status = 'in_progress') AS is_started, "
+    "(ca.status = 'overdue' OR ca.due_date < %(now)s) AS is_late, "
+    "ca.due_date, cp.test_score, "
+    "EXTRACT(EPOCH FROM cp.completed_at - cp.started_at) / 3600 AS hours_to_complete "
+    "FROM course_assignments ca "
+    "JOIN users u ON u.id = ca.user_id "
+    "LEFT JOIN course_progress cp ON cp.user_id = ca.user_id AND cp.course_id = ca.course_id "
+    "WHERE ca.course_id = ANY(%(course_ids)s)"
+)
+ROLLUP_AGGREGATES = (
+    "COUNT(r.course_id), "
+    "COUNT(*) FILTER (WHERE r.is_started AND NOT r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_completed), "
+    "COUNT(*) FILTER (WHERE r.is_late AND NOT r.is_completed), "
+    "ROUND(AVG(r.test_score), 2), "
+    "ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY r.hours_to_complete) "
+    "FILTER (WHERE r.is_completed AND r.hours_to_complete IS NOT NULL)::numeric, 2)"
+)
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+}
+
+# Запас на сетевую задержку: отправка в течение этого времени после срока еще принимается
+EXAM_SUBMIT_GRACE = int(os.environ.get('EXAM_SUBMIT_GRACE', '30'))
+EXAM_SWEEP_BATCH = int(os.environ.get('EXAM_SWEEP_BATCH', '500'))
+# Без планировщика просроченные сессии закрывают старты и отправки тестов: одна пачка
+# не чаще раза в EXAM_SWEEP_INTERVAL секунд на экземпляр функции
+EXAM_SWEEP_INTERVAL = float(os.environ.get('EXAM_SWEEP_INTERVAL', '60'))
+_exam_sweep_state: Dict[str, float] = {'swept_at': float('-inf')}
+# Скомпилированные тесты для выдачи вариантов и проверки, по версии кэша tests
+COMPILED_TESTS_MAX = int(os.environ.get('COMPILED_TESTS_MAX', '64'))
+_compiled_tests: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+OPTION_QUESTION_TYPES = ('single', 'multiple')
+# Черновик попытки пишется в БД не чаще раза за этот интервал
+AUTOSAVE_INTERVAL = int(os.environ.get('AUTOSAVE_INTERVAL', '5'))
+# Очередь проверки (tests.queued_grading): размер пачки и время работы одного вызова обработчика
+GRADING_BATCH = int(os.environ.get('GRADING_BATCH', '200'))
+GRADING_WORKER_SECONDS = float(os.environ.get('GRADING_WORKER_SECONDS', '20'))
+# Без планировщика очередь разбирают сами отправки и опросы результата: одна пачка
+# не чаще раза в GRADING_DRAIN_INTERVAL секунд на экземпляр функции
+GRADING_DRAIN_INTERVAL = float(os.environ.get('GRADING_DRAIN_INTERVAL', '5'))
+_grading_drain_state: Dict[str, float] = {'drained_at': float('-inf')}
+# Ручная проверка текстовых ответов: размер выдаваемой пачки и срок аренды
+REVIEW_BATCH = int(os.environ.get('REVIEW_BATCH', '20'))
+REVIEW_LEASE_SECONDS = int(os.environ.get('REVIEW_LEASE_SECONDS', '900'))
+# Поиск похожих текстовых ответов: MinHash по символьным шинглам и LSH из SIMILARITY_BANDS полос
+# по SIMILARITY_PERMUTATIONS / SIMILARITY_BANDS значений (16 x 8 - порог сходства около 0.7)
+SIMILARITY_PERMUTATIONS = 128
+SIMILARITY_BANDS = 16
+SIMILARITY_SHINGLE = 5
+# Короткие ответы совпадают и без списывания, их не сравниваем
+SIMILARITY_MIN_CHARS = int(os.environ.get('SIMILARITY_MIN_CHARS', '60'))
+SIMILARITY_BATCH = int(os.environ.get('SIMILARITY_BATCH', '1000'))
+SIMILARITY_WORKER_SECONDS = float(os.environ.get('SIMILARITY_WORKER_SECONDS', '20'))
+_MINHASH_MASK = np.uint64(0xffffffff)
+_MINHASH_SHIFT = np.uint64(32)
+# Параметры хэшей фиксированы: сигнатуры разных инстансов и разных запусков должны совпадать.
+# Хэш (a * x + b) >> 32 с нечетным a по модулю 2^64 - без дорогого деления по модулю простого
+_minhash_params = np.random.RandomState(1_000_003)
+_MINHASH_A = (_minhash_params.randint(0, np.iinfo(np.int64).max, SIMILARITY_PERMUTATIONS, dtype=np.int64)
+              .astype(np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+_MINHASH_B = _minhash_params.randint(0, np.iinfo(np.int64).max, SIMILARITY_PERMUTATIONS,
+                                     dtype=np.int64).astype(np.uint64)[:, None]
+_SHINGLE_POWERS = np.array([pow(1_000_003, power, 1 << 64) for power in range(SIMILARITY_SHINGLE)], dtype=np.uint64)
+
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '5000'))
+# Лимит строк листа Excel вместе со строкой заголовка
+XLSX_MAX_ROWS = 1048576
+# Управляющие символы, недопустимые в XML
+XLSX_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+EXPORT_HEADER = [
+    'Сотрудник', 'Email', 'Отдел', 'Курс', 'Статус назначения', 'Назначен', 'Срок',
+    'Пройдено уроков', 'Всего уроков', 'Лучший результат теста', 'Завершен'
+]
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Прогресс" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
 
 class CompleteLessonRequest(BaseModel):
     courseId: str = Field(..., min_length=1)
     lessonId: str = Field(..., min_length=1)
 
+class StartTestRequest(BaseModel):
+    courseId: str = Field(..., min_length=1)
+    testId: str = Field(..., min_length=1)
+
 class SubmitTestRequest(BaseModel):
     courseId: str = Field(..., min_length=1)
     testId: str = Field(..., min_length=1)
+    sessionId: str = Field(..., min_length=1)
+    # Ответы поверх сохраненного черновика; без них оценивается черновик
+    answers: Optional[Dict[str, Any]] = None
+
+class AutosaveRequest(BaseModel):
+    sessionId: str = Field(..., min_length=1)
+    # Номер сохранения на клиенте: запоздавший запрос с меньшим номером не перезапишет новые ответы
+    seq: int = Field(..., ge=1)
     answers: Dict[str, Any]
 
+class ClaimReviewsRequest(BaseModel):
+    limit: int = Field(REVIEW_BATCH, ge=1, le=100)
+    testId: Optional[str] = None
+
+class ReviewScore(BaseModel):
+    reviewId: str = Field(..., min_length=1)
+    points: int = Field(..., ge=0)
+
+class SubmitReviewsRequest(BaseModel):
+    reviews: List[ReviewScore] = Field(..., min_length=1, max_length=100)
+
 def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -54,13 +305,820 @@ def format_progress_response(progress_row: tuple) -> Dict[str, Any]:
         'startedAt': progress_row[8].isoformat() if progress_row[8] else None,
     }
 
+def parse_export_date(value: Optional[str]) -> tuple[Optional[datetime], bool]:
+    if not value:
+        return None, True
+    try:
+        return datetime.fromisoformat(value), True
+    except ValueError:
+        return None, False
+
+def build_export_query(query_params: Dict[str, Any]) -> tuple[Optional[str], List[Any], Optional[str]]:
+    '''
+    Отчет по назначениям: фильтры courseId, department и период назначения from/to (ISO-даты)
+    '''
+    conditions = []
+    values: List[Any] = []
+    
+    if query_params.get('courseId'):
+        conditions.append("ca.course_id = %s")
+        values.append(query_params['courseId'])
+    if query_params.get('department'):
+        conditions.append("u.department = %s")
+        values.append(query_params['department'])
+    
+    date_from, valid_from = parse_export_date(query_params.get('from'))
+    date_to, valid_to = parse_export_date(query_params.get('to'))
+    if not valid_from or not valid_to:
+        return None, [], 'Некорректный период: ожидается дата в формате ГГГГ-ММ-ДД'
+    if date_from:
+        conditions.append("ca.assigned_at >= %s")
+        values.append(date_from)
+    if date_to:
+        # Дата без времени включает весь день
+        if len(query_params['to']) <= 10:
+            date_to += timedelta(days=1)
+            conditions.append("ca.assigned_at < %s")
+        else:
+            conditions.append("ca.assigned_at <= %s")
+        values.append(date_to)
+    
+    where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = (
+        "SELECT u.name, u.email, u.department, c.title, ca.status, ca.assigned_at, ca.due_date, "
+        "COALESCE(cp.completed_lessons, 0), COALESCE(cp.total_lessons, c.lessons_count), best.score, cp.completed_at "
+        "FROM course_assignments ca "
+        "JOIN users u ON u.id = ca.user_id "
+        "JOIN courses c ON c.id = ca.course_id "
+        "LEFT JOIN course_progress cp ON cp.user_id = ca.user_id AND cp.course_id = ca.course_id "
+        "LEFT JOIN LATERAL (SELECT MAX(tr.score) AS score FROM test_results tr "
+        "WHERE tr.user_id = ca.user_id AND tr.course_id = ca.course_id) best ON TRUE"
+        f"{where_sql} ORDER BY u.department NULLS LAST, u.name, c.title"
+    )
+    return query, values, None
+
+def iter_export_rows(conn, query: str, values: List[Any]) -> Iterator[list]:
+    # Именованный курсор держит строки на сервере, клиент получает по EXPORT_ITERSIZE
+    with conn.cursor(name=f"export_{uuid.uuid4().hex}") as export_cur:
+        export_cur.itersize = EXPORT_ITERSIZE
+        export_cur.execute(query, values)
+        for row in export_cur:
+            yield [value.isoformat(sep=' ', timespec='seconds') if isinstance(value, datetime) else value for value in row]
+
+def write_export_csv(rows: Iterator[list]) -> bytes:
+    '''
+    CSV сразу пишется в gzip-поток: в памяти только сжатый результат.
+    BOM нужен, чтобы Excel распознал UTF-8
+    '''
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=6, mtime=0) as gz:
+        with io.TextIOWrapper(gz, encoding='utf-8-sig', newline='') as text:
+            writer = csv.writer(text, delimiter=';')
+            writer.writerow(EXPORT_HEADER)
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+    return buffer.getvalue()
+
+def xlsx_cell(value: Any) -> str:
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(XLSX_ILLEGAL_CHARS.sub("", str(value)))}</t></is></c>'
+
+def write_export_xlsx(rows: Iterator[list]) -> tuple[bytes, bool]:
+    '''
+    Минимальная книга XLSX без внешних зависимостей: лист пишется построчно
+    в сжатый поток zip. Возвращает (файл, обрезан ли отчет по лимиту строк Excel)
+    '''
+    buffer = io.BytesIO()
+    truncated = False
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_STATIC_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(xlsx_cell(value) for value in EXPORT_HEADER) + '</row>').encode('utf-8'))
+            written = 1
+            for row in rows:
+                if written >= XLSX_MAX_ROWS:
+                    truncated = True
+                    break
+                sheet.write(('<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>').encode('utf-8'))
+                written += 1
+            sheet.write(b'</sheetData></worksheet>')
+    return buffer.getvalue(), truncated
+
+def mark_analytics_changed(cur, course_id: str) -> None:
+    # Курс попадает в журнал пересчета витрин аналитики (backend/analytics). Журнал только
+    # дописывается: пересчет удаляет лишь видимые ему строки, и запись незавершенной транзакции
+    # останется до следующего пересчета
+    cur.execute(
+        "INSERT INTO analytics_changes (course_id, changed_at) VALUES (%s, %s)",
+        (course_id, datetime.utcnow())
+    )
+
+def refresh_rollups(conn, limit: int) -> int:
+    '''
+    Пересчитывает витрины для курсов из журнала analytics_changes и курсов, у которых
+    наступил срок незавершенного назначения. Строки журнала забираются с SKIP LOCKED,
+    поэтому параллельные вызовы берут разные строки и не ждут друг друга. Удаляются только
+    записи, видимые снимку пересчета: запись транзакции, изменения которой в снимок
+    не попали, остается в журнале. Возвращает число курсов
+    '''
+    now = datetime.utcnow()
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM analytics_changes WHERE id IN ("
+        "SELECT id FROM analytics_changes ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+        ") RETURNING course_id",
+        (limit,)
+    )
+    course_ids = {row[0] for row in cur.fetchall()}
+    cur.execute(
+        "SELECT course_id FROM course_stats WHERE next_due_at <= %s LIMIT %s",
+        (now, limit)
+    )
+    course_ids = sorted(course_ids | {row[0] for row in cur.fetchall()})
+    
+    if not course_ids:
+        conn.commit()
+        cur.close()
+        return 0
+    
+    # Строки одного курса могут достаться разным вызовам: пересчет курса сериализуется
+    # блокировкой на время транзакции, взятой в порядке id против взаимоблокировок
+    cur.execute(
+        "SELECT pg_advisory_xact_lock(hashtext('analytics:' || course_id)) FROM unnest(%s::varchar[]) AS course_id",
+        (course_ids,)
+    )
+    
+    params = {'now': now, 'course_ids': course_ids}
+    cur.execute("DELETE FROM course_department_stats WHERE course_id = ANY(%(course_ids)s)", params)
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_department_stats (course_id, department, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, refreshed_at) "
+        f"SELECT r.course_id, r.department, {ROLLUP_AGGREGATES}, %(now)s FROM r GROUP BY r.course_id, r.department",
+        params
+    )
+    cur.execute(
+        f"WITH r AS ({ROLLUP_SOURCE_SQL}) "
+        "INSERT INTO course_stats (course_id, assigned, in_progress, completed, overdue, "
+        "avg_test_score, median_hours_to_complete, next_due_at, refreshed_at) "
+        f"SELECT c.id, {ROLLUP_AGGREGATES}, "
+        "MIN(r.due_date) FILTER (WHERE NOT r.is_completed AND NOT r.is_late), %(now)s "
+        "FROM courses c LEFT JOIN r ON r.course_id = c.id "
+        "WHERE c.id = ANY(%(course_ids)s) GROUP BY c.id "
+        "ON CONFLICT (course_id) DO UPDATE SET assigned = EXCLUDED.assigned, in_progress = EXCLUDED.in_progress, "
+        "completed = EXCLUDED.completed, overdue = EXCLUDED.overdue, avg_test_score = EXCLUDED.avg_test_score, "
+        "median_hours_to_complete = EXCLUDED.median_hours_to_complete, next_due_at = EXCLUDED.next_due_at, "
+        "refreshed_at = EXCLUDED.refreshed_at",
+        params
+    )
+    conn.commit()
+    cur.close()
+    return len(course_ids)
+
+def refresh_rollups_if_due(conn) -> None:
+    # Вызывается после commit записи. Сбой пересчета не влияет на ответ: строки журнала
+    # вернутся при откате и достанутся следующему вызову
+    now = time.monotonic()
+    if ANALYTICS_REFRESH_BATCH <= 0 or now - _analytics_refresh_state['refreshed_at'] < ANALYTICS_REFRESH_INTERVAL:
+        return
+    _analytics_refresh_state['refreshed_at'] = now
+    try:
+        refresh_rollups(conn, ANALYTICS_REFRESH_BATCH)
+    except psycopg2.Error:
+        conn.rollback()
+
+def bump_cache_version(cur, *scopes: str) -> None:
+    # Та же таблица версий, что у кэша tests. results:<testId> сбрасывает анализ заданий теста
+    # при изменении уже записанных результатов (ручная проверка, индекс похожих ответов);
+    # новые результаты кэш замечает по их числу, без записи версии на каждую отправку
+    for scope in scopes:
+        cur.execute(
+            "INSERT INTO cache_versions (scope, version, updated_at) VALUES (%s, 1, %s) "
+            "ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1, updated_at = EXCLUDED.updated_at",
+            (scope, datetime.utcnow())
+        )
+
+def attempts_exhausted_response(attempts_limit: int) -> Dict[str, Any]:
+    return {
+        'statusCode': 409,
+        'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'error': 'Исчерпан лимит попыток прохождения теста',
+            'attemptsLimit': attempts_limit
+        }, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def get_compiled_test(cur, test_id: str, version: int) -> Dict[str, Any]:
+    '''
+    Вопросы и настройки пула теста в виде, нужном для выдачи варианта и проверки.
+    Кэшируется в памяти инстанса по версии tests, которую увеличивает любое изменение
+    тестов и вопросов, поэтому старт попытки и отправка не читают вопросы из БД
+    '''
+    key = f"{test_id}:{version}"
+    compiled = _compiled_tests.get(key)
+    if compiled is not None:
+        _compiled_tests.move_to_end(key)
+        return compiled
+    
+    cur.execute("SELECT pool_size, pool_stratify, shuffle_options FROM tests WHERE id = %s", (test_id,))
+    pool_size, pool_stratify, shuffle_options = cur.fetchone() or (None, None, False)
+    cur.execute(
+        "SELECT id, type, points, tag, correct_answer, "
+        "CASE WHEN jsonb_typeof(options) = 'array' THEN jsonb_array_length(options) ELSE 0 END, "
+        "type = 'text' AND text_check_type = 'manual' "
+        "FROM questions WHERE test_id = %s ORDER BY \"order\", id",
+        (test_id,)
+    )
+    compiled = {
+        'poolSize': pool_size,
+        'poolStratify': pool_stratify,
+        'shuffleOptions': shuffle_options,
+        'questions': [{
+            'id': row[0],
+            'type': row[1],
+            'points': row[2],
+            'tag': row[3],
+            'correctAnswer': row[4],
+            'optionCount': row[5],
+            'manual': bool(row[6]),
+        } for row in cur.fetchall()]
+    }
+    _compiled_tests[key] = compiled
+    while len(_compiled_tests) > COMPILED_TESTS_MAX:
+        _compiled_tests.popitem(last=False)
+    return compiled
+
+def draw_variant(compiled: Dict[str, Any], seed: int) -> List[Dict[str, Any]]:
+    '''
+    Вариант попытки: poolSize вопросов (при стратификации - пропорционально по тегам или баллам),
+    их порядок и порядок вариантов ответа. Определяется seed и текущим составом теста; при старте
+    порядок вопросов сохраняется в сессии, чтобы правка теста во время попытки его не меняла.
+    optionOrder - исходные индексы вариантов в порядке показа; ответ отправляется исходными индексами
+    '''
+    rng = random.Random(seed)
+    questions = compiled['questions']
+    pool_size = compiled['poolSize']
+    
+    if pool_size and pool_size < len(questions):
+        stratify = compiled['poolStratify']
+        if stratify:
+            groups: Dict[Any, List[Dict[str, Any]]] = {}
+            for question in questions:
+                groups.setdefault(question['tag'] if stratify == 'tag' else question['points'], []).append(question)
+            group_keys = sorted(groups, key=lambda group_key: (group_key is None, str(group_key)))
+            # Квоты групп методом наибольшего остатка, в сумме ровно pool_size
+            exact = {group_key: len(groups[group_key]) * pool_size / len(questions) for group_key in group_keys}
+            quotas = {group_key: int(exact[group_key]) for group_key in group_keys}
+            by_remainder = sorted(group_keys, key=lambda group_key: exact[group_key] - quotas[group_key], reverse=True)
+            for group_key in by_remainder[:pool_size - sum(quotas.values())]:
+                quotas[group_key] += 1
+            drawn = [question for group_key in group_keys for question in rng.sample(groups[group_key], quotas[group_key])]
+        else:
+            drawn = rng.sample(questions, pool_size)
+    else:
+        drawn = list(questions)
+    rng.shuffle(drawn)
+    
+    return [{
+        'questionId': question['id'],
+        'optionOrder': question_option_order(compiled, question, seed)
+    } for question in drawn]
+
+def question_option_order(compiled: Dict[str, Any], question: Dict[str, Any], seed: int) -> Optional[List[int]]:
+    # Отдельный генератор на вопрос: порядок вариантов не зависит от состава попытки
+    if not compiled['shuffleOptions'] or question['type'] not in OPTION_QUESTION_TYPES:
+        return None
+    return random.Random(f"{seed}:{question['id']}").sample(range(question['optionCount']), question['optionCount'])
+
+def session_variant(compiled: Dict[str, Any], seed: Optional[int], question_order: Optional[List[str]]) -> List[Dict[str, Any]]:
+    '''
+    Вариант сессии из порядка вопросов, сохраненного при старте: добавленные после старта
+    вопросы и изменения пула на попытку не влияют. Сессии без сохраненного порядка
+    восстанавливаются из seed
+    '''
+    if question_order is None:
+        return draw_variant(compiled, seed)
+    questions_by_id = {question['id']: question for question in compiled['questions']}
+    return [{
+        'questionId': question_id,
+        'optionOrder': question_option_order(compiled, questions_by_id[question_id], seed) if seed is not None else None
+    } for question_id in question_order if question_id in questions_by_id]
+
+def grade_answers(compiled: Dict[str, Any], seed: Optional[int], question_order: Optional[List[str]],
+                  answers: Dict[str, Any]) -> tuple:
+    '''
+    Оценка попытки: (score, earned_points, total_points, manual_answers).
+    Вопросы с ручной проверкой входят в total_points, но баллы за них начисляет проверяющий;
+    manual_answers - данные ответы на них в виде (question_id, answer, points)
+    '''
+    # Оцениваются только вопросы, выданные в попытке: набор и сумма баллов не меняются
+    # от вопросов, добавленных после старта
+    variant_ids = {item['questionId'] for item in session_variant(compiled, seed, question_order)}
+    questions = [question for question in compiled['questions'] if question['id'] in variant_ids]
+    
+    total_points = sum(q['points'] for q in questions)
+    earned_points = 0
+    manual_answers = []
+    
+    for question in questions:
+        if question['manual']:
+            if answers.get(question['id']) not in (None, ''):
+                manual_answers.append((question['id'], answers[question['id']], question['points']))
+        elif answers.get(question['id']) == question['correctAnswer']:
+            earned_points += question['points']
+    
+    return score_percent(earned_points, total_points), earned_points, total_points, manual_answers
+
+def score_percent(earned_points: int, total_points: Optional[int]) -> int:
+    # Целочисленно, как и пересчет после ручной проверки в SQL
+    return earned_points * 100 // total_points if total_points else 0
+
+def format_session_response(session_row: tuple, compiled: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    # (id, test_id, course_id, seed, question_order, started_at, deadline_at, draft_answers, draft_seq)
+    deadline_at = session_row[6]
+    variant = session_variant(compiled, session_row[3], session_row[4])
+    return {
+        'id': session_row[0],
+        'testId': session_row[1],
+        'courseId': session_row[2],
+        'questionOrder': [item['questionId'] for item in variant],
+        'questions': variant,
+        'startedAt': session_row[5].isoformat(),
+        'deadlineAt': deadline_at.isoformat() if deadline_at else None,
+        'secondsLeft': max(int((deadline_at - now).total_seconds()), 0) if deadline_at else None,
+        'draftAnswers': session_row[7] or {},
+        'draftSeq': session_row[8] or 0
+    }
+
+def is_session_expired(deadline_at: Optional[datetime], now: datetime) -> bool:
+    return deadline_at is not None and now > deadline_at + timedelta(seconds=EXAM_SUBMIT_GRACE)
+
+def expire_sessions(cur, now: datetime, session_ids: Optional[List[str]] = None) -> int:
+    '''
+    Закрывает просроченные сессии пачкой: оценивается сохраненный черновик ответов,
+    результаты, сводка попыток и test_score пишутся одним запросом на всю пачку.
+    Без session_ids берет до EXAM_SWEEP_BATCH сессий с истекшим сроком. Сессии,
+    заблокированные параллельной отправкой или другим обходом, пропускаются
+    '''
+    if session_ids is None:
+        cur.execute(
+            "SELECT s.id, s.user_id, s.test_id, s.course_id, t.pass_score, s.seed, s.question_order, s.draft_answers, "
+            "(SELECT version FROM cache_versions WHERE scope = 'tests') FROM exam_sessions s "
+            "JOIN tests t ON t.id = s.test_id "
+            "WHERE s.status = 'active' AND s.deadline_at < %s "
+            "ORDER BY s.deadline_at LIMIT %s FOR UPDATE OF s SKIP LOCKED",
+            (now - timedelta(seconds=EXAM_SUBMIT_GRACE), EXAM_SWEEP_BATCH)
+        )
+    else:
+        cur.execute(
+            "SELECT s.id, s.user_id, s.test_id, s.course_id, t.pass_score, s.seed, s.question_order, s.draft_answers, "
+            "(SELECT version FROM cache_versions WHERE scope = 'tests') FROM exam_sessions s "
+            "JOIN tests t ON t.id = s.test_id "
+            "WHERE s.id = ANY(%s) AND s.status = 'active' FOR UPDATE OF s SKIP LOCKED",
+            (session_ids,)
+        )
+    sessions = cur.fetchall()
+    if not sessions:
+        return 0
+    
+    ids = [session[0] for session in sessions]
+    user_ids = [session[1] for session in sessions]
+    test_ids = [session[2] for session in sessions]
+    course_ids = [session[3] for session in sessions]
+    answers = [session[7] or {} for session in sessions]
+    grades = [
+        grade_answers(get_compiled_test(cur, session[2], session[8] or 0), session[5], session[6], session_answers)
+        for session, session_answers in zip(sessions, answers)
+    ]
+    passed = [session[4] is not None and grade[0] >= session[4] for session, grade in zip(sessions, grades)]
+    result_ids = [str(uuid.uuid4()) for _ in sessions]
+    
+    cur.execute(
+        "UPDATE exam_sessions s SET status = 'expired', finished_at = %s, result_id = v.result_id "
+        "FROM unnest(%s::varchar[], %s::varchar[]) AS v(id, result_id) WHERE s.id = v.id",
+        (now, ids, result_ids)
+    )
+    record_results(cur, now, [
+        (result_id, user_id, course_id, test_id, grade[0], session_answers, session_passed, *grade[1:])
+        for result_id, user_id, course_id, test_id, grade, session_answers, session_passed
+        in zip(result_ids, user_ids, course_ids, test_ids, grades, answers, passed)
+    ])
+    return len(sessions)
+
+def expire_sessions_if_due(conn) -> None:
+    # Вызывается после commit основной записи; сбой обхода не влияет на ответ
+    now = time.monotonic()
+    if now - _exam_sweep_state['swept_at'] < EXAM_SWEEP_INTERVAL:
+        return
+    _exam_sweep_state['swept_at'] = now
+    cur = conn.cursor()
+    try:
+        expire_sessions(cur, datetime.utcnow())
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+    finally:
+        cur.close()
+
+def record_results(cur, now: datetime, results: List[tuple], count_attempts: bool = True) -> None:
+    '''
+    Записывает пачку оцененных попыток
+    (result_id, user_id, course_id, test_id, score, answers, passed, earned_points, total_points, manual_answers):
+    test_results, ответы на ручную проверку, сводку попыток и test_score - по одному запросу на пачку.
+    count_attempts=False - попытка уже учтена в сводке при постановке в очередь проверки
+    '''
+    (result_ids, user_ids, course_ids, test_ids, scores, answers, passed,
+     earned_points, total_points, manual_answers) = (list(column) for column in zip(*results))
+    cur.execute(
+        "INSERT INTO test_results (id, user_id, course_id, test_id, score, answers, passed, "
+        "earned_points, total_points, pending_reviews, completed_at, created_at) "
+        "SELECT v.result_id, v.user_id, v.course_id, v.test_id, v.score, v.answers::jsonb, v.passed, "
+        "v.earned_points, v.total_points, v.pending_reviews, %s, %s "
+        "FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::integer[], %s::text[], "
+        "%s::boolean[], %s::integer[], %s::integer[], %s::integer[]) "
+        "AS v(result_id, user_id, course_id, test_id, score, answers, passed, earned_points, total_points, pending_reviews)",
+        (now, now, result_ids, user_ids, course_ids, test_ids, scores,
+         [json.dumps(result_answers) for result_answers in answers], passed,
+         earned_points, total_points, [len(result_manual) for result_manual in manual_answers])
+    )
+    enqueue_reviews(cur, now, [
+        (result_id, user_id, test_id, result_manual)
+        for result_id, user_id, test_id, result_manual in zip(result_ids, user_ids, test_ids, manual_answers)
+    ])
+    index_answer_similarity(cur, now, list(zip(result_ids, user_ids, test_ids, answers)))
+    # Лимит не проверяется: сессия открывается (и попадает в очередь) только при свободной попытке
+    cur.execute(
+        "INSERT INTO test_attempts (user_id, test_id, course_id, attempts_used, best_score, last_score, "
+        "passed, last_result_id, updated_at) "
+        "SELECT v.user_id, v.test_id, v.course_id, 1, v.score, v.score, v.passed, v.result_id, %s "
+        "FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::integer[], %s::boolean[], %s::varchar[]) "
+        "AS v(user_id, test_id, course_id, score, passed, result_id) "
+        "ON CONFLICT (user_id, test_id) DO UPDATE SET "
+        "attempts_used = test_attempts.attempts_used + %s, "
+        "best_score = GREATEST(test_attempts.best_score, EXCLUDED.best_score), "
+        "last_score = EXCLUDED.last_score, passed = test_attempts.passed OR EXCLUDED.passed, "
+        "course_id = EXCLUDED.course_id, last_result_id = EXCLUDED.last_result_id, updated_at = EXCLUDED.updated_at "
+        "RETURNING user_id, course_id, best_score",
+        (now, user_ids, test_ids, course_ids, scores, passed, result_ids, 1 if count_attempts else 0)
+    )
+    summaries = cur.fetchall()
+    cur.execute(
+        "UPDATE course_progress cp SET test_score = v.best_score, updated_at = %s "
+        "FROM unnest(%s::varchar[], %s::varchar[], %s::integer[]) AS v(user_id, course_id, best_score) "
+        "WHERE cp.user_id = v.user_id AND cp.course_id = v.course_id",
+        (now, [row[0] for row in summaries], [row[1] for row in summaries], [row[2] for row in summaries])
+    )
+    # Фиксированный порядок блокировок строк журнала и версий против взаимоблокировок обходов
+    for changed_course_id in sorted(set(course_ids)):
+        mark_analytics_changed(cur, changed_course_id)
+
+def enqueue_reviews(cur, now: datetime, results: List[tuple]) -> None:
+    '''
+    Ставит в очередь ручной проверки ответы (result_id, user_id, test_id, manual_answers) одним запросом
+    '''
+    rows = [
+        (result_id, question_id, test_id, user_id, json.dumps(answer), points)
+        for result_id, user_id, test_id, manual_answers in results
+        for question_id, answer, points in manual_answers
+    ]
+    if not rows:
+        return
+    columns = [list(column) for column in zip(*rows)]
+    cur.execute(
+        "INSERT INTO answer_reviews (id, result_id, question_id, test_id, user_id, answer, max_points, created_at) "
+        "SELECT v.id, v.result_id, v.question_id, v.test_id, v.user_id, v.answer::jsonb, v.max_points, %s "
+        "FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::text[], %s::integer[]) "
+        "AS v(id, result_id, question_id, test_id, user_id, answer, max_points)",
+        (now, [str(uuid.uuid4()) for _ in rows], *columns)
+    )
+
+def claim_reviews(cur, reviewer_id: str, now: datetime, limit: int,
+                  test_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    '''
+    Выдает проверяющему до limit непроверенных ответов в порядке поступления.
+    Аренда продлевается для уже выданных ему ответов и переходит к другому проверяющему
+    после истечения; SKIP LOCKED не дает параллельным запросам выдать один ответ дважды
+    '''
+    lease_until = now + timedelta(seconds=REVIEW_LEASE_SECONDS)
+    cur.execute(
+        "UPDATE answer_reviews r SET leased_by = %s, lease_until = %s "
+        "FROM (SELECT id FROM answer_reviews WHERE status = 'pending' "
+        "AND (lease_until IS NULL OR lease_until < %s OR leased_by = %s) "
+        "AND (%s::varchar IS NULL OR test_id = %s) "
+        "ORDER BY created_at, id LIMIT %s FOR UPDATE SKIP LOCKED) c, questions q "
+        "WHERE r.id = c.id AND q.id = r.question_id "
+        "RETURNING r.id, r.result_id, r.test_id, r.question_id, q.text, q.correct_answer, r.answer, "
+        "r.max_points, r.created_at",
+        (reviewer_id, lease_until, now, reviewer_id, test_id, test_id, limit)
+    )
+    return [{
+        'reviewId': row[0],
+        'resultId': row[1],
+        'testId': row[2],
+        'questionId': row[3],
+        'questionText': row[4],
+        'expectedAnswer': row[5],
+        'answer': row[6],
+        'maxPoints': row[7],
+        'submittedAt': row[8].isoformat() if row[8] else None,
+        'leaseUntil': lease_until.isoformat(),
+    } for row in sorted(cur.fetchall(), key=lambda row: (row[8], row[0]))]
+
+def apply_review(cur, reviewer_id: str, now: datetime, review_id: str, points: int) -> Optional[Dict[str, Any]]:
+    '''
+    Засчитывает проверку одного ответа и пересчитывает только затронутую попытку:
+    баллы добавляются к earned_points результата, лучший балл и зачет в сводке
+    попыток и test_score курса обновляются без повторной проверки теста.
+    None - аренда истекла или передана другому проверяющему, ответ уже проверен или баллов больше максимума
+    '''
+    cur.execute(
+        "UPDATE answer_reviews SET status = 'reviewed', awarded_points = %s, reviewer_id = %s, reviewed_at = %s "
+        "WHERE id = %s AND status = 'pending' AND leased_by = %s AND lease_until >= %s AND %s <= max_points "
+        "RETURNING result_id",
+        (points, reviewer_id, now, review_id, reviewer_id, now, points)
+    )
+    review = cur.fetchone()
+    if not review:
+        return None
+    
+    cur.execute(
+        "UPDATE test_results r SET earned_points = r.earned_points + %s, pending_reviews = r.pending_reviews - 1, "
+        "score = CASE WHEN r.total_points > 0 THEN (r.earned_points + %s) * 100 / r.total_points ELSE 0 END, "
+        "passed = COALESCE(CASE WHEN r.total_points > 0 THEN (r.earned_points + %s) * 100 / r.total_points "
+        "ELSE 0 END >= t.pass_score, FALSE) "
+        "FROM tests t WHERE r.id = %s AND t.id = r.test_id "
+        "RETURNING r.user_id, r.course_id, r.test_id, r.score, r.passed, r.pending_reviews",
+        (points, points, points, review[0])
+    )
+    user_id, course_id, test_id, score, passed, pending_reviews = cur.fetchone()
+    
+    # Баллы за проверку только добавляются, поэтому лучший балл и зачет обновляются без пересчета попыток
+    cur.execute(
+        "UPDATE test_attempts SET best_score = GREATEST(best_score, %s), passed = passed OR %s, "
+        "last_score = CASE WHEN last_result_id = %s THEN %s ELSE last_score END, updated_at = %s "
+        "WHERE user_id = %s AND test_id = %s RETURNING best_score",
+        (score, passed, review[0], score, now, user_id, test_id)
+    )
+    summary = cur.fetchone()
+    if summary:
+        cur.execute(
+            "UPDATE course_progress SET test_score = %s, updated_at = %s WHERE user_id = %s AND course_id = %s",
+            (summary[0], now, user_id, course_id)
+        )
+    return {
+        'reviewId': review_id,
+        'resultId': review[0],
+        'userId': user_id,
+        'courseId': course_id,
+        'testId': test_id,
+        'score': score,
+        'passed': passed,
+        'pendingReviews': pending_reviews,
+    }
+
+def normalize_answer_text(text: str) -> str:
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+def minhash_signature(text: str) -> np.ndarray:
+    '''
+    MinHash нормализованного текста по символьным шинглам длины SIMILARITY_SHINGLE:
+    доля совпадающих значений двух сигнатур оценивает коэффициент Жаккара их шинглов
+    '''
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, SIMILARITY_SHINGLE)
+    shingles = np.unique((windows @ _SHINGLE_POWERS) & _MINHASH_MASK)
+    hashes = _MINHASH_A * shingles
+    hashes += _MINHASH_B
+    # Сдвиг монотонен, поэтому применяется к минимумам, а не ко всей матрице
+    return (hashes.min(axis=1) >> _MINHASH_SHIFT).astype(np.uint32)
+
+def lsh_buckets(signature: np.ndarray) -> List[tuple]:
+    # (band, bucket): ответы с одинаковой полосой сигнатуры попадают в одну корзину
+    rows = SIMILARITY_PERMUTATIONS // SIMILARITY_BANDS
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            'little', signed=True
+        ))
+        for band in range(SIMILARITY_BANDS)
+    ]
+
+def index_answer_similarity(cur, now: datetime, results: List[tuple]) -> int:
+    '''
+    Сигнатуры и LSH-корзины для текстовых ответов пачки результатов (result_id, user_id, test_id, answers).
+    Вызывается при записи результата, поэтому индекс растет вместе с отправками
+    '''
+    cur.execute(
+        "SELECT test_id, id FROM questions WHERE test_id = ANY(%s) AND type = 'text'",
+        (sorted({result[2] for result in results}),)
+    )
+    text_questions: Dict[str, List[str]] = {}
+    for test_id, question_id in cur.fetchall():
+        text_questions.setdefault(test_id, []).append(question_id)
+    
+    signature_rows = []
+    bucket_rows = []
+    for result_id, user_id, test_id, answers in results:
+        for question_id in text_questions.get(test_id, ()):
+            answer = answers.get(question_id)
+            if not isinstance(answer, str):
+                continue
+            text = normalize_answer_text(answer)
+            if len(text) < SIMILARITY_MIN_CHARS:
+                continue
+            signature = minhash_signature(text)
+            signature_rows.append((result_id, question_id, test_id, user_id, signature.tobytes()))
+            bucket_rows.extend(
+                (test_id, question_id, band, bucket, result_id) for band, bucket in lsh_buckets(signature)
+            )
+    if not signature_rows:
+        return 0
+    
+    result_ids, question_ids, test_ids, user_ids, signatures = (list(column) for column in zip(*signature_rows))
+    cur.execute(
+        "INSERT INTO answer_signatures (result_id, question_id, test_id, user_id, signature, created_at) "
+        "SELECT v.result_id, v.question_id, v.test_id, v.user_id, v.signature, %s "
+        "FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::bytea[]) "
+        "AS v(result_id, question_id, test_id, user_id, signature) ON CONFLICT DO NOTHING",
+        (now, result_ids, question_ids, test_ids, user_ids, [psycopg2.Binary(item) for item in signatures])
+    )
+    test_ids, question_ids, bands, buckets, result_ids = (list(column) for column in zip(*bucket_rows))
+    cur.execute(
+        "INSERT INTO answer_lsh_buckets (test_id, question_id, band, bucket, result_id) "
+        "SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::smallint[], %s::bigint[], %s::varchar[]) "
+        "ON CONFLICT DO NOTHING",
+        (test_ids, question_ids, bands, buckets, result_ids)
+    )
+    return len(signature_rows)
+
+def index_pending_similarity(conn) -> int:
+    '''
+    Одна пачка результатов, сохраненных до появления поиска похожих ответов
+    '''
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, user_id, test_id, answers FROM test_results WHERE NOT similarity_indexed "
+        "ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED",
+        (SIMILARITY_BATCH,)
+    )
+    pending = cur.fetchall()
+    if pending:
+        index_answer_similarity(cur, datetime.utcnow(), [
+            (result_id, user_id, test_id, answers or {}) for result_id, user_id, test_id, answers in pending
+        ])
+        cur.execute(
+            "UPDATE test_results SET similarity_indexed = TRUE WHERE id = ANY(%s)",
+            ([row[0] for row in pending],)
+        )
+        bump_cache_version(cur, *sorted({f'results:{row[2]}' for row in pending}))
+    conn.commit()
+    cur.close()
+    return len(pending)
+
+def grade_queued_results(conn) -> int:
+    '''
+    Одна пачка очереди проверки: до GRADING_BATCH отправок в порядке поступления.
+    SKIP LOCKED раздает непересекающиеся пачки параллельным обработчикам; при сбое
+    транзакция откатывается и строки очереди снова доступны
+    '''
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT q.result_id, q.user_id, q.course_id, q.test_id, q.answers, s.seed, s.question_order, t.pass_score, "
+        "(SELECT version FROM cache_versions WHERE scope = 'tests') FROM grading_queue q "
+        "JOIN exam_sessions s ON s.id = q.session_id "
+        "JOIN tests t ON t.id = q.test_id "
+        "ORDER BY q.enqueued_at LIMIT %s FOR UPDATE OF q SKIP LOCKED",
+        (GRADING_BATCH,)
+    )
+    queued = cur.fetchall()
+    if not queued:
+        conn.commit()
+        cur.close()
+        return 0
+    
+    now = datetime.utcnow()
+    results = []
+    for result_id, user_id, course_id, test_id, answers, seed, question_order, pass_score, version in queued:
+        score, earned_points, total_points, manual_answers = grade_answers(
+            get_compiled_test(cur, test_id, version or 0), seed, question_order, answers
+        )
+        results.append((result_id, user_id, course_id, test_id, score, answers,
+                        pass_score is not None and score >= pass_score, earned_points, total_points, manual_answers))
+    
+    record_results(cur, now, results, count_attempts=False)
+    cur.execute("DELETE FROM grading_queue WHERE result_id = ANY(%s)", ([row[0] for row in queued],))
+    conn.commit()
+    cur.close()
+    return len(queued)
+
+def drain_grading_queue_if_due(conn) -> bool:
+    '''
+    Обрабатывает одну пачку очереди на обычном запросе (после commit отправки или при опросе
+    результата), не чаще раза в GRADING_DRAIN_INTERVAL секунд. True - пачка обработана
+    '''
+    now = time.monotonic()
+    if now - _grading_drain_state['drained_at'] < GRADING_DRAIN_INTERVAL:
+        return False
+    _grading_drain_state['drained_at'] = now
+    try:
+        return grade_queued_results(conn) > 0
+    except psycopg2.Error:
+        conn.rollback()
+        return False
+
+def accepted_encodings(headers: Dict[str, Any]) -> Dict[str, float]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    return accepted
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accepted = accepted_encodings(headers)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Отслеживание прогресса обучения
     GET ?userId=x - прогресс пользователя по всем курсам
     GET ?userId=x&courseId=y - прогресс по конкретному курсу
+    GET ?action=export&format=csv|xlsx&courseId=&department=&from=&to= - отчет по прогрессу (только админ)
     POST ?action=complete - отметить урок завершенным
-    POST ?action=submit - отправить результаты теста
+    POST ?action=start - начать тест: сессия со сроком и порядком вопросов
+    POST ?action=autosave - сохранить черновик ответов сессии (изменения с прошлого сохранения)
+    POST ?action=submit - отправить результаты теста в рамках сессии
+    POST ?action=sweep - закрыть просроченные сессии (только админ); в обычной работе их
+    закрывают старты и отправки тестов, этот вызов - для догоняющего обхода
+    POST ?action=grade - обработать очередь проверки (только админ); в обычной работе очередь
+    разбирают отправки и опросы ?action=result, этот вызов - для догоняющего разбора
+    GET ?action=result&resultId=x&userId=y - результат отправки, в том числе из очереди проверки
+    POST ?action=claim - получить пачку текстовых ответов на ручную проверку (только админ)
+    POST ?action=review - выставить баллы за полученные ответы (только админ)
+    POST ?action=similarity - проиндексировать для поиска похожих ответов ранее сохраненные результаты (только админ)
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -101,8 +1159,117 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
     cur = conn.cursor()
     
+    if method == 'GET' and action == 'export':
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен. Требуются права администратора'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        export_format = query_params.get('format', 'csv')
+        query, values, query_error = build_export_query(query_params)
+        if export_format not in ('csv', 'xlsx') or query_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': query_error or 'Формат должен быть csv или xlsx'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        filename = f"progress_{datetime.utcnow().strftime('%Y%m%d_%H%M')}.{export_format}"
+        # CSV всегда пишется в gzip; без gzip в Accept-Encoding отдаем его файлом .csv.gz
+        csv_as_file = export_format == 'csv' and accepted_encodings(event.get('headers') or {}).get('gzip', 0) <= 0
+        if csv_as_file:
+            filename += '.gz'
+        response_headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Content-Disposition, X-Export-Truncated',
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        }
+        if export_format == 'csv':
+            content = write_export_csv(iter_export_rows(conn, query, values))
+            if csv_as_file:
+                response_headers['Content-Type'] = 'application/gzip'
+            else:
+                response_headers['Content-Type'] = 'text/csv; charset=utf-8'
+                response_headers['Content-Encoding'] = 'gzip'
+            response_headers['Vary'] = 'Accept-Encoding'
+        else:
+            content, truncated = write_export_xlsx(iter_export_rows(conn, query, values))
+            response_headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            if truncated:
+                response_headers['X-Export-Truncated'] = 'true'
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': response_headers,
+            'body': base64.b64encode(content).decode('ascii'),
+            'isBase64Encoded': True
+        }
+    
+    if method == 'GET' and action == 'result':
+        result_id = query_params.get('resultId', '')
+        owner_id = user_id or payload['user_id']
+        result_query = (
+            "SELECT tr.score, tr.passed, q.result_id, a.best_score, a.last_score, a.passed, a.attempts_used, t.attempts, "
+            "tr.pending_reviews "
+            "FROM (SELECT %s::varchar AS id) r "
+            "LEFT JOIN test_results tr ON tr.id = r.id AND tr.user_id = %s "
+            "LEFT JOIN grading_queue q ON q.result_id = r.id AND q.user_id = %s "
+            "LEFT JOIN test_attempts a ON a.user_id = %s AND a.test_id = COALESCE(tr.test_id, q.test_id) "
+            "LEFT JOIN tests t ON t.id = a.test_id"
+        )
+        cur.execute(result_query, (result_id, owner_id, owner_id, owner_id))
+        result = cur.fetchone()
+        if result[0] is None and result[2] is not None and drain_grading_queue_if_due(conn):
+            cur.execute(result_query, (result_id, owner_id, owner_id, owner_id))
+            result = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if result[0] is None and result[2] is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Результат не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if result[0] is None:
+            result_data = {'resultId': result_id, 'status': 'queued'}
+        else:
+            result_data = {
+                'resultId': result_id,
+                'status': 'graded',
+                'score': result[0],
+                'passed': result[1],
+                'bestScore': result[3],
+                'lastScore': result[4],
+                'testPassed': result[5],
+                'attemptsUsed': result[6],
+                'attemptsLeft': max(result[7] - result[6], 0) if result[7] is not None and result[6] is not None else None,
+                'pendingReviews': result[8]
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'result': result_data}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'GET' and user_id and course_id:
         cur.execute(
             "SELECT course_id, user_id, completed_lessons, total_lessons, test_score, completed, "
@@ -208,7 +1375,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     (payload['user_id'], complete_req.courseId)
                 )
             
+            mark_analytics_changed(cur, complete_req.courseId)
             conn.commit()
+            refresh_rollups_if_due(conn)
         
         cur.close()
         conn.close()
@@ -220,13 +1389,318 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'POST' and action == 'start':
+        body_data = json.loads(event.get('body', '{}'))
+        start_req = StartTestRequest(**body_data)
+        now = datetime.utcnow()
+        
+        cur.execute(
+            "SELECT t.time_limit, t.attempts, a.attempts_used, "
+            "(SELECT version FROM cache_versions WHERE scope = 'tests'), "
+            "s.id, s.test_id, s.course_id, s.seed, s.question_order, s.started_at, s.deadline_at, "
+            "s.draft_answers, s.draft_seq FROM tests t "
+            "LEFT JOIN test_attempts a ON a.user_id = %s AND a.test_id = t.id "
+            "LEFT JOIN exam_sessions s ON s.user_id = %s AND s.test_id = t.id AND s.status = 'active' "
+            "WHERE t.id = %s",
+            (payload['user_id'], payload['user_id'], start_req.testId)
+        )
+        test = cur.fetchone()
+        
+        if not test:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        time_limit, attempts_limit, attempts_used = test[0], test[1], test[2] or 0
+        compiled = get_compiled_test(cur, start_req.testId, test[3] or 0)
+        active_session = test[4:] if test[4] else None
+        
+        if active_session and not is_session_expired(active_session[6], now):
+            # Повторный старт (перезагрузка страницы) продолжает ту же сессию и тот же срок
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'session': format_session_response(active_session, compiled, now)}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if active_session:
+            attempts_used += expire_sessions(cur, now, [active_session[0]])
+        
+        if attempts_limit is not None and attempts_used >= attempts_limit:
+            conn.commit()
+            cur.close()
+            conn.close()
+            return attempts_exhausted_response(attempts_limit)
+        
+        deadline_at = now + timedelta(minutes=time_limit) if time_limit else None
+        seed = random.SystemRandom().getrandbits(62)
+        cur.execute(
+            "INSERT INTO exam_sessions (id, user_id, test_id, course_id, seed, question_order, status, started_at, deadline_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, 'active', %s, %s) "
+            "ON CONFLICT (user_id, test_id) WHERE status = 'active' DO NOTHING "
+            "RETURNING id, test_id, course_id, seed, question_order, started_at, deadline_at, draft_answers, draft_seq",
+            (str(uuid.uuid4()), payload['user_id'], start_req.testId, start_req.courseId, seed,
+             json.dumps([item['questionId'] for item in draw_variant(compiled, seed)]), now, deadline_at)
+        )
+        session = cur.fetchone()
+        status_code = 201
+        
+        if not session:
+            # Параллельный старт уже создал сессию
+            cur.execute(
+                "SELECT id, test_id, course_id, seed, question_order, started_at, deadline_at, draft_answers, draft_seq "
+                "FROM exam_sessions "
+                "WHERE user_id = %s AND test_id = %s AND status = 'active'",
+                (payload['user_id'], start_req.testId)
+            )
+            session = cur.fetchone()
+            status_code = 200
+        
+        conn.commit()
+        expire_sessions_if_due(conn)
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': status_code,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'session': format_session_response(session, compiled, now)}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'sweep':
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен. Требуются права администратора'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        expired_count = expire_sessions(cur, datetime.utcnow())
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'expired': expired_count, 'hasMore': expired_count == EXAM_SWEEP_BATCH}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'grade':
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен. Требуются права администратора'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Параллельные вызовы работают как пул обработчиков: пачки не пересекаются
+        started = time.monotonic()
+        graded_count = 0
+        has_more = True
+        while has_more and time.monotonic() - started < GRADING_WORKER_SECONDS:
+            batch_count = grade_queued_results(conn)
+            graded_count += batch_count
+            has_more = batch_count == GRADING_BATCH
+        refresh_rollups_if_due(conn)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'graded': graded_count, 'hasMore': has_more}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'similarity':
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен. Требуются права администратора'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        started = time.monotonic()
+        indexed_count = 0
+        has_more = True
+        while has_more and time.monotonic() - started < SIMILARITY_WORKER_SECONDS:
+            batch_count = index_pending_similarity(conn)
+            indexed_count += batch_count
+            has_more = batch_count == SIMILARITY_BATCH
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'indexed': indexed_count, 'hasMore': has_more}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action in ('claim', 'review'):
+        if payload.get('role') != 'admin':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещен. Требуются права администратора'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        body_data = json.loads(event.get('body') or '{}')
+        now = datetime.utcnow()
+        
+        if action == 'claim':
+            claim_req = ClaimReviewsRequest(**body_data)
+            reviews = claim_reviews(cur, payload['user_id'], now, claim_req.limit, claim_req.testId)
+            conn.commit()
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'reviews': reviews}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        review_req = SubmitReviewsRequest(**body_data)
+        reviewed = []
+        rejected = []
+        for review in review_req.reviews:
+            applied = apply_review(cur, payload['user_id'], now, review.reviewId, review.points)
+            if applied:
+                reviewed.append(applied)
+            else:
+                rejected.append(review.reviewId)
+        
+        for changed_course_id in sorted({item['courseId'] for item in reviewed}):
+            mark_analytics_changed(cur, changed_course_id)
+        if reviewed:
+            bump_cache_version(cur, *sorted({f"results:{item['testId']}" for item in reviewed}))
+        conn.commit()
+        refresh_rollups_if_due(conn)
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'reviewed': reviewed, 'rejected': rejected}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'POST' and action == 'autosave':
+        body_data = json.loads(event.get('body', '{}'))
+        autosave_req = AutosaveRequest(**body_data)
+        now = datetime.utcnow()
+        
+        # Изменения сливаются с черновиком в самой БД; запись пропускается, если черновик
+        # сохранялся меньше AUTOSAVE_INTERVAL секунд назад
+        cur.execute(
+            "UPDATE exam_sessions SET draft_answers = COALESCE(draft_answers, '{}'::jsonb) || %s::jsonb, "
+            "draft_seq = %s, draft_saved_at = %s "
+            "WHERE id = %s AND user_id = %s AND status = 'active' "
+            "AND (deadline_at IS NULL OR deadline_at >= %s) "
+            "AND (draft_seq IS NULL OR draft_seq < %s) "
+            "AND (draft_saved_at IS NULL OR draft_saved_at <= %s) "
+            "RETURNING draft_seq",
+            (json.dumps(autosave_req.answers), autosave_req.seq, now,
+             autosave_req.sessionId, payload['user_id'],
+             now - timedelta(seconds=EXAM_SUBMIT_GRACE), autosave_req.seq,
+             now - timedelta(seconds=AUTOSAVE_INTERVAL))
+        )
+        saved = cur.fetchone()
+        conn.commit()
+        
+        if saved:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'saved': True, 'savedSeq': saved[0], 'retryAfter': AUTOSAVE_INTERVAL}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        cur.execute(
+            "SELECT status, deadline_at, draft_seq, draft_saved_at FROM exam_sessions WHERE id = %s AND user_id = %s",
+            (autosave_req.sessionId, payload['user_id'])
+        )
+        session = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if not session:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Сессия теста не найдена'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        session_status, deadline_at, draft_seq, draft_saved_at = session
+        if session_status == 'active' and is_session_expired(deadline_at, now):
+            session_status = 'expired'
+        if session_status != 'active':
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'error': 'Время на прохождение теста истекло' if session_status == 'expired' else 'Тест уже отправлен'
+                }, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Не записано: клиент хранит изменения после savedSeq и отправляет их вместе со следующими
+        retry_after = AUTOSAVE_INTERVAL - (now - draft_saved_at).total_seconds() if draft_saved_at else 0
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'saved': False,
+                'savedSeq': draft_seq or 0,
+                'retryAfter': max(int(retry_after + 0.999), 1)
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'POST' and action == 'submit':
         body_data = json.loads(event.get('body', '{}'))
         submit_req = SubmitTestRequest(**body_data)
         
+        # Тест, сводка попыток и сессия одним запросом; сессия читается по первичному ключу
         cur.execute(
-            "SELECT pass_score FROM tests WHERE id = %s",
-            (submit_req.testId,)
+            "SELECT t.pass_score, t.attempts, a.attempts_used, s.status, s.deadline_at, s.seed, s.question_order, "
+            "s.draft_answers, t.queued_grading, "
+            "(SELECT version FROM cache_versions WHERE scope = 'tests') FROM tests t "
+            "LEFT JOIN test_attempts a ON a.user_id = %s AND a.test_id = t.id "
+            "LEFT JOIN exam_sessions s ON s.id = %s AND s.user_id = %s AND s.test_id = t.id "
+            "WHERE t.id = %s",
+            (payload['user_id'], submit_req.sessionId, payload['user_id'], submit_req.testId)
         )
         test = cur.fetchone()
         
@@ -240,46 +1714,157 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        pass_score = test[0]
+        (pass_score, attempts_limit, attempts_used, session_status, deadline_at, seed, question_order,
+         draft_answers, queued_grading, version) = test
+        now = datetime.utcnow()
+        
+        if session_status is None:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Сессия теста не найдена'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        if session_status == 'active' and is_session_expired(deadline_at, now):
+            # Не дожидаясь обхода: поздняя отправка закрывает сессию без учета ответов
+            expire_sessions(cur, now, [submit_req.sessionId])
+            conn.commit()
+            session_status = 'expired'
+        
+        if session_status != 'active':
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'error': 'Время на прохождение теста истекло' if session_status == 'expired' else 'Тест уже отправлен'
+                }, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Быстрый отказ без проверки ответов; окончательно лимит проверяет UPDATE ниже
+        if attempts_limit is not None and attempts_used is not None and attempts_used >= attempts_limit:
+            cur.close()
+            conn.close()
+            return attempts_exhausted_response(attempts_limit)
+        
+        answers = {**(draft_answers or {}), **(submit_req.answers or {})}
+        new_result_id = str(uuid.uuid4())
         
+        # Блокирует сессию: повторная отправка или обход ждут commit и уже не найдут активную
         cur.execute(
-            "SELECT id, correct_answer, points FROM questions WHERE test_id = %s",
-            (submit_req.testId,)
+            "UPDATE exam_sessions SET status = 'submitted', finished_at = %s, result_id = %s "
+            "WHERE id = %s AND status = 'active'",
+            (now, new_result_id, submit_req.sessionId)
         )
-        questions = cur.fetchall()
-        
-        total_points = sum(q[2] for q in questions)
-        earned_points = 0
+        if cur.rowcount == 0:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест уже отправлен'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
-        for question in questions:
-            question_id = question[0]
-            correct_answer = question[1]
-            points = question[2]
+        if queued_grading:
+            # Попытка учитывается сразу, чтобы лимит соблюдался и до проверки
+            cur.execute(
+                "INSERT INTO test_attempts (user_id, test_id, course_id, attempts_used, passed, updated_at) "
+                "VALUES (%s, %s, %s, 1, FALSE, %s) "
+                "ON CONFLICT (user_id, test_id) DO UPDATE SET "
+                "attempts_used = test_attempts.attempts_used + 1, course_id = EXCLUDED.course_id, "
+                "updated_at = EXCLUDED.updated_at "
+                "WHERE %s::integer IS NULL OR test_attempts.attempts_used < %s "
+                "RETURNING attempts_used",
+                (payload['user_id'], submit_req.testId, submit_req.courseId, now, attempts_limit, attempts_limit)
+            )
+            summary = cur.fetchone()
             
-            user_answer = submit_req.answers.get(question_id)
+            if not summary:
+                conn.rollback()
+                cur.close()
+                conn.close()
+                return attempts_exhausted_response(attempts_limit)
             
-            if user_answer == correct_answer:
-                earned_points += points
+            cur.execute(
+                "INSERT INTO grading_queue (result_id, session_id, user_id, test_id, course_id, answers, enqueued_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (new_result_id, submit_req.sessionId, payload['user_id'], submit_req.testId,
+                 submit_req.courseId, json.dumps(answers), now)
+            )
+            conn.commit()
+            drain_grading_queue_if_due(conn)
+            expire_sessions_if_due(conn)
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 202,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'resultId': new_result_id,
+                    'status': 'queued',
+                    'attemptsUsed': summary[0],
+                    'attemptsLeft': max(attempts_limit - summary[0], 0) if attempts_limit is not None else None,
+                    'message': 'Ответы приняты и ожидают проверки'
+                }, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
         
-        score = int((earned_points / total_points * 100)) if total_points > 0 else 0
+        compiled = get_compiled_test(cur, submit_req.testId, version or 0)
+        score, earned_points, total_points, manual_answers = grade_answers(compiled, seed, question_order, answers)
         passed = score >= pass_score
         
-        new_result_id = str(uuid.uuid4())
-        now = datetime.utcnow()
+        # Строка сводки блокируется до commit: параллельные отправки того же пользователя
+        # выполняются по очереди, и условие WHERE видит уже увеличенный счетчик
+        cur.execute(
+            "INSERT INTO test_attempts (user_id, test_id, course_id, attempts_used, best_score, last_score, "
+            "passed, last_result_id, updated_at) VALUES (%s, %s, %s, 1, %s, %s, %s, %s, %s) "
+            "ON CONFLICT (user_id, test_id) DO UPDATE SET "
+            "attempts_used = test_attempts.attempts_used + 1, "
+            "best_score = GREATEST(test_attempts.best_score, EXCLUDED.best_score), "
+            "last_score = EXCLUDED.last_score, passed = test_attempts.passed OR EXCLUDED.passed, "
+            "course_id = EXCLUDED.course_id, last_result_id = EXCLUDED.last_result_id, updated_at = EXCLUDED.updated_at "
+            "WHERE %s::integer IS NULL OR test_attempts.attempts_used < %s "
+            "RETURNING attempts_used, best_score, last_score, passed",
+            (payload['user_id'], submit_req.testId, submit_req.courseId, score, score, passed,
+             new_result_id, now, attempts_limit, attempts_limit)
+        )
+        summary = cur.fetchone()
+        
+        if not summary:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return attempts_exhausted_response(attempts_limit)
+        
+        attempts_used, best_score, last_score, test_passed = summary
         
         cur.execute(
-            "INSERT INTO test_results (id, user_id, course_id, test_id, score, answers, passed, completed_at, created_at) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            "INSERT INTO test_results (id, user_id, course_id, test_id, score, answers, passed, "
+            "earned_points, total_points, pending_reviews, completed_at, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
             (new_result_id, payload['user_id'], submit_req.courseId, submit_req.testId,
-             score, json.dumps(submit_req.answers), passed, now, now)
+             score, json.dumps(answers), passed, earned_points, total_points, len(manual_answers), now, now)
         )
+        enqueue_reviews(cur, now, [(new_result_id, payload['user_id'], submit_req.testId, manual_answers)])
+        index_answer_similarity(cur, now, [(new_result_id, payload['user_id'], submit_req.testId, answers)])
         
         cur.execute(
             "UPDATE course_progress SET test_score = %s, updated_at = %s WHERE user_id = %s AND course_id = %s",
-            (score, now, payload['user_id'], submit_req.courseId)
+            (best_score, now, payload['user_id'], submit_req.courseId)
         )
+        mark_analytics_changed(cur, submit_req.courseId)
         
         conn.commit()
+        refresh_rollups_if_due(conn)
+        expire_sessions_if_due(conn)
         
         cur.close()
         conn.close()
@@ -287,7 +1872,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'score': score, 'passed': passed, 'message': 'Тест завершен'}, ensure_ascii=False),
+            'body': json.dumps({
+                'score': score,
+                'passed': passed,
+                'bestScore': best_score,
+                'lastScore': last_score,
+                'testPassed': test_passed,
+                'attemptsUsed': attempts_used,
+                'attemptsLeft': max(attempts_limit - attempts_used, 0) if attempts_limit is not None else None,
+                'pendingReviews': len(manual_answers),
+                'message': 'Тест завершен' if not manual_answers else 'Тест завершен, часть ответов ожидает проверки'
+            }, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
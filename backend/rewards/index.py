@@ -1,10 +1,39 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import hashlib
 import psycopg2
 import uuid
+from collections import OrderedDict
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field, ValidationError
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+}
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_SHARED_URL = os.environ.get('CACHE_REDIS_URL')
+# Срок жизни в общем кэше только для очистки: устаревшие записи отсекает версия в ключе
+CACHE_SHARED_TTL = int(os.environ.get('CACHE_SHARED_TTL', '86400'))
+_local_cache: 'OrderedDict[str, Any]' = OrderedDict()
+_shared_cache: Any = None
+
 class RewardCreate(BaseModel):
     name: str = Field(..., min_length=1)
     icon: str = Field(..., min_length=1)
@@ -26,6 +55,136 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def get_shared_cache() -> Any:
+    '''
+    Общий кэш между инстансами (Redis-совместимый клиент с get/set).
+    Можно подменить через set_shared_cache, без CACHE_REDIS_URL работает только память инстанса
+    '''
+    global _shared_cache
+    if _shared_cache is None and CACHE_SHARED_URL and redis is not None:
+        _shared_cache = redis.Redis.from_url(CACHE_SHARED_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _shared_cache
+
+def set_shared_cache(client: Any) -> None:
+    global _shared_cache
+    _shared_cache = client
+
+def get_cache_version(cur, scope: str) -> int:
+    cur.execute("SELECT version FROM cache_versions WHERE scope = %s", (scope,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_cache_version(cur, *scopes: str) -> None:
+    # Вызывается в транзакции записи: новая версия видна читателям вместе с изменениями
+    for scope in scopes:
+        cur.execute(
+            "INSERT INTO cache_versions (scope, version, updated_at) VALUES (%s, 1, %s) "
+            "ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1, updated_at = EXCLUDED.updated_at",
+            (scope, datetime.utcnow())
+        )
+
+def cache_key(scope: str, version: int, *parts: Any) -> str:
+    digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f"{scope}:{version}:{digest}"
+
+def cache_get(key: str) -> Any:
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key]
+    
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    try:
+        raw_value = shared.get(key)
+    except Exception:
+        # Недоступный общий кэш не должен ломать чтение
+        return None
+    if raw_value is None:
+        return None
+    value = json.loads(raw_value)
+    cache_store_local(key, value)
+    return value
+
+def cache_store_local(key: str, value: Any) -> None:
+    _local_cache[key] = value
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > CACHE_MAX_ENTRIES:
+        _local_cache.popitem(last=False)
+
+def cache_set(key: str, value: Any) -> None:
+    cache_store_local(key, value)
+    shared = get_shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.set(key, json.dumps(value, ensure_ascii=False), ex=CACHE_SHARED_TTL)
+    except Exception:
+        pass
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление наградами: получение, создание, обновление, удаление наград
@@ -103,40 +262,47 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if course_id:
-            cur.execute(
-                "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
-                "FROM rewards WHERE course_id = %s ORDER BY created_at DESC",
-                (course_id,)
-            )
-        else:
-            cur.execute(
-                "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
-                "FROM rewards ORDER BY created_at DESC"
-            )
-        
-        rows = cur.fetchall()
-        
-        rewards = []
-        for row in rows:
-            cur.execute(
-                "SELECT COUNT(*) FROM user_rewards WHERE reward_id = %s",
-                (row[0],)
-            )
-            earned_count = cur.fetchone()[0]
+        # earnedCount входит в кэш: код, выдающий награды (user_rewards), тоже увеличивает версию rewards
+        version = get_cache_version(cur, 'rewards')
+        list_key = cache_key('rewards', version, 'list', course_id)
+        rewards = cache_get(list_key)
+        if rewards is None:
+            if course_id:
+                cur.execute(
+                    "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
+                    "FROM rewards WHERE course_id = %s ORDER BY created_at DESC",
+                    (course_id,)
+                )
+            else:
+                cur.execute(
+                    "SELECT id, name, icon, color, course_id, description, condition, bonuses, created_at "
+                    "FROM rewards ORDER BY created_at DESC"
+                )
             
-            rewards.append({
-                'id': row[0],
-                'name': row[1],
-                'icon': row[2],
-                'color': row[3],
-                'courseId': row[4],
-                'description': row[5],
-                'condition': row[6],
-                'bonuses': row[7] if row[7] else [],
-                'createdAt': row[8].isoformat() if row[8] else None,
-                'earnedCount': earned_count
-            })
+            rows = cur.fetchall()
+            
+            rewards = []
+            for row in rows:
+                cur.execute(
+                    "SELECT COUNT(*) FROM user_rewards WHERE reward_id = %s",
+                    (row[0],)
+                )
+                earned_count = cur.fetchone()[0]
+            
+                rewards.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'icon': row[2],
+                    'color': row[3],
+                    'courseId': row[4],
+                    'description': row[5],
+                    'condition': row[6],
+                    'bonuses': row[7] if row[7] else [],
+                    'createdAt': row[8].isoformat() if row[8] else None,
+                    'earnedCount': earned_count
+                })
+            
+            cache_set(list_key, rewards)
         
         cur.close()
         conn.close()
@@ -181,6 +347,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 bonuses_json
             )
         )
+        bump_cache_version(cur, 'rewards')
         conn.commit()
         
         cur.close()
@@ -255,6 +422,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         query = f"UPDATE rewards SET {', '.join(updates)} WHERE id = %s"
         
         cur.execute(query, values)
+        bump_cache_version(cur, 'rewards')
         conn.commit()
         
         cur.close()
@@ -283,6 +451,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute("DELETE FROM user_rewards WHERE reward_id = %s", (reward_id,))
         cur.execute("DELETE FROM rewards WHERE id = %s", (reward_id,))
+        bump_cache_version(cur, 'rewards')
         conn.commit()
         
         cur.close()
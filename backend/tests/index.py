@@ -1,14 +1,89 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import io
+import time
+import hashlib
+import itertools
+import operator
+import random
+import numpy as np
 import psycopg2
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Callable
 from pydantic import BaseModel, Field
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 6,
+    'GET questions': 6,
+}
+
+# Строк за одну выборку серверного курсора при потоковом кодировании списков
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', '2000'))
+
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+
+# Строк test_results за одну выборку при анализе заданий: в памяти только одна пачка
+ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', '10000'))
+OPTION_QUESTION_TYPES = ('single', 'multiple')
+
+# Похожие текстовые ответы: кандидаты из общих LSH-корзин (backend/progress) подтверждаются,
+# если доля совпадающих значений MinHash-сигнатур не ниже порога
+SIMILARITY_DEFAULT_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', '0.8'))
+SIMILARITY_MIN_THRESHOLD = 0.5
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_SHARED_URL = os.environ.get('CACHE_REDIS_URL')
+# Срок жизни в общем кэше только для очистки: устаревшие записи отсекает версия в ключе
+CACHE_SHARED_TTL = int(os.environ.get('CACHE_SHARED_TTL', '86400'))
+_local_cache: 'OrderedDict[str, Any]' = OrderedDict()
+_shared_cache: Any = None
+
+# Поле ответа -> колонка; порядок совпадает с format_test_response
+TEST_FIELDS: Dict[str, Optional[str]] = {
+    'id': 'id',
+    'courseId': 'course_id',
+    'lessonId': 'lesson_id',
+    'title': 'title',
+    'description': 'description',
+    'passScore': 'pass_score',
+    'timeLimit': 'time_limit',
+    'attempts': 'attempts',
+    'questionsCount': 'questions_count',
+    'status': 'status',
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at',
+    'poolSize': 'pool_size',
+    'poolStratify': 'pool_stratify',
+    'shuffleOptions': 'shuffle_options',
+    'queuedGrading': 'queued_grading',
+}
 
 class CreateTestRequest(BaseModel):
     title: str = Field(..., min_length=1)
@@ -16,6 +91,12 @@ class CreateTestRequest(BaseModel):
     passScore: int = Field(default=70, ge=0, le=100)
     timeLimit: int = Field(default=60, ge=1)
     attempts: int = Field(default=3, ge=1)
+    # Пул вопросов: каждой попытке выдается poolSize случайных вопросов (None - все вопросы теста)
+    poolSize: Optional[int] = Field(None, ge=1)
+    poolStratify: Optional[str] = Field(None, pattern='^(tag|points)$')
+    shuffleOptions: bool = False
+    # Отправки проверяются через очередь (для массовых экзаменов)
+    queuedGrading: bool = False
 
 class UpdateTestRequest(BaseModel):
     title: Optional[str] = Field(None, min_length=1)
@@ -24,6 +105,11 @@ class UpdateTestRequest(BaseModel):
     timeLimit: Optional[int] = Field(None, ge=1)
     attempts: Optional[int] = Field(None, ge=1)
     status: Optional[str] = Field(None, pattern='^(draft|published)$')
+    # 0 и none сбрасывают пул и стратификацию
+    poolSize: Optional[int] = Field(None, ge=0)
+    poolStratify: Optional[str] = Field(None, pattern='^(tag|points|none)$')
+    shuffleOptions: Optional[bool] = None
+    queuedGrading: Optional[bool] = None
 
 class CreateQuestionRequest(BaseModel):
     testId: str = Field(..., min_length=1)
@@ -35,17 +121,98 @@ class CreateQuestionRequest(BaseModel):
     order: int = Field(..., ge=0)
     matchingPairs: Optional[list] = None
     textCheckType: Optional[str] = Field(None, pattern='^(manual|automatic)$')
+    tag: Optional[str] = Field(None, max_length=100)
 
 def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_auth(headers: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -68,7 +235,52 @@ def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     
     return None
 
-def format_test_response(test_row: tuple) -> Dict[str, Any]:
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, Optional[str]]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?fields=a,b,c по белому списку маршрута. None - вернуть все поля
+    '''
+    raw_fields = query_params.get('fields')
+    if not raw_fields:
+        return None, None
+    
+    fields = list(dict.fromkeys(field.strip() for field in raw_fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return None, f"Недопустимые поля: {', '.join(unknown)}"
+    
+    # id всегда первая колонка: по row[0] строки сопоставляются с ids и связанными данными
+    return ['id'] + [field for field in fields if field != 'id'], None
+
+def select_columns(fields: Optional[List[str]], allowed: Dict[str, Optional[str]], prefix: str = '') -> str:
+    return ', '.join(prefix + allowed[field] for field in (fields or allowed) if allowed[field])
+
+def format_fields(row: tuple, fields: List[str], allowed: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    columns = [field for field in fields if allowed[field]]
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in zip(columns, row)
+    }
+
+def parse_ids(query_params: Dict[str, Any]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?ids=a,b,c для выборки нескольких записей одним запросом. None - параметр не передан
+    '''
+    raw_ids = query_params.get('ids')
+    if raw_ids is None:
+        return None, None
+    ids = list(dict.fromkeys(item.strip() for item in raw_ids.split(',') if item.strip()))
+    if not ids or len(ids) > MULTI_GET_MAX_IDS:
+        return None, f'Параметр ids должен содержать от 1 до {MULTI_GET_MAX_IDS} идентификаторов'
+    return ids, None
+
+def order_by_ids(rows: List[tuple], ids: List[str]) -> List[tuple]:
+    # Строки возвращаются в порядке ids из запроса; первая колонка - id (parse_fields ставит его первым)
+    rows_by_id = {row[0]: row for row in rows}
+    return [rows_by_id[item] for item in ids if item in rows_by_id]
+
+def format_test_response(test_row: tuple, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        return format_fields(test_row, fields, TEST_FIELDS)
     return {
         'id': test_row[0],
         'courseId': test_row[1],
@@ -82,6 +294,10 @@ def format_test_response(test_row: tuple) -> Dict[str, Any]:
         'status': test_row[9],
         'createdAt': test_row[10].isoformat() if test_row[10] else None,
         'updatedAt': test_row[11].isoformat() if test_row[11] else None,
+        'poolSize': test_row[12],
+        'poolStratify': test_row[13],
+        'shuffleOptions': test_row[14],
+        'queuedGrading': test_row[15],
     }
 
 def format_question_response(question_row: tuple) -> Dict[str, Any]:
@@ -96,13 +312,628 @@ def format_question_response(question_row: tuple) -> Dict[str, Any]:
         'order': question_row[7],
         'matchingPairs': question_row[8],
         'textCheckType': question_row[9],
+        'tag': question_row[10],
+    }
+
+def make_etag(*parts: Any) -> str:
+    raw = '|'.join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32] + '"'
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json; charset=utf-8',
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag'
     }
 
+def is_not_modified(headers: Dict[str, Any], etag: str) -> bool:
+    return (headers.get('If-None-Match') or headers.get('if-none-match')) == etag
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    response_headers = etag_headers(etag)
+    del response_headers['Content-Type']
+    return {
+        'statusCode': 304,
+        'headers': response_headers,
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def get_shared_cache() -> Any:
+    '''
+    Общий кэш между инстансами (Redis-совместимый клиент с get/set).
+    Можно подменить через set_shared_cache, без CACHE_REDIS_URL работает только память инстанса
+    '''
+    global _shared_cache
+    if _shared_cache is None and CACHE_SHARED_URL and redis is not None:
+        _shared_cache = redis.Redis.from_url(CACHE_SHARED_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _shared_cache
+
+def set_shared_cache(client: Any) -> None:
+    global _shared_cache
+    _shared_cache = client
+
+def get_cache_version(cur, scope: str) -> int:
+    cur.execute("SELECT version FROM cache_versions WHERE scope = %s", (scope,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_cache_version(cur, *scopes: str) -> None:
+    # Вызывается в транзакции записи: новая версия видна читателям вместе с изменениями
+    for scope in scopes:
+        cur.execute(
+            "INSERT INTO cache_versions (scope, version, updated_at) VALUES (%s, 1, %s) "
+            "ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1, updated_at = EXCLUDED.updated_at",
+            (scope, datetime.utcnow())
+        )
+
+def get_results_fingerprint(cur, test_id: str) -> List[Any]:
+    '''
+    Состояние результатов теста для ключа кэша анализа: число и время последнего результата
+    (idx_test_results_test_id) и версия results:<testId>, которую увеличивают только изменения
+    уже записанных результатов. Отправка теста не пишет версию, поэтому одновременные
+    отправки не ждут друг друга на строке cache_versions
+    '''
+    cur.execute(
+        "SELECT count(*), max(created_at), (SELECT version FROM cache_versions WHERE scope = %s) "
+        "FROM test_results WHERE test_id = %s",
+        (f'results:{test_id}', test_id)
+    )
+    count, last_created_at, version = cur.fetchone()
+    return [count, last_created_at.isoformat() if last_created_at else None, version or 0]
+
+def cache_key(scope: str, version: int, *parts: Any) -> str:
+    digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f"{scope}:{version}:{digest}"
+
+def cache_get(key: str) -> Any:
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key]
+    
+    shared = get_shared_cache()
+    if shared is None:
+        return None
+    try:
+        raw_value = shared.get(key)
+    except Exception:
+        # Недоступный общий кэш не должен ломать чтение
+        return None
+    if raw_value is None:
+        return None
+    value = json.loads(raw_value)
+    cache_store_local(key, value)
+    return value
+
+def cache_store_local(key: str, value: Any) -> None:
+    _local_cache[key] = value
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > CACHE_MAX_ENTRIES:
+        _local_cache.popitem(last=False)
+
+def cache_set(key: str, value: Any) -> None:
+    cache_store_local(key, value)
+    shared = get_shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.set(key, json.dumps(value, ensure_ascii=False), ex=CACHE_SHARED_TTL)
+    except Exception:
+        pass
+
+def stream_json_body(conn, key: str, query: str, params: Any, format_row: Callable[[tuple], Any],
+                     extra: Optional[Callable[[], Dict[str, Any]]] = None) -> str:
+    '''
+    Собирает тело {"key": [...], **extra()} построчно через именованный (серверный) курсор:
+    в памяти нет списков кортежей и словарей, только itersize строк выборки и готовый текст.
+    Пиковая память снижается, но не постоянна: функция отдает тело одной строкой, поэтому текст
+    и его копия в str растут с числом строк. Объем ответа ограничивают только страницы (limit/offset).
+    extra вызывается после выборки, когда известны итоги по строкам
+    '''
+    # UTF-8 в байтовом буфере компактнее, чем str с кириллицей (2-4 байта на символ)
+    buffer = io.BytesIO()
+    buffer.write(json.dumps(key).encode('utf-8').join((b'{', b': [')))
+    with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as stream_cur:
+        stream_cur.itersize = STREAM_ITERSIZE
+        stream_cur.execute(query, params)
+        for index, row in enumerate(stream_cur):
+            if index:
+                buffer.write(b', ')
+            buffer.write(json.dumps(format_row(row), ensure_ascii=False).encode('utf-8'))
+    buffer.write(b']')
+    extra_data = extra() if extra else None
+    if extra_data:
+        buffer.write(b', ' + json.dumps(extra_data, ensure_ascii=False)[1:-1].encode('utf-8'))
+    buffer.write(b'}')
+    return str(buffer.getbuffer(), 'utf-8')
+
+def option_lookup(options: Any) -> Dict[Any, int]:
+    # Ответ хранится индексом варианта (редактор тестов) или текстом варианта (старые данные)
+    lookup: Dict[Any, int] = {}
+    for index, option in enumerate(options or []):
+        lookup[index] = index
+        if isinstance(option, str):
+            lookup.setdefault(option, index)
+    return lookup
+
+def option_code(lookup: Dict[Any, int], value: Any) -> int:
+    try:
+        return lookup.get(value, -1)
+    except TypeError:
+        # Список или объект вместо варианта
+        return -1
+
+def new_item_accumulator(questions: List[tuple], pooled: bool = False) -> Dict[str, Any]:
+    '''
+    Достаточные статистики анализа заданий: суммы по пачкам складываются,
+    поэтому матрица ответов целиком в памяти не нужна.
+    questions - строки (id, type, text, options, correct_answer, points, order[, tag, manual]).
+    pooled - тест с пулом вопросов: попытка видит только свой вариант, и статистики
+    вопроса считаются по попыткам, которым он был выдан
+    '''
+    question_count = len(questions)
+    lookups = [option_lookup(q[3]) if q[1] in OPTION_QUESTION_TYPES else None for q in questions]
+    return {
+        'n': 0,
+        'pooled': pooled,
+        'points': np.array([q[5] for q in questions], dtype=np.float64),
+        # Вопросы с ручной проверкой: балл - доля начисленных проверяющим баллов
+        'manual': np.array([len(q) > 8 and bool(q[8]) for q in questions], dtype=np.bool_),
+        'lookups': lookups,
+        # Суммы балла и его квадрата по попыткам, которым выдан вопрос
+        'presented': np.zeros(question_count, dtype=np.float64),
+        'sum_total': np.zeros(question_count, dtype=np.float64),
+        'sum_total_sq': np.zeros(question_count, dtype=np.float64),
+        # Сумма долей от максимума по выданным вопросам - для среднего балла
+        'sum_score': 0.0,
+        'correct': np.zeros(question_count, dtype=np.float64),
+        'correct_sq': np.zeros(question_count, dtype=np.float64),
+        'correct_total': np.zeros(question_count, dtype=np.float64),
+        'answered': np.zeros(question_count, dtype=np.int64),
+        'pending': np.zeros(question_count, dtype=np.int64),
+        'option_counts': [np.zeros(len(q[3] or []), dtype=np.int64) if lookup is not None else None
+                          for q, lookup in zip(questions, lookups)],
+        'option_scores': [np.zeros(len(q[3] or []), dtype=np.float64) if lookup is not None else None
+                          for q, lookup in zip(questions, lookups)],
+    }
+
+def accumulate_item_batch(acc: Dict[str, Any], questions: List[tuple], answers_batch: List[Dict[str, Any]],
+                          presented: Optional[np.ndarray] = None,
+                          reviews_batch: Optional[List[Dict[str, float]]] = None) -> None:
+    '''
+    Раскладывает пачку ответов в колонки (правильность, выбранные варианты) и добавляет
+    их суммы в acc. Правильность считается так же, как при отправке теста: ответ == correct_answer.
+    presented - матрица (попытка x вопрос) выданных вопросов; пропущенный выданный вопрос
+    считается неверным. Без нее в тесте с пулом выданными считаются вопросы с ответом.
+    reviews_batch - доли баллов ручной проверки по вопросам результата; ответ, еще не
+    проверенный вручную, в статистику вопроса не входит
+    '''
+    batch_size = len(answers_batch)
+    if not batch_size:
+        return
+    correct = np.empty((batch_size, len(questions)), dtype=np.float64)
+    if presented is None and acc['pooled']:
+        presented = np.empty((batch_size, len(questions)), dtype=np.float64)
+        for index, question in enumerate(questions):
+            presented[:, index] = np.fromiter((question[0] in answers for answers in answers_batch), dtype=np.bool_, count=batch_size)
+    if presented is None and acc['manual'].any():
+        presented = np.ones((batch_size, len(questions)), dtype=np.float64)
+    columns = []
+    for index, question in enumerate(questions):
+        question_id, correct_answer = question[0], question[4]
+        column = [answers.get(question_id) for answers in answers_batch]
+        if acc['manual'][index]:
+            reviews = reviews_batch or [{}] * batch_size
+            correct[:, index] = np.fromiter((review.get(question_id, 0.0) for review in reviews), dtype=np.float64, count=batch_size)
+            pending = np.fromiter((value not in (None, '') and question_id not in review
+                                   for value, review in zip(column, reviews)), dtype=np.bool_, count=batch_size)
+            acc['pending'][index] += int((pending & (presented[:, index] > 0)).sum())
+            presented[:, index] *= ~pending
+        else:
+            correct[:, index] = np.fromiter(map(operator.eq, column, itertools.repeat(correct_answer)), dtype=np.bool_, count=batch_size)
+        acc['answered'][index] += batch_size - column.count(None)
+        columns.append(column)
+    if presented is not None:
+        correct *= presented
+    
+    points = acc['points']
+    totals = correct @ points
+    totals_sq = totals * totals
+    if presented is not None:
+        max_points = presented @ points
+        acc['presented'] += presented.sum(axis=0)
+        acc['sum_total'] += totals @ presented
+        acc['sum_total_sq'] += totals_sq @ presented
+    else:
+        max_points = np.full(batch_size, points.sum())
+        acc['presented'] += batch_size
+        acc['sum_total'] += totals.sum()
+        acc['sum_total_sq'] += totals_sq.sum()
+    scores = np.divide(totals, max_points, out=np.zeros(batch_size), where=max_points > 0)
+    acc['n'] += batch_size
+    acc['sum_score'] += float(scores.sum())
+    acc['correct'] += correct.sum(axis=0)
+    acc['correct_sq'] += (correct * correct).sum(axis=0)
+    acc['correct_total'] += totals @ correct
+    
+    for index, (question, lookup) in enumerate(zip(questions, acc['lookups'])):
+        if lookup is None or not len(acc['option_counts'][index]):
+            continue
+        option_count = len(acc['option_counts'][index])
+        if question[1] == 'single':
+            try:
+                codes = np.fromiter(map(lookup.get, columns[index], itertools.repeat(-1)), dtype=np.int32, count=batch_size)
+            except TypeError:
+                codes = np.fromiter((option_code(lookup, value) for value in columns[index]), dtype=np.int32, count=batch_size)
+            rows = np.flatnonzero(codes >= 0)
+            codes = codes[rows]
+        else:
+            row_list, code_list = [], []
+            for row, value in enumerate(columns[index]):
+                if isinstance(value, list):
+                    for item in value:
+                        code = option_code(lookup, item)
+                        if code >= 0:
+                            row_list.append(row)
+                            code_list.append(code)
+            rows = np.array(row_list, dtype=np.int64)
+            codes = np.array(code_list, dtype=np.int64)
+        acc['option_counts'][index] += np.bincount(codes, minlength=option_count)
+        acc['option_scores'][index] += np.bincount(codes, weights=scores[rows], minlength=option_count)
+
+def finalize_item_analysis(acc: Dict[str, Any], questions: List[tuple]) -> Dict[str, Any]:
+    '''
+    Трудность (доля верных, у ручной проверки - средняя доля начисленных баллов), дискриминация
+    (точечно-бисериальная корреляция с баллом за остальные вопросы), частоты вариантов
+    и альфа Кронбаха. Для теста с пулом
+    знаменатель каждого вопроса - число попыток, которым он выдан; альфа не считается,
+    так как попытки отвечают на разные наборы вопросов
+    '''
+    n = acc['n']
+    points = acc['points']
+    presented = acc['presented']
+    max_score = float(points.sum())
+    
+    def to_percent(value: float) -> Optional[float]:
+        return round(value * 100, 2) if max_score > 0 else None
+    
+    def rounded(values: Any) -> List[Optional[float]]:
+        return [round(float(value), 4) if np.isfinite(value) else None for value in values]
+    
+    if not n:
+        difficulty = discrimination = [None] * len(questions)
+        alpha = None
+        mean_score = None
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_total = acc['sum_total'] / presented
+            var_total = acc['sum_total_sq'] / presented - mean_total ** 2
+            p = acc['correct'] / presented
+            # Для верно/неверно совпадает с p * (1 - p); ручная проверка дает доли балла
+            var_item = acc['correct_sq'] / presented - p ** 2
+            cov_total = acc['correct_total'] / presented - p * mean_total
+            # Балл за остальные вопросы: вклад самого вопроса завышал бы корреляцию
+            cov_rest = cov_total - points * var_item
+            var_rest = var_total - 2 * points * cov_total + points ** 2 * var_item
+            point_biserial = cov_rest / np.sqrt(var_item * var_rest)
+            item_count = len(questions)
+            # Альфа - только если каждый вопрос выдан каждой попытке: тогда выборка у всех
+            # вопросов одна, и var_total одинакова
+            alpha = (item_count / (item_count - 1) * (1 - float((points ** 2 * var_item).sum()) / var_total[0])
+                     if item_count > 1 and bool((presented == n).all()) and var_total[0] > 0 else None)
+        difficulty = rounded(p)
+        discrimination = rounded(point_biserial)
+        alpha = round(alpha, 4) if alpha is not None and np.isfinite(alpha) else None
+        mean_score = to_percent(acc['sum_score'] / n)
+    
+    questions_data = []
+    for index, question in enumerate(questions):
+        question_presented = int(presented[index])
+        question_data = {
+            'questionId': question[0],
+            'type': question[1],
+            'text': question[2],
+            'order': question[6],
+            'points': question[5],
+            'presented': question_presented,
+            'responses': int(acc['answered'][index]),
+            'difficulty': difficulty[index],
+            'discrimination': discrimination[index],
+        }
+        if acc['manual'][index]:
+            question_data['pendingReviews'] = int(acc['pending'][index])
+        if acc['lookups'][index] is not None:
+            lookup = acc['lookups'][index]
+            correct_answer = question[4]
+            correct_codes = {option_code(lookup, item) for item in
+                             (correct_answer if isinstance(correct_answer, list) else [correct_answer])}
+            counts = acc['option_counts'][index]
+            option_scores = acc['option_scores'][index]
+            question_data['options'] = [{
+                'index': option_index,
+                'option': option,
+                'correct': option_index in correct_codes,
+                'count': int(counts[option_index]),
+                'share': round(int(counts[option_index]) / question_presented, 4) if question_presented else None,
+                # Средний балл выбравших: у хорошего дистрактора он ниже среднего по тесту
+                'meanScore': to_percent(option_scores[option_index] / counts[option_index]) if counts[option_index] else None,
+            } for option_index, option in enumerate(question[3] or [])]
+        questions_data.append(question_data)
+    
+    return {
+        'results': n,
+        'pooled': acc['pooled'],
+        'meanScore': mean_score,
+        'alpha': alpha,
+        'questions': questions_data,
+        'computedAt': datetime.utcnow().isoformat(),
+    }
+
+def draw_question_ids(questions: List[tuple], pool_size: Optional[int], pool_stratify: Optional[str], seed: int) -> List[str]:
+    '''
+    Вопросы варианта по seed сессии - та же выборка, что draw_variant в backend/progress, по текущему
+    составу теста. Нужна для сессий, начатых до сохранения вопросов в exam_sessions.question_order.
+    questions - строки analyze_test_items в порядке ("order", id), tag - восьмая колонка
+    '''
+    rng = random.Random(seed)
+    if not pool_size or pool_size >= len(questions):
+        return [question[0] for question in questions]
+    if not pool_stratify:
+        return [question[0] for question in rng.sample(questions, pool_size)]
+    
+    groups: Dict[Any, List[tuple]] = {}
+    for question in questions:
+        groups.setdefault(question[7] if pool_stratify == 'tag' else question[5], []).append(question)
+    group_keys = sorted(groups, key=lambda group_key: (group_key is None, str(group_key)))
+    exact = {group_key: len(groups[group_key]) * pool_size / len(questions) for group_key in group_keys}
+    quotas = {group_key: int(exact[group_key]) for group_key in group_keys}
+    by_remainder = sorted(group_keys, key=lambda group_key: exact[group_key] - quotas[group_key], reverse=True)
+    for group_key in by_remainder[:pool_size - sum(quotas.values())]:
+        quotas[group_key] += 1
+    return [question[0] for group_key in group_keys for question in rng.sample(groups[group_key], quotas[group_key])]
+
+def presented_matrix(questions: List[tuple], rows: List[tuple], pool_size: Optional[int],
+                     pool_stratify: Optional[str]) -> np.ndarray:
+    '''
+    Выданные вопросы пачки результатов; rows - (answers, question_order, seed) из сессии результата.
+    Результаты без сессии: в тесте с пулом выданы вопросы с ответом, без пула - все
+    '''
+    columns = {question[0]: index for index, question in enumerate(questions)}
+    pooled = pool_size is not None and pool_size < len(questions)
+    presented = np.zeros((len(rows), len(questions)), dtype=np.float64)
+    for row_index, (answers, question_order, seed) in enumerate(rows):
+        if question_order is not None:
+            question_ids = question_order
+        elif seed is not None:
+            question_ids = draw_question_ids(questions, pool_size, pool_stratify, seed)
+        elif pooled:
+            question_ids = answers
+        else:
+            presented[row_index] = 1
+            continue
+        presented[row_index, [columns[question_id] for question_id in question_ids if question_id in columns]] = 1
+    return presented
+
+def analyze_test_items(conn, test_id: str) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pool_size, pool_stratify FROM tests WHERE id = %s", (test_id,))
+        pool_size, pool_stratify = cur.fetchone() or (None, None)
+        # Порядок ("order", id) - как при выдаче вариантов: по нему восстанавливается выборка по seed
+        cur.execute(
+            "SELECT id, type, text, options, correct_answer, points, \"order\", tag, "
+            "type = 'text' AND text_check_type = 'manual' "
+            "FROM questions WHERE test_id = %s ORDER BY \"order\", id",
+            (test_id,)
+        )
+        questions = cur.fetchall()
+    
+    acc = new_item_accumulator(questions, pooled=pool_size is not None and pool_size < len(questions))
+    with conn.cursor(name=f"analysis_{uuid.uuid4().hex}") as results_cur:
+        results_cur.itersize = ANALYSIS_BATCH_SIZE
+        # Вручную проверяемые ответы оцениваются по answer_reviews, а не сравнением с correct_answer
+        results_cur.execute(
+            "SELECT tr.answers, s.question_order, s.seed, "
+            "(SELECT jsonb_object_agg(ar.question_id, ar.awarded_points::float / ar.max_points) "
+            "FROM answer_reviews ar WHERE ar.result_id = tr.id AND ar.status = 'reviewed' AND ar.max_points > 0) "
+            "FROM test_results tr "
+            "LEFT JOIN exam_sessions s ON s.result_id = tr.id "
+            "WHERE tr.test_id = %s",
+            (test_id,)
+        )
+        while True:
+            batch = results_cur.fetchmany(ANALYSIS_BATCH_SIZE)
+            if not batch:
+                break
+            rows = [(row[0] or {}, row[1], row[2]) for row in batch]
+            accumulate_item_batch(acc, questions, [row[0] for row in rows],
+                                  presented_matrix(questions, rows, pool_size, pool_stratify),
+                                  [row[3] or {} for row in batch])
+    
+    analysis = finalize_item_analysis(acc, questions)
+    analysis['testId'] = test_id
+    return analysis
+
+def cluster_similar_answers(buckets: List[tuple], signatures: Dict[tuple, np.ndarray],
+                            owners: Dict[tuple, str], threshold: float) -> Dict[str, List[Dict[str, Any]]]:
+    '''
+    Кластеры похожих ответов по вопросам. buckets - (question_id, [result_id, ...]) корзин с несколькими ответами.
+    Ответы корзины сравниваются с первым ответом корзины (линейно от размера корзины, а не попарно);
+    ответы одного пользователя между собой не связываются
+    '''
+    parent: Dict[tuple, tuple] = {}
+    
+    def find(item: tuple) -> tuple:
+        root = item
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while item != root:
+            parent[item], item = root, parent.get(item, item)
+        return root
+    
+    edge_similarity: Dict[tuple, float] = {}
+    for question_id, members in buckets:
+        anchor = (question_id, members[0])
+        others = [(question_id, result_id) for result_id in members[1:] if owners[(question_id, result_id)] != owners[anchor]]
+        if not others:
+            continue
+        matrix = np.stack([signatures[item] for item in others])
+        similarities = (matrix == signatures[anchor]).mean(axis=1)
+        for item, similarity in zip(others, similarities.tolist()):
+            if similarity < threshold:
+                continue
+            edge_similarity[(anchor, item)] = similarity
+            left, right = find(anchor), find(item)
+            if left != right:
+                parent[right] = left
+    
+    components: Dict[tuple, Dict[str, Any]] = {}
+    for (anchor, item), similarity in edge_similarity.items():
+        component = components.setdefault(find(anchor), {'members': set(), 'minSimilarity': 1.0})
+        component['members'].update((anchor, item))
+        component['minSimilarity'] = min(component['minSimilarity'], similarity)
+    
+    clusters: Dict[str, List[Dict[str, Any]]] = {}
+    for (question_id, _), component in components.items():
+        clusters.setdefault(question_id, []).append({
+            'resultIds': sorted(result_id for _, result_id in component['members']),
+            'minSimilarity': round(component['minSimilarity'], 4),
+        })
+    for question_clusters in clusters.values():
+        question_clusters.sort(key=lambda cluster: (-len(cluster['resultIds']), cluster['resultIds'][0]))
+    return clusters
+
+def find_similar_answers(conn, test_id: str, threshold: float) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT question_id, array_agg(result_id ORDER BY result_id) FROM answer_lsh_buckets "
+            "WHERE test_id = %s GROUP BY question_id, band, bucket HAVING count(*) > 1",
+            (test_id,)
+        )
+        buckets = cur.fetchall()
+        candidate_ids = sorted({result_id for _, members in buckets for result_id in members})
+        cur.execute(
+            "SELECT question_id, result_id, user_id, signature FROM answer_signatures "
+            "WHERE test_id = %s AND result_id = ANY(%s)",
+            (test_id, candidate_ids)
+        )
+        signatures = {}
+        owners = {}
+        for question_id, result_id, user_id, signature in cur.fetchall():
+            signatures[(question_id, result_id)] = np.frombuffer(bytes(signature), dtype=np.uint32)
+            owners[(question_id, result_id)] = user_id
+        
+        clusters = cluster_similar_answers(buckets, signatures, owners, threshold)
+        clustered_ids = sorted({
+            result_id for question_clusters in clusters.values()
+            for cluster in question_clusters for result_id in cluster['resultIds']
+        })
+        cur.execute(
+            "SELECT tr.id, tr.user_id, u.name, u.email, tr.answers, tr.completed_at FROM test_results tr "
+            "JOIN users u ON u.id = tr.user_id WHERE tr.id = ANY(%s)",
+            (clustered_ids,)
+        )
+        results = {row[0]: row for row in cur.fetchall()}
+        cur.execute(
+            "SELECT id, text FROM questions WHERE id = ANY(%s) ORDER BY \"order\"",
+            (sorted(clusters),)
+        )
+        questions = cur.fetchall()
+    
+    return {
+        'testId': test_id,
+        'threshold': threshold,
+        'questions': [{
+            'questionId': question_id,
+            'text': question_text,
+            'clusters': [{
+                'size': len(cluster['resultIds']),
+                'minSimilarity': cluster['minSimilarity'],
+                'members': [{
+                    'resultId': result_id,
+                    'userId': results[result_id][1],
+                    'userName': results[result_id][2],
+                    'email': results[result_id][3],
+                    'answer': (results[result_id][4] or {}).get(question_id),
+                    'completedAt': results[result_id][5].isoformat() if results[result_id][5] else None,
+                } for result_id in cluster['resultIds'] if result_id in results],
+            } for cluster in clusters[question_id]],
+        } for question_id, question_text in questions]
+    }
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление тестами и вопросами
     GET ?id=x - один тест
+    GET ?ids=a,b,c - несколько тестов одним запросом
+    GET ?fields=id,title,... - только указанные поля (для списка и одного теста)
     GET ?testId=x&action=questions - вопросы теста
+    GET ?testId=x&action=analysis - анализ заданий по результатам (админ)
+    GET ?testId=x&action=similarity&threshold=0.8 - группы похожих развернутых ответов (админ)
     POST - создать тест (админ)
     POST ?action=question - создать вопрос (админ)
     PUT ?id=x - обновить тест (админ)
@@ -115,7 +946,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -139,16 +970,169 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, payload['user_id'])
     cur = conn.cursor()
     
+    fields, fields_error = parse_fields(query_params, TEST_FIELDS) if method == 'GET' and action not in ('questions', 'analysis') else (None, None)
+    if fields_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    ids, ids_error = parse_ids(query_params) if method == 'GET' else (None, None)
+    if ids_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': ids_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
     if method == 'GET' and action == 'questions' and test_id_param:
+        # Вопросы добавляются только через POST ?action=question, который увеличивает версию tests
+        version = get_cache_version(cur, 'tests')
+        etag = make_etag('questions', test_id_param, version)
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        questions_key = cache_key('tests', version, 'questions', test_id_param)
+        questions_list = cache_get(questions_key)
+        if questions_list is None:
+            cur.execute(
+                "SELECT id, test_id, type, text, options, correct_answer, points, \"order\", "
+                "matching_pairs, text_check_type, tag FROM questions WHERE test_id = %s ORDER BY \"order\"",
+                (test_id_param,)
+            )
+            questions_list = [format_question_response(q) for q in cur.fetchall()]
+            cache_set(questions_key, questions_list)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': etag_headers(etag),
+            'body': json.dumps({'questions': questions_list}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and action == 'analysis' and test_id_param:
+        admin_error = require_admin(headers)
+        if admin_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': admin_error['statusCode'],
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        cur.execute("SELECT 1 FROM tests WHERE id = %s", (test_id_param,))
+        if not cur.fetchone():
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Версия tests меняется вместе с вопросами, состояние результатов - с каждой отправкой теста.
+        # Оба читаются до расчета, поэтому под ключом не окажутся данные старше ключа
+        version = get_cache_version(cur, 'tests')
+        results_state = get_results_fingerprint(cur, test_id_param)
+        analysis_key = cache_key('tests', version, 'analysis', test_id_param, results_state)
+        analysis = cache_get(analysis_key)
+        if analysis is None:
+            analysis = analyze_test_items(conn, test_id_param)
+            cache_set(analysis_key, analysis)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'analysis': analysis}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and action == 'similarity' and test_id_param:
+        admin_error = require_admin(headers)
+        if admin_error:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': admin_error['statusCode'],
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': admin_error['error']}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        try:
+            threshold = float(query_params.get('threshold') or SIMILARITY_DEFAULT_THRESHOLD)
+        except ValueError:
+            threshold = -1.0
+        if not SIMILARITY_MIN_THRESHOLD <= threshold <= 1.0:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(
+                    {'error': f'Порог сходства должен быть от {SIMILARITY_MIN_THRESHOLD} до 1'}, ensure_ascii=False
+                ),
+                'isBase64Encoded': False
+            }
+        
+        cur.execute("SELECT 1 FROM tests WHERE id = %s", (test_id_param,))
+        if not cur.fetchone():
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Тест не найден'}, ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+        
+        # Индекс пополняется вместе с test_results, поэтому ключ тот же, что у анализа заданий
+        version = get_cache_version(cur, 'tests')
+        results_state = get_results_fingerprint(cur, test_id_param)
+        similarity_key = cache_key('tests', version, 'similarity', test_id_param, results_state, threshold)
+        similarity = cache_get(similarity_key)
+        if similarity is None:
+            similarity = find_similar_answers(conn, test_id_param, threshold)
+            cache_set(similarity_key, similarity)
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'similarity': similarity}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and ids:
         cur.execute(
-            "SELECT id, test_id, type, text, options, correct_answer, points, \"order\", "
-            "matching_pairs, text_check_type FROM questions WHERE test_id = %s ORDER BY \"order\"",
-            (test_id_param,)
+            f"SELECT {select_columns(fields, TEST_FIELDS)} FROM tests WHERE id = ANY(%s)",
+            (ids,)
         )
-        questions = cur.fetchall()
-        questions_list = [format_question_response(q) for q in questions]
+        tests = order_by_ids(cur.fetchall(), ids)
+        found_ids = {test[0] for test in tests}
         
         cur.close()
         conn.close()
@@ -156,14 +1140,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'questions': questions_list}, ensure_ascii=False),
+            'body': json.dumps({
+                'tests': [format_test_response(test, fields) for test in tests],
+                'missing': [item for item in ids if item not in found_ids]
+            }, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
     if method == 'GET' and test_id:
         cur.execute(
-            "SELECT id, course_id, lesson_id, title, description, pass_score, time_limit, "
-            "attempts, questions_count, status, created_at, updated_at FROM tests WHERE id = %s",
+            f"SELECT updated_at, {select_columns(fields, TEST_FIELDS)} FROM tests WHERE id = %s",
             (test_id,)
         )
         test = cur.fetchone()
@@ -178,34 +1164,49 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        test_data = format_test_response(test)
-        
         cur.close()
         conn.close()
         
+        etag = make_etag('test', test_id, test[0], fields)
+        if is_not_modified(headers, etag):
+            return not_modified_response(etag)
+        
+        test_data = format_test_response(test[1:], fields)
+        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'headers': etag_headers(etag),
             'body': json.dumps({'test': test_data}, ensure_ascii=False),
             'isBase64Encoded': False
         }
     
     if method == 'GET':
-        cur.execute(
-            "SELECT id, course_id, lesson_id, title, description, pass_score, time_limit, "
-            "attempts, questions_count, status, created_at, updated_at "
-            "FROM tests ORDER BY created_at DESC"
-        )
-        tests = cur.fetchall()
-        tests_list = [format_test_response(test) for test in tests]
+        version = get_cache_version(cur, 'tests')
+        etag = make_etag('tests', fields, version)
+        if is_not_modified(headers, etag):
+            cur.close()
+            conn.close()
+            return not_modified_response(etag)
+        
+        # В кэше хранится уже закодированное тело ответа
+        list_key = cache_key('tests', version, 'list', fields)
+        tests_body = cache_get(list_key)
+        if tests_body is None:
+            tests_body = stream_json_body(
+                conn, 'tests',
+                f"SELECT {select_columns(fields, TEST_FIELDS)} FROM tests ORDER BY created_at DESC",
+                None,
+                lambda test: format_test_response(test, fields)
+            )
+            cache_set(list_key, tests_body)
         
         cur.close()
         conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'tests': tests_list}, ensure_ascii=False),
+            'headers': etag_headers(etag),
+            'body': tests_body,
             'isBase64Encoded': False
         }
     
@@ -229,15 +1230,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(
             "INSERT INTO questions (id, test_id, type, text, options, correct_answer, points, \"order\", "
-            "matching_pairs, text_check_type, created_at) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
-            "RETURNING id, test_id, type, text, options, correct_answer, points, \"order\", matching_pairs, text_check_type",
+            "matching_pairs, text_check_type, tag, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+            "RETURNING id, test_id, type, text, options, correct_answer, points, \"order\", matching_pairs, text_check_type, tag",
             (new_question_id, question_req.testId, question_req.type, question_req.text,
              json.dumps(question_req.options) if question_req.options else None,
              json.dumps(question_req.correctAnswer),
              question_req.points, question_req.order,
              json.dumps(question_req.matchingPairs) if question_req.matchingPairs else None,
-             question_req.textCheckType, now)
+             question_req.textCheckType, question_req.tag, now)
         )
         new_question = cur.fetchone()
         
@@ -245,6 +1246,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "UPDATE tests SET questions_count = questions_count + 1, updated_at = %s WHERE id = %s",
             (now, question_req.testId)
         )
+        bump_cache_version(cur, 'tests')
         conn.commit()
         
         question_data = format_question_response(new_question)
@@ -279,15 +1281,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(
             "INSERT INTO tests (id, course_id, lesson_id, title, description, pass_score, time_limit, "
-            "attempts, questions_count, status, created_at, updated_at) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+            "attempts, questions_count, status, created_at, updated_at, pool_size, pool_stratify, shuffle_options, queued_grading) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
             "RETURNING id, course_id, lesson_id, title, description, pass_score, time_limit, attempts, "
-            "questions_count, status, created_at, updated_at",
+            "questions_count, status, created_at, updated_at, pool_size, pool_stratify, shuffle_options, queued_grading",
             (new_test_id, None, None, create_req.title,
              create_req.description, create_req.passScore, create_req.timeLimit, create_req.attempts,
-             0, 'draft', now, now)
+             0, 'draft', now, now, create_req.poolSize, create_req.poolStratify, create_req.shuffleOptions,
+             create_req.queuedGrading)
         )
         new_test = cur.fetchone()
+        bump_cache_version(cur, 'tests')
         conn.commit()
         
         test_data = format_test_response(new_test)
@@ -338,6 +1342,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if update_req.status is not None:
             update_fields.append('status = %s')
             update_values.append(update_req.status)
+        if update_req.poolSize is not None:
+            update_fields.append('pool_size = %s')
+            update_values.append(update_req.poolSize or None)
+        if update_req.poolStratify is not None:
+            update_fields.append('pool_stratify = %s')
+            update_values.append(None if update_req.poolStratify == 'none' else update_req.poolStratify)
+        if update_req.shuffleOptions is not None:
+            update_fields.append('shuffle_options = %s')
+            update_values.append(update_req.shuffleOptions)
+        if update_req.queuedGrading is not None:
+            update_fields.append('queued_grading = %s')
+            update_values.append(update_req.queuedGrading)
         
         if not update_fields:
             cur.close()
@@ -353,10 +1369,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         update_values.append(datetime.utcnow())
         update_values.append(test_id)
         
-        query = f"UPDATE tests SET {', '.join(update_fields)} WHERE id = %s RETURNING id, course_id, lesson_id, title, description, pass_score, time_limit, attempts, questions_count, status, created_at, updated_at"
+        query = f"UPDATE tests SET {', '.join(update_fields)} WHERE id = %s RETURNING id, course_id, lesson_id, title, description, pass_score, time_limit, attempts, questions_count, status, created_at, updated_at, pool_size, pool_stratify, shuffle_options, queued_grading"
         
         cur.execute(query, update_values)
         updated_test = cur.fetchone()
+        bump_cache_version(cur, 'tests')
         conn.commit()
         
         if not updated_test:
@@ -1,15 +1,67 @@
 import json
 import os
+import gzip
+import base64
+import functools
+import io
+import time
 import psycopg2
 import bcrypt
 import jwt
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Callable
 from pydantic import BaseModel, EmailStr, Field, ValidationError
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', '300'))
+_activity_pending: Dict[str, datetime] = {}
+_activity_flushed_at: Dict[str, float] = {}
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('REVOCATION_REFRESH_INTERVAL', '30'))
+_revoked_tokens: Dict[str, datetime] = {}
+_revocation_state: Dict[str, Any] = {'checked_at': float('-inf'), 'since': None}
+
+USERS_DEFAULT_LIMIT = 50
+USERS_MAX_LIMIT = 500
+USER_SORT_COLUMNS = {
+    'lastActive': 'last_active',
+    'registrationDate': 'registration_date',
+    'name': 'name',
+    'email': 'email',
+}
+
+# Строк за одну выборку серверного курсора при потоковом кодировании списков
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', '2000'))
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_DEFAULT_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+COMPRESSION_LEVELS: Dict[str, int] = {
+    'GET': 5,
+}
+
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+
+# Поле ответа -> колонка; порядок совпадает с format_user_response
+USER_FIELDS: Dict[str, Optional[str]] = {
+    'id': 'id',
+    'email': 'email',
+    'name': 'name',
+    'role': 'role',
+    'position': 'position',
+    'department': 'department',
+    'phone': 'phone',
+    'avatar': 'avatar',
+    'isActive': 'is_active',
+    'registrationDate': 'registration_date',
+    'lastActive': 'last_active',
+}
 
 class CreateUserRequest(BaseModel):
     email: EmailStr
@@ -37,12 +89,92 @@ def get_db_connection():
     dsn = os.environ['DATABASE_URL']
     return psycopg2.connect(dsn)
 
+def track_activity(conn, user_id: str) -> None:
+    '''
+    Отмечает активность пользователя. Запись в users.last_active не чаще раза
+    в ACTIVITY_FLUSH_INTERVAL секунд на пользователя; накопленные отметки
+    сбрасываются одним пакетным UPDATE
+    '''
+    _activity_pending[user_id] = datetime.utcnow()
+    now = time.monotonic()
+    if now - _activity_flushed_at.get(user_id, float('-inf')) < ACTIVITY_FLUSH_INTERVAL:
+        return
+    
+    user_ids = list(_activity_pending.keys())
+    timestamps = [_activity_pending[uid] for uid in user_ids]
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "UPDATE users u SET last_active = v.ts "
+            "FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, ts) "
+            "WHERE u.id = v.id AND (u.last_active IS NULL OR u.last_active < v.ts - make_interval(secs => %s))",
+            (user_ids, timestamps, ACTIVITY_FLUSH_INTERVAL)
+        )
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return
+    finally:
+        cur.close()
+    
+    for uid in user_ids:
+        _activity_flushed_at[uid] = now
+    _activity_pending.clear()
+
+def refresh_revoked_tokens() -> None:
+    '''
+    Обновляет локальный список отозванных токенов: раз в REVOCATION_REFRESH_INTERVAL
+    секунд подгружает только новые записи revoked_tokens и выбрасывает истекшие
+    '''
+    now = time.monotonic()
+    if now - _revocation_state['checked_at'] < REVOCATION_REFRESH_INTERVAL:
+        return
+    
+    utc_now = datetime.utcnow()
+    since = _revocation_state['since']
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if since is None:
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > %s",
+                (utc_now,)
+            )
+        else:
+            # Перекрытие окна страхует от транзакций, зафиксированных с задержкой
+            cur.execute(
+                "SELECT jti, expires_at FROM revoked_tokens WHERE revoked_at > %s AND expires_at > %s",
+                (since - timedelta(seconds=REVOCATION_REFRESH_INTERVAL), utc_now)
+            )
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    for jti, expires_at in rows:
+        _revoked_tokens[jti] = expires_at
+    for jti in [jti for jti, expires_at in _revoked_tokens.items() if expires_at <= utc_now]:
+        del _revoked_tokens[jti]
+    
+    _revocation_state['checked_at'] = now
+    _revocation_state['since'] = utc_now
+
+def is_token_revoked(payload: Dict[str, Any]) -> bool:
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    refresh_revoked_tokens()
+    return jti in _revoked_tokens
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except:
         return None
+    if is_token_revoked(payload):
+        return None
+    return payload
 
 def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -58,7 +190,52 @@ def require_admin(headers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     
     return None
 
-def format_user_response(user_row: tuple) -> Dict[str, Any]:
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, Optional[str]]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?fields=a,b,c по белому списку маршрута. None - вернуть все поля
+    '''
+    raw_fields = query_params.get('fields')
+    if not raw_fields:
+        return None, None
+    
+    fields = list(dict.fromkeys(field.strip() for field in raw_fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return None, f"Недопустимые поля: {', '.join(unknown)}"
+    
+    # id всегда первая колонка: по row[0] строки сопоставляются с ids и связанными данными
+    return ['id'] + [field for field in fields if field != 'id'], None
+
+def select_columns(fields: Optional[List[str]], allowed: Dict[str, Optional[str]], prefix: str = '') -> str:
+    return ', '.join(prefix + allowed[field] for field in (fields or allowed) if allowed[field])
+
+def format_fields(row: tuple, fields: List[str], allowed: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    columns = [field for field in fields if allowed[field]]
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in zip(columns, row)
+    }
+
+def parse_ids(query_params: Dict[str, Any]) -> tuple[Optional[List[str]], Optional[str]]:
+    '''
+    Разбирает ?ids=a,b,c для выборки нескольких записей одним запросом. None - параметр не передан
+    '''
+    raw_ids = query_params.get('ids')
+    if raw_ids is None:
+        return None, None
+    ids = list(dict.fromkeys(item.strip() for item in raw_ids.split(',') if item.strip()))
+    if not ids or len(ids) > MULTI_GET_MAX_IDS:
+        return None, f'Параметр ids должен содержать от 1 до {MULTI_GET_MAX_IDS} идентификаторов'
+    return ids, None
+
+def order_by_ids(rows: List[tuple], ids: List[str]) -> List[tuple]:
+    # Строки возвращаются в порядке ids из запроса; первая колонка - id (parse_fields ставит его первым)
+    rows_by_id = {row[0]: row for row in rows}
+    return [rows_by_id[item] for item in ids if item in rows_by_id]
+
+def format_user_response(user_row: tuple, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        return format_fields(user_row, fields, USER_FIELDS)
     return {
         'id': user_row[0],
         'email': user_row[1],
@@ -73,10 +250,142 @@ def format_user_response(user_row: tuple) -> Dict[str, Any]:
         'lastActive': user_row[10].isoformat() if user_row[10] else None,
     }
 
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def parse_int_param(value: Optional[str], default: int) -> int:
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
+
+def build_user_filters(query_params: Dict[str, Any]) -> tuple[str, list]:
+    conditions = []
+    values = []
+    
+    search = (query_params.get('search') or '').strip()
+    if search:
+        # ILIKE и оператор % обслуживаются триграммными GIN-индексами (pg_trgm)
+        pattern = f"%{escape_like(search)}%"
+        conditions.append("(name ILIKE %s OR email ILIKE %s OR name %% %s OR email %% %s)")
+        values.extend([pattern, pattern, search, search])
+    
+    for param, column in (('role', 'role'), ('department', 'department'), ('position', 'position')):
+        if query_params.get(param):
+            conditions.append(f"{column} = %s")
+            values.append(query_params[param])
+    
+    if query_params.get('isActive') in ('true', 'false'):
+        conditions.append("is_active = %s")
+        values.append(query_params['isActive'] == 'true')
+    
+    where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where_sql, values
+
+def mark_user_analytics_changed(cur, user_id: str) -> None:
+    # Смена отдела меняет разрезы аналитики по всем курсам пользователя (backend/analytics)
+    cur.execute(
+        "INSERT INTO analytics_changes (course_id, changed_at) "
+        "SELECT DISTINCT course_id, %s FROM course_assignments WHERE user_id = %s",
+        (datetime.utcnow(), user_id)
+    )
+
+def stream_json_body(conn, key: str, query: str, params: Any, format_row: Callable[[tuple], Any],
+                     extra: Optional[Callable[[], Dict[str, Any]]] = None) -> str:
+    '''
+    Собирает тело {"key": [...], **extra()} построчно через именованный (серверный) курсор:
+    в памяти нет списков кортежей и словарей, только itersize строк выборки и готовый текст.
+    Пиковая память снижается, но не постоянна: функция отдает тело одной строкой, поэтому текст
+    и его копия в str растут с числом строк. Объем ответа ограничивают только страницы (limit/offset).
+    extra вызывается после выборки, когда известны итоги по строкам
+    '''
+    # UTF-8 в байтовом буфере компактнее, чем str с кириллицей (2-4 байта на символ)
+    buffer = io.BytesIO()
+    buffer.write(json.dumps(key).encode('utf-8').join((b'{', b': [')))
+    with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as stream_cur:
+        stream_cur.itersize = STREAM_ITERSIZE
+        stream_cur.execute(query, params)
+        for index, row in enumerate(stream_cur):
+            if index:
+                buffer.write(b', ')
+            buffer.write(json.dumps(format_row(row), ensure_ascii=False).encode('utf-8'))
+    buffer.write(b']')
+    extra_data = extra() if extra else None
+    if extra_data:
+        buffer.write(b', ' + json.dumps(extra_data, ensure_ascii=False)[1:-1].encode('utf-8'))
+    buffer.write(b'}')
+    return str(buffer.getbuffer(), 'utf-8')
+
+def choose_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+    
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает JSON-ответ gzip или brotli по Accept-Encoding, если тело больше COMPRESSION_MIN_SIZE.
+    Уровень берется из COMPRESSION_LEVELS по маршруту "METHOD action", 0 отключает сжатие
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    query_params = event.get('queryStringParameters') or {}
+    route = f"{event.get('httpMethod', 'GET')} {query_params.get('action', '')}".strip()
+    level = COMPRESSION_LEVELS.get(route, COMPRESSION_DEFAULT_LEVEL)
+    encoding = choose_encoding(event.get('headers') or {}) if level > 0 else None
+    if not encoding:
+        return response
+    
+    if encoding == 'br':
+        compressed = brotli.compress(raw_body, quality=min(level, 11))
+    else:
+        compressed = gzip.compress(raw_body, compresslevel=min(level, 9), mtime=0)
+    
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        **response,
+        'headers': response_headers,
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def with_compression(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress_response(event, func(event, context))
+    return wrapper
+
+@with_compression
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     CRUD операции с пользователями (только для администраторов)
-    GET ?id=x - данные пользователя, без id - все пользователи
+    GET ?id=x - данные пользователя, без id - страница списка (limit по умолчанию USERS_DEFAULT_LIMIT) и total
+    GET ?fields=id,name,email,... - только указанные поля (для списка и одного пользователя)
+    GET ?ids=a,b,c - несколько пользователей одним запросом (порядок ids сохраняется)
+    GET ?search=&role=&department=&position=&isActive=&sort=lastActive&order=desc&limit=&offset= - поиск
     POST - создание пользователя
     PUT ?id=x&action=password - изменение пароля
     PUT ?id=x&action=role - изменение роли
@@ -139,15 +448,84 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     conn = get_db_connection()
+    track_activity(conn, current_user_id)
     cur = conn.cursor()
     
-    if method == 'GET' and not user_id:
+    fields, fields_error = parse_fields(query_params, USER_FIELDS) if method == 'GET' else (None, None)
+    if fields_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    ids, ids_error = parse_ids(query_params) if method == 'GET' else (None, None)
+    if ids_error:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': ids_error}, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and ids:
         cur.execute(
-            "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
-            "registration_date, last_active FROM users ORDER BY registration_date DESC"
+            f"SELECT {select_columns(fields, USER_FIELDS)} FROM users WHERE id = ANY(%s)",
+            (ids,)
+        )
+        users = order_by_ids(cur.fetchall(), ids)
+        found_ids = {user[0] for user in users}
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'users': [format_user_response(user, fields) for user in users],
+                'missing': [item for item in ids if item not in found_ids]
+            }, ensure_ascii=False),
+            'isBase64Encoded': False
+        }
+    
+    if method == 'GET' and not user_id:
+        where_sql, where_values = build_user_filters(query_params)
+        search = (query_params.get('search') or '').strip()
+        
+        sort_column = USER_SORT_COLUMNS.get(query_params.get('sort', ''), 'registration_date')
+        sort_order = 'ASC' if query_params.get('order') == 'asc' else 'DESC'
+        order_sql = f"{sort_column} {sort_order} NULLS LAST, id"
+        order_values = []
+        if search and not query_params.get('sort'):
+            order_sql = "GREATEST(similarity(name, %s), similarity(email, %s)) DESC, " + order_sql
+            order_values = [search, search]
+        
+        limit = min(parse_int_param(query_params.get('limit'), USERS_DEFAULT_LIMIT), USERS_MAX_LIMIT)
+        offset = parse_int_param(query_params.get('offset'), 0)
+        
+        # Отдельный подсчет не сортирует совпавшие строки и дает total и при offset за концом списка
+        cur.execute(f"SELECT COUNT(*) FROM users{where_sql}", where_values)
+        total = cur.fetchone()[0]
+        
+        query = (
+            f"SELECT {select_columns(fields, USER_FIELDS)} FROM users"
+            f"{where_sql} ORDER BY {order_sql} LIMIT %s OFFSET %s"
         )
-        users = cur.fetchall()
-        users_list = [format_user_response(user) for user in users]
+        values = where_values + order_values + [limit, offset]
+        
+        def format_row(user: tuple) -> Dict[str, Any]:
+            return format_user_response(user, fields)
+        
+        def response_extra() -> Dict[str, Any]:
+            return {'total': total, 'limit': limit, 'offset': offset}
+        
+        users_body = stream_json_body(conn, 'users', query, values, format_row, response_extra)
         
         cur.close()
         conn.close()
@@ -155,14 +533,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json; charset=utf-8', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'users': users_list}, ensure_ascii=False),
+            'body': users_body,
             'isBase64Encoded': False
         }
     
     if method == 'GET' and user_id:
         cur.execute(
-            "SELECT id, email, name, role, position, department, phone, avatar, is_active, "
-            "registration_date, last_active FROM users WHERE id = %s",
+            f"SELECT {select_columns(fields, USER_FIELDS)} FROM users WHERE id = %s",
             (user_id,)
         )
         user = cur.fetchone()
@@ -178,7 +555,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        user_data = format_user_response(user)
+        user_data = format_user_response(user, fields)
         
         return {
             'statusCode': 200,
@@ -203,7 +580,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         new_user_id = str(uuid.uuid4())
-        password_hash = bcrypt.hashpw(create_req.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = bcrypt.hashpw(create_req.password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
         now = datetime.utcnow()
         
         cur.execute(
@@ -234,7 +611,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         body_data = json.loads(event.get('body', '{}'))
         pwd_req = UpdatePasswordRequest(**body_data)
         
-        password_hash = bcrypt.hashpw(pwd_req.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = bcrypt.hashpw(pwd_req.password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
         
         cur.execute(
             "UPDATE users SET password_hash = %s, updated_at = %s WHERE id = %s",
@@ -333,6 +710,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         cur.execute(query, update_values)
         updated_user = cur.fetchone()
+        if updated_user and update_req.department is not None:
+            mark_user_analytics_changed(cur, user_id)
         conn.commit()
         
         if not updated_user:
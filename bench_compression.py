@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Замер размера ответов и стоимости сжатия (gzip/brotli) на данных из DATABASE_URL.
+
+Вызывает обработчики функций напрямую с токеном администратора и сжимает
+полученные JSON-тела на разных уровнях:
+    DATABASE_URL=... JWT_SECRET=... python bench_compression.py --levels 1,4,6,9
+"""
+import argparse
+import gzip
+import importlib.util
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+ROUTES = [
+    ('users', {}),
+    ('courses', {}),
+    ('tests', {}),
+    ('rewards', {}),
+]
+
+
+def load_handler(function_name):
+    spec = importlib.util.spec_from_file_location(
+        f'{function_name}_index', os.path.join(BACKEND_DIR, function_name, 'index.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def admin_token():
+    payload = {
+        'user_id': 'bench-admin',
+        'email': 'bench@example.com',
+        'role': 'admin',
+        'exp': datetime.utcnow() + timedelta(minutes=5)
+    }
+    return jwt.encode(payload, os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'), algorithm='HS256')
+
+
+def fetch_body(function_name, query_params, token):
+    event = {
+        'httpMethod': 'GET',
+        'queryStringParameters': query_params,
+        'headers': {'X-Auth-Token': token}
+    }
+    response = load_handler(function_name)(event, None)
+    return response['body'].encode('utf-8')
+
+
+def measure(compress, raw_body, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        compressed = compress(raw_body)
+    return len(compressed), (time.perf_counter() - started) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response compression benchmark')
+    parser.add_argument('--levels', default='1,4,6,9')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--course-id', help='also measure GET lessons?courseId=...')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        print("ERROR: DATABASE_URL environment variable not set")
+        sys.exit(1)
+
+    routes = list(ROUTES)
+    if args.course_id:
+        routes.append(('lessons', {'courseId': args.course_id}))
+
+    token = admin_token()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    print(f"{'route':<18} {'codec':<7} {'level':>5} {'raw KB':>9} {'out KB':>9} {'ratio':>7} {'ms':>8}")
+    for function_name, query_params in routes:
+        raw_body = fetch_body(function_name, query_params, token)
+        route = function_name + ''.join(f"?{key}" for key in query_params)
+        for level in levels:
+            codecs = [('gzip', lambda body, l=level: gzip.compress(body, compresslevel=l, mtime=0))]
+            if brotli is not None:
+                codecs.append(('br', lambda body, l=level: brotli.compress(body, quality=l)))
+            for codec, compress in codecs:
+                size, ms = measure(compress, raw_body, args.repeats)
+                print(f"{route:<18} {codec:<7} {level:>5} {len(raw_body) / 1024:>9.1f} "
+                      f"{size / 1024:>9.1f} {len(raw_body) / max(size, 1):>7.1f} {ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Замер анализа заданий (backend/tests, GET ?testId=x&action=analysis) на синтетических результатах.
+
+Генерирует ответы в формате test_results.answers и прогоняет их пачками через
+те же функции накопления, что и обработчик; сверяет векторный расчет с построчным
+на первых --check результатах:
+    python bench_item_analysis.py --results 1000000 --questions 20
+С --pool N каждая попытка получает N случайных вопросов, как тест с пулом:
+    python bench_item_analysis.py --results 1000000 --questions 40 --pool 20
+С DATABASE_URL и --test-id дополнительно замеряет полный путь с выборкой из базы.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+
+def load_tests_module():
+    spec = importlib.util.spec_from_file_location('tests_index', os.path.join(BACKEND_DIR, 'tests', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_questions(count):
+    # (id, type, text, options, correct_answer, points, order) - как в analyze_test_items
+    questions = []
+    for index in range(count):
+        question_type = ('single', 'single', 'multiple', 'text')[index % 4]
+        options = [f'Вариант {option}' for option in range(4)] if question_type != 'text' else None
+        correct = {'single': index % 4, 'multiple': [0, 2], 'text': 'ответ'}[question_type]
+        questions.append((f'q{index}', question_type, f'Вопрос {index}', options, correct, 1 + index % 3, index))
+    return questions
+
+
+def make_answers(questions, rng, pool=None):
+    skill = rng.random()
+    answers = {}
+    drawn = rng.sample(questions, pool) if pool else questions
+    for question_id, question_type, _, _, correct, _, _ in drawn:
+        if rng.random() < 0.03:
+            continue
+        knows = rng.random() < skill
+        if question_type == 'single':
+            answers[question_id] = correct if knows else rng.randrange(4)
+        elif question_type == 'multiple':
+            answers[question_id] = correct if knows else sorted(rng.sample(range(4), rng.randint(1, 3)))
+        else:
+            answers[question_id] = correct if knows else 'другое'
+    return answers
+
+
+def naive_point_biserial(questions, answers_list, pooled=False):
+    correct = [[1 if answers.get(q[0]) == q[4] else 0 for q in questions] for answers in answers_list]
+    totals = [sum(value * q[5] for value, q in zip(row, questions)) for row in correct]
+    result = []
+    for index, question in enumerate(questions):
+        # В тесте с пулом корреляция считается только по попыткам, которым выдан вопрос
+        rows = [row for row, answers in enumerate(answers_list) if not pooled or question[0] in answers]
+        column = [correct[row][index] for row in rows]
+        rest = [totals[row] - correct[row][index] * question[5] for row in rows]
+        try:
+            result.append(round(statistics.correlation(column, rest), 4))
+        except statistics.StatisticsError:
+            result.append(None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Item analysis benchmark')
+    parser.add_argument('--results', type=int, default=1000000)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--check', type=int, default=20000)
+    parser.add_argument('--pool', type=int, help='questions drawn per attempt (pooled test)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--trace-memory', action='store_true', help='track peak memory (several times slower)')
+    parser.add_argument('--test-id', help='also measure the full path on DATABASE_URL')
+    args = parser.parse_args()
+
+    tests_module = load_tests_module()
+    batch_size = tests_module.ANALYSIS_BATCH_SIZE
+    questions = make_questions(args.questions)
+    rng = random.Random(args.seed)
+    pooled = args.pool is not None and args.pool < args.questions
+
+    acc = tests_module.new_item_accumulator(questions, pooled=pooled)
+    check_answers = []
+    generate_seconds = accumulate_seconds = 0.0
+    if args.trace_memory:
+        tracemalloc.start()
+    for offset in range(0, args.results, batch_size):
+        started = time.perf_counter()
+        batch = [make_answers(questions, rng, args.pool if pooled else None)
+                 for _ in range(min(batch_size, args.results - offset))]
+        generate_seconds += time.perf_counter() - started
+        if len(check_answers) < args.check:
+            check_answers.extend(batch[:args.check - len(check_answers)])
+        started = time.perf_counter()
+        tests_module.accumulate_item_batch(acc, questions, batch)
+        accumulate_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    analysis = tests_module.finalize_item_analysis(acc, questions)
+    finalize_ms = (time.perf_counter() - started) * 1000
+    peak = None
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"results: {args.results}, questions: {args.questions}, pool: {args.pool if pooled else '-'}, "
+          f"batch: {batch_size}")
+    print(f"generate: {generate_seconds:.2f} s (not part of the analysis)")
+    print(f"accumulate: {accumulate_seconds:.2f} s ({args.results / max(accumulate_seconds, 1e-9):,.0f} results/s)")
+    print(f"finalize: {finalize_ms:.2f} ms")
+    if peak is not None:
+        print(f"peak traced memory: {peak / 1024 / 1024:.1f} MB")
+    print(f"alpha: {analysis['alpha']}, mean score: {analysis['meanScore']}")
+    difficulties = [q['difficulty'] for q in analysis['questions'] if q['difficulty'] is not None]
+    if difficulties:
+        print(f"mean difficulty: {statistics.mean(difficulties):.4f}")
+
+    check_acc = tests_module.new_item_accumulator(questions, pooled=pooled)
+    tests_module.accumulate_item_batch(check_acc, questions, check_answers)
+    vectorized = [q['discrimination'] for q in tests_module.finalize_item_analysis(check_acc, questions)['questions']]
+    started = time.perf_counter()
+    naive = naive_point_biserial(questions, check_answers, pooled)
+    naive_seconds = time.perf_counter() - started
+    mismatches = [index for index, (left, right) in enumerate(zip(vectorized, naive))
+                  if left is None or right is None or abs(left - right) > 1e-3]
+    print(f"check on {len(check_answers)} results: row-by-row {naive_seconds:.2f} s, "
+          f"{'OK' if not mismatches else f'MISMATCH in questions {mismatches}'}")
+
+    if args.test_id:
+        import psycopg2
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        started = time.perf_counter()
+        db_analysis = tests_module.analyze_test_items(conn, args.test_id)
+        print(f"database path: {db_analysis['results']} results in {time.perf_counter() - started:.2f} s")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
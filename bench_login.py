@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк входа для подбора BCRYPT_ROUNDS и размера инстансов под утренние пики.
+
+Локально (без сети) - стоимость bcrypt.checkpw для разных rounds:
+    python bench_login.py --rounds 10,11,12,13 --iterations 20
+
+Нагрузка на функцию auth (POST ?action=login):
+    python bench_login.py --url https://functions.poehali.dev/<auth-id> \\
+        --email student@test.com --password 123456 --requests 200 --concurrency 20
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_bcrypt(rounds_list, iterations):
+    print(f"{'rounds':>6} {'mean ms':>9} {'p95 ms':>9} {'logins/s/core':>14}")
+    for rounds in rounds_list:
+        password_hash = bcrypt.hashpw(b'benchmark-password', bcrypt.gensalt(rounds=rounds))
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            bcrypt.checkpw(b'benchmark-password', password_hash)
+            timings.append((time.perf_counter() - started) * 1000)
+        mean = statistics.mean(timings)
+        print(f"{rounds:>6} {mean:>9.1f} {percentile(timings, 95):>9.1f} {1000 / mean:>14.1f}")
+
+
+def login_once(url, email, password):
+    request = urllib.request.Request(
+        f"{url}?action=login",
+        data=json.dumps({'email': email, 'password': password}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError:
+        status = 0
+    return status, (time.perf_counter() - started) * 1000
+
+
+def bench_http(url, email, password, total_requests, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: login_once(url, email, password), range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    timings = [r[1] for r in results]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"Requests: {total_requests}, concurrency: {concurrency}, elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {total_requests / elapsed:.1f} logins/s")
+    print(f"Latency ms: p50={percentile(timings, 50):.0f} p95={percentile(timings, 95):.0f} "
+          f"p99={percentile(timings, 99):.0f} max={max(timings):.0f}")
+    print(f"Statuses: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login benchmark')
+    parser.add_argument('--rounds', default='10,11,12,13')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--url')
+    parser.add_argument('--email', default='student@test.com')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.url:
+        bench_http(args.url, args.email, args.password, args.requests, args.concurrency)
+    else:
+        bench_bcrypt([int(r) for r in args.rounds.split(',')], args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Замер поиска похожих текстовых ответов на синтетических данных.
+
+Строит MinHash-сигнатуры и LSH-корзины теми же функциями, что backend/progress
+при записи результата, и собирает кластеры функцией backend/tests
+(GET ?testId=x&action=similarity). Среди случайных ответов подмешаны группы
+списанных с небольшими правками; проверяется, что группы найдены:
+    python bench_similarity.py --answers 100000 --groups 200
+"""
+import argparse
+import importlib.util
+import os
+import random
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+SYLLABLES = 'ба ве ги до зу ка ле ми но пу ра се ти фо ху ча ши ще ю я ост ник ция ние ать ить ова'.split()
+
+
+def load_module(name):
+    spec = importlib.util.spec_from_file_location(f'{name}_index', os.path.join(BACKEND_DIR, name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_vocabulary(rng, size):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def make_essay(rng, vocabulary, words):
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+
+def edit_essay(rng, vocabulary, essay, edits):
+    words = essay.split()
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    return ' '.join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer similarity benchmark')
+    parser.add_argument('--answers', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--groups', type=int, default=200, help='planted groups of copied answers')
+    parser.add_argument('--group-size', type=int, default=4)
+    parser.add_argument('--edits', type=int, default=2, help='words changed in each copy')
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    progress = load_module('progress')
+    tests = load_module('tests')
+    threshold = args.threshold if args.threshold is not None else tests.SIMILARITY_DEFAULT_THRESHOLD
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+
+    answers = []
+    planted = []
+    for group in range(args.groups):
+        original = make_essay(rng, vocabulary, args.words)
+        members = []
+        for copy in range(args.group_size):
+            members.append(len(answers))
+            answers.append((f'u{len(answers)}', original if copy == 0 else edit_essay(rng, vocabulary, original, args.edits)))
+        planted.append(members)
+    while len(answers) < args.answers:
+        answers.append((f'u{len(answers)}', make_essay(rng, vocabulary, args.words)))
+
+    started = time.perf_counter()
+    signatures = {}
+    owners = {}
+    buckets = defaultdict(list)
+    for index, (user_id, text) in enumerate(answers):
+        signature = progress.minhash_signature(progress.normalize_answer_text(text))
+        result_id = f'r{index:08d}'
+        signatures[('q', result_id)] = signature
+        owners[('q', result_id)] = user_id
+        for band, bucket in progress.lsh_buckets(signature):
+            buckets[(band, bucket)].append(result_id)
+    index_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    shared = [('q', sorted(members)) for members in buckets.values() if len(members) > 1]
+    clusters = tests.cluster_similar_answers(shared, signatures, owners, threshold).get('q', [])
+    cluster_seconds = time.perf_counter() - started
+
+    found = {result_id: number for number, cluster in enumerate(clusters) for result_id in cluster['resultIds']}
+    recovered = sum(
+        1 for members in planted
+        if len({found.get(f'r{index:08d}') for index in members} - {None}) == 1
+        and all(f'r{index:08d}' in found for index in members)
+    )
+    planted_ids = {f'r{index:08d}' for members in planted for index in members}
+    false_positives = sum(1 for result_id in found if result_id not in planted_ids)
+
+    print(f"answers: {len(answers)}, words: {args.words}, threshold: {threshold}")
+    print(f"signatures + buckets: {index_seconds:.2f} s ({len(answers) / max(index_seconds, 1e-9):,.0f} answers/s)")
+    print(f"candidate buckets: {len(shared)}, clustering: {cluster_seconds:.2f} s")
+    print(f"planted groups recovered: {recovered}/{len(planted)}, clusters: {len(clusters)}, "
+          f"unplanted answers in clusters: {false_positives}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import psycopg2
+import bcrypt
 import os
 import uuid
 from datetime import datetime
@@ -10,11 +11,15 @@ if not dsn:
     print("ERROR: DATABASE_URL environment variable not set")
     exit(1)
 
+# Стоимость bcrypt должна совпадать с BCRYPT_ROUNDS функций auth и users
+bcrypt_rounds = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+
 # SQL query with embedded values
 user_id = str(uuid.uuid4())
 email = 'admin@example.com'
 name = 'Администратор'
-password_hash = '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMESn/gGEJ.lVuYKqPXXqxNqK6'
+password = 'admin123'
+password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=bcrypt_rounds)).decode('utf-8')
 role = 'admin'
 is_active = True
 now = datetime.utcnow()
@@ -63,7 +68,7 @@ try:
     print(f"  Email: {email}")
     print(f"  Name: {name}")
     print(f"  Role: {role}")
-    print(f"  Password: admin123")
+    print(f"  Password: {password}")
     
     cur.close()
     conn.close()
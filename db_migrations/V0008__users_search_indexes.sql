@@ -0,0 +1,13 @@
+-- Индексы для серверного поиска и фильтрации пользователей
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Триграммные индексы для подстрочного (ILIKE) и нечеткого (%) поиска по имени и email
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+
+-- Точные фильтры и сортировка
+CREATE INDEX IF NOT EXISTS idx_users_department ON users(department);
+CREATE INDEX IF NOT EXISTS idx_users_position ON users(position);
+CREATE INDEX IF NOT EXISTS idx_users_is_active ON users(is_active);
+CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active DESC NULLS LAST);
+CREATE INDEX IF NOT EXISTS idx_users_registration_date ON users(registration_date DESC);
@@ -0,0 +1,2 @@
+-- Индекс для инкрементальной инвалидации кэша профилей (GET ?action=me) по updated_at
+CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users(updated_at);
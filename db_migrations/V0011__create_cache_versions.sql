@@ -0,0 +1,7 @@
+-- Счетчики версий для кэша каталога: POST/PUT/DELETE увеличивают версию в той же транзакции,
+-- ключи кэша содержат версию, поэтому устаревшие записи не читаются
+CREATE TABLE IF NOT EXISTS cache_versions (
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
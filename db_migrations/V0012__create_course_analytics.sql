@@ -0,0 +1,42 @@
+-- Витрины аналитики по курсам и отделам. Пересчитываются функцией analytics
+-- по журналу analytics_changes, который пополняют назначения, прогресс и отправка тестов
+
+CREATE TABLE IF NOT EXISTS analytics_changes (
+    course_id VARCHAR(36) PRIMARY KEY REFERENCES courses(id),
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS course_stats (
+    course_id VARCHAR(36) PRIMARY KEY REFERENCES courses(id),
+    assigned INTEGER NOT NULL DEFAULT 0,
+    in_progress INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    overdue INTEGER NOT NULL DEFAULT 0,
+    avg_test_score NUMERIC(5, 2),
+    median_hours_to_complete NUMERIC(10, 2),
+    -- Ближайший срок незавершенного назначения: после него растет overdue без записи в БД
+    next_due_at TIMESTAMP,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS course_department_stats (
+    course_id VARCHAR(36) NOT NULL REFERENCES courses(id),
+    department TEXT NOT NULL,
+    assigned INTEGER NOT NULL DEFAULT 0,
+    in_progress INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    overdue INTEGER NOT NULL DEFAULT 0,
+    avg_test_score NUMERIC(5, 2),
+    median_hours_to_complete NUMERIC(10, 2),
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (course_id, department)
+);
+
+CREATE INDEX IF NOT EXISTS idx_course_stats_next_due_at ON course_stats(next_due_at);
+CREATE INDEX IF NOT EXISTS idx_course_department_stats_department ON course_department_stats(department);
+CREATE INDEX IF NOT EXISTS idx_course_assignments_course_id ON course_assignments(course_id);
+
+-- Первичное заполнение: все существующие курсы помечаются к пересчету
+INSERT INTO analytics_changes (course_id, changed_at)
+SELECT id, CURRENT_TIMESTAMP FROM courses
+ON CONFLICT (course_id) DO NOTHING;
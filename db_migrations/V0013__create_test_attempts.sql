@@ -0,0 +1,32 @@
+-- Сводка попыток по пользователю и тесту: обновляется в одной транзакции со вставкой в test_results,
+-- поэтому лимит tests.attempts и лучший/последний балл не требуют подсчета строк test_results
+CREATE TABLE IF NOT EXISTS test_attempts (
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id),
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    course_id VARCHAR(36) NOT NULL REFERENCES courses(id),
+    attempts_used INTEGER NOT NULL DEFAULT 0,
+    best_score INTEGER,
+    last_score INTEGER,
+    passed BOOLEAN NOT NULL DEFAULT FALSE,
+    last_result_id VARCHAR(36),
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, test_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_results_test_id ON test_results(test_id);
+
+-- Заполнение сводки по уже сохраненным результатам
+INSERT INTO test_attempts (user_id, test_id, course_id, attempts_used, best_score, last_score, passed, last_result_id, updated_at)
+SELECT
+    user_id,
+    test_id,
+    (ARRAY_AGG(course_id ORDER BY completed_at DESC, created_at DESC))[1],
+    COUNT(*),
+    MAX(score),
+    (ARRAY_AGG(score ORDER BY completed_at DESC, created_at DESC))[1],
+    BOOL_OR(passed),
+    (ARRAY_AGG(id ORDER BY completed_at DESC, created_at DESC))[1],
+    MAX(completed_at)
+FROM test_results
+GROUP BY user_id, test_id
+ON CONFLICT (user_id, test_id) DO NOTHING;
@@ -0,0 +1,19 @@
+-- Сессии прохождения тестов: время начала и срок фиксирует сервер, порядок вопросов
+-- перемешивается при старте. Просроченные сессии закрывает POST /progress?action=sweep
+CREATE TABLE IF NOT EXISTS exam_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id),
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    course_id VARCHAR(36) NOT NULL REFERENCES courses(id),
+    question_order JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'submitted', 'expired')),
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- NULL, если у теста нет ограничения по времени
+    deadline_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    result_id VARCHAR(36)
+);
+
+-- Не больше одной активной сессии на пользователя и тест
+CREATE UNIQUE INDEX IF NOT EXISTS idx_exam_sessions_active ON exam_sessions(user_id, test_id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_exam_sessions_deadline ON exam_sessions(deadline_at) WHERE status = 'active';
@@ -0,0 +1,11 @@
+-- Пулы вопросов: попытка получает pool_size вопросов из теста (пропорционально по тегам или баллам
+-- при pool_stratify) и, при shuffle_options, свой порядок вариантов ответа
+ALTER TABLE tests ADD COLUMN IF NOT EXISTS pool_size INTEGER CHECK (pool_size IS NULL OR pool_size > 0);
+ALTER TABLE tests ADD COLUMN IF NOT EXISTS pool_stratify VARCHAR(20) CHECK (pool_stratify IN ('tag', 'points'));
+ALTER TABLE tests ADD COLUMN IF NOT EXISTS shuffle_options BOOLEAN NOT NULL DEFAULT FALSE;
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS tag VARCHAR(100);
+
+-- Вариант попытки восстанавливается из seed, копия порядка вопросов больше не хранится
+ALTER TABLE exam_sessions ADD COLUMN IF NOT EXISTS seed BIGINT;
+ALTER TABLE exam_sessions ALTER COLUMN question_order DROP NOT NULL;
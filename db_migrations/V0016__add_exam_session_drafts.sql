@@ -0,0 +1,5 @@
+-- Черновик ответов попытки: autosave сливает изменения в draft_answers не чаще раза в AUTOSAVE_INTERVAL,
+-- submit и обход просроченных сессий оценивают сохраненный черновик
+ALTER TABLE exam_sessions ADD COLUMN IF NOT EXISTS draft_answers JSONB;
+ALTER TABLE exam_sessions ADD COLUMN IF NOT EXISTS draft_seq INTEGER;
+ALTER TABLE exam_sessions ADD COLUMN IF NOT EXISTS draft_saved_at TIMESTAMP;
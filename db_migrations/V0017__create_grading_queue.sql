@@ -0,0 +1,15 @@
+-- Очередь проверки отправок для тестов с queued_grading: submit ставит ответы в очередь
+-- и отвечает 202, POST /progress?action=grade разбирает ее пачками через SKIP LOCKED
+ALTER TABLE tests ADD COLUMN IF NOT EXISTS queued_grading BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS grading_queue (
+    result_id VARCHAR(36) PRIMARY KEY,
+    session_id VARCHAR(36) NOT NULL REFERENCES exam_sessions(id),
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id),
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    course_id VARCHAR(36) NOT NULL REFERENCES courses(id),
+    answers JSONB NOT NULL,
+    enqueued_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_grading_queue_enqueued_at ON grading_queue(enqueued_at);
@@ -0,0 +1,28 @@
+-- Ручная проверка текстовых ответов (text_check_type = 'manual'): ответы попадают в очередь
+-- при записи результата, проверяющие получают их пачками с арендой на время проверки
+CREATE TABLE IF NOT EXISTS answer_reviews (
+    id VARCHAR(36) PRIMARY KEY,
+    result_id VARCHAR(36) NOT NULL REFERENCES test_results(id),
+    question_id VARCHAR(36) NOT NULL REFERENCES questions(id),
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id),
+    answer JSONB,
+    max_points INTEGER NOT NULL,
+    awarded_points INTEGER,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'reviewed')),
+    -- Аренда: пока lease_until не истек, ответ не выдается другим проверяющим
+    leased_by VARCHAR(36),
+    lease_until TIMESTAMP,
+    reviewer_id VARCHAR(36) REFERENCES users(id),
+    reviewed_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (result_id, question_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_answer_reviews_pending ON answer_reviews(created_at) WHERE status = 'pending';
+
+-- Баллы результата в числителе и знаменателе: проверка добавляет баллы без пересчета всего теста.
+-- NULL у результатов, записанных до появления ручной проверки
+ALTER TABLE test_results ADD COLUMN IF NOT EXISTS earned_points INTEGER;
+ALTER TABLE test_results ADD COLUMN IF NOT EXISTS total_points INTEGER;
+ALTER TABLE test_results ADD COLUMN IF NOT EXISTS pending_reviews INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,28 @@
+-- Поиск похожих развернутых ответов: MinHash-сигнатура каждого текстового ответа и
+-- LSH-корзины по полосам сигнатуры. Ответы из одной корзины - кандидаты в совпадения,
+-- поэтому попарное сравнение всех ответов не нужно
+CREATE TABLE IF NOT EXISTS answer_signatures (
+    result_id VARCHAR(36) NOT NULL REFERENCES test_results(id),
+    question_id VARCHAR(36) NOT NULL REFERENCES questions(id),
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id),
+    -- Значения MinHash, uint32 подряд
+    signature BYTEA NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (result_id, question_id)
+);
+
+CREATE TABLE IF NOT EXISTS answer_lsh_buckets (
+    test_id VARCHAR(36) NOT NULL REFERENCES tests(id),
+    question_id VARCHAR(36) NOT NULL REFERENCES questions(id),
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    result_id VARCHAR(36) NOT NULL REFERENCES test_results(id),
+    PRIMARY KEY (test_id, question_id, band, bucket, result_id)
+);
+
+-- Уже сохраненные результаты индексирует POST /progress?action=similarity;
+-- новые индексируются при записи, поэтому для них значение по умолчанию TRUE
+ALTER TABLE test_results ADD COLUMN IF NOT EXISTS similarity_indexed BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE test_results ALTER COLUMN similarity_indexed SET DEFAULT TRUE;
+CREATE INDEX IF NOT EXISTS idx_test_results_similarity_pending ON test_results(created_at) WHERE NOT similarity_indexed;
@@ -0,0 +1,2 @@
+-- Версии кэша доступности уроков заводятся на пару пользователь-курс: unlock:<userId>:<courseId>
+ALTER TABLE cache_versions ALTER COLUMN scope TYPE VARCHAR(100);
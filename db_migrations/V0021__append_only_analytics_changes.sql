@@ -0,0 +1,6 @@
+-- Журнал изменений для аналитики только дописывается: запись не конфликтует с существующей
+-- строкой курса, поэтому пересчет не может удалить отметку еще не завершенной транзакции
+ALTER TABLE analytics_changes ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+ALTER TABLE analytics_changes DROP CONSTRAINT IF EXISTS analytics_changes_pkey;
+ALTER TABLE analytics_changes ADD PRIMARY KEY (id);
+CREATE INDEX IF NOT EXISTS idx_analytics_changes_course_id ON analytics_changes(course_id);
@@ -0,0 +1,2 @@
+-- Анализ заданий теста берет выданные попытке вопросы из ее сессии по result_id
+CREATE INDEX IF NOT EXISTS idx_exam_sessions_result_id ON exam_sessions(result_id) WHERE result_id IS NOT NULL;
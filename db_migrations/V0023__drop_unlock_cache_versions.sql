@@ -0,0 +1,2 @@
+-- Кэш доступности уроков опирается на updated_at прогресса и попыток; версии unlock:<userId>:<courseId> больше не пишутся
+DELETE FROM cache_versions WHERE scope LIKE 'unlock:%';
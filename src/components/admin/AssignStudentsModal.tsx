@@ -3,7 +3,7 @@ import { Button } from '@/components/ui/button';
 import { Checkbox } from '@/components/ui/checkbox';
 import Icon from '@/components/ui/icon';
 import { useState, useEffect } from 'react';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, fetchAllUsers, getAuthHeaders } from '@/config/api';
 
 interface Student {
   id: string;
@@ -42,16 +42,12 @@ export default function AssignStudentsModal({
   const loadStudents = async () => {
     setLoading(true);
     try {
-      const usersRes = await fetch(API_ENDPOINTS.USERS, {
-        headers: getAuthHeaders(),
-      });
+      const studentUsers = await fetchAllUsers({ role: 'student', isActive: 'true' });
 
-      if (usersRes.ok) {
-        const data = await usersRes.json();
-        const studentUsers = (data.users || []).filter((u: any) => u.role === 'student' && u.isActive);
+      if (studentUsers) {
         setStudents(studentUsers);
 
-        const assignmentsRes = await fetch(`${API_ENDPOINTS.ASSIGNMENTS}?courseId=${courseId}`, {
+        const assignmentsRes = await apiFetch(`${API_ENDPOINTS.ASSIGNMENTS}?courseId=${courseId}`, {
           headers: getAuthHeaders(),
         });
 
@@ -86,7 +82,7 @@ export default function AssignStudentsModal({
       const studentsToUnassign = Array.from(assignedStudents).filter(id => !selectedStudents.has(id));
 
       for (const studentId of studentsToAssign) {
-        await fetch(API_ENDPOINTS.ASSIGNMENTS, {
+        await apiFetch(API_ENDPOINTS.ASSIGNMENTS, {
           method: 'POST',
           headers: getAuthHeaders(),
           body: JSON.stringify({
@@ -97,7 +93,7 @@ export default function AssignStudentsModal({
       }
 
       for (const studentId of studentsToUnassign) {
-        await fetch(`${API_ENDPOINTS.ASSIGNMENTS}?courseId=${courseId}&userId=${studentId}`, {
+        await apiFetch(`${API_ENDPOINTS.ASSIGNMENTS}?courseId=${courseId}&userId=${studentId}`, {
           method: 'DELETE',
           headers: getAuthHeaders(),
         });
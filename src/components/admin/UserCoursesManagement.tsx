@@ -3,7 +3,7 @@ import { Badge } from '@/components/ui/badge';
 import Icon from '@/components/ui/icon';
 import { User, CourseAssignment, Course, Lesson, CourseProgress, TestResult } from '@/types';
 import { useState, useEffect } from 'react';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 
 interface UserCoursesManagementProps {
   user: User;
@@ -33,7 +33,7 @@ export default function UserCoursesManagement({
   const loadCourses = async () => {
     try {
       setLoading(true);
-      const response = await fetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() });
+      const response = await apiFetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setCourses(data.courses || []);
@@ -47,7 +47,7 @@ export default function UserCoursesManagement({
 
   const loadProgress = async () => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.PROGRESS}?userId=${user.id}`, { headers: getAuthHeaders() });
+      const response = await apiFetch(`${API_ENDPOINTS.PROGRESS}?userId=${user.id}`, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setProgressData(data.progress || []);
@@ -61,7 +61,7 @@ export default function UserCoursesManagement({
     if (lessonsData[courseId]) return;
     
     try {
-      const response = await fetch(`${API_ENDPOINTS.LESSONS}?courseId=${courseId}`, { headers: getAuthHeaders() });
+      const response = await apiFetch(`${API_ENDPOINTS.LESSONS}?courseId=${courseId}`, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setLessonsData(prev => ({ ...prev, [courseId]: data.lessons || [] }));
@@ -75,7 +75,7 @@ export default function UserCoursesManagement({
     if (testResults[courseId]) return;
     
     try {
-      const response = await fetch(`${API_ENDPOINTS.TESTS}?action=results&courseId=${courseId}&userId=${user.id}`, { headers: getAuthHeaders() });
+      const response = await apiFetch(`${API_ENDPOINTS.TESTS}?action=results&courseId=${courseId}&userId=${user.id}`, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setTestResults(prev => ({ ...prev, [courseId]: data.results || [] }));
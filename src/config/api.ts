@@ -19,6 +19,61 @@ export function setAuthToken(token: string): void {
 
 export function removeAuthToken(): void {
   localStorage.removeItem('authToken');
+  localStorage.removeItem('refreshToken');
+}
+
+export function getRefreshToken(): string | null {
+  return localStorage.getItem('refreshToken');
+}
+
+export function setRefreshToken(token: string): void {
+  localStorage.setItem('refreshToken', token);
+}
+
+export function getTokenExpiresIn(token: string): number | null {
+  try {
+    const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+    return payload.exp ? payload.exp - Math.floor(Date.now() / 1000) : null;
+  } catch {
+    return null;
+  }
+}
+
+// Событие для AuthContext: токен не удалось обновить, сессия закончилась
+export const AUTH_EXPIRED_EVENT = 'auth:expired';
+
+let refreshInFlight: Promise<number | null> | null = null;
+
+async function requestTokenRefresh(): Promise<number | null> {
+  const refreshToken = getRefreshToken();
+  if (!refreshToken) {
+    return null;
+  }
+
+  const response = await fetch(`${API_ENDPOINTS.AUTH}?action=refresh`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ refreshToken }),
+  });
+
+  if (!response.ok) {
+    return null;
+  }
+
+  const data = await response.json();
+  setAuthToken(data.token);
+  setRefreshToken(data.refreshToken);
+  return data.expiresIn;
+}
+
+// Refresh-токен одноразовый: параллельные вызовы (таймер, ответы 401) ждут одного обновления
+export function refreshAuthToken(): Promise<number | null> {
+  if (!refreshInFlight) {
+    refreshInFlight = requestTokenRefresh().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
 }
 
 export function getAuthHeaders(): HeadersInit {
@@ -27,4 +82,53 @@ export function getAuthHeaders(): HeadersInit {
     'Content-Type': 'application/json',
     ...(token ? { 'X-Auth-Token': token } : {}),
   };
-}
\ No newline at end of file
+}
+
+function withAuthToken(init: RequestInit): RequestInit {
+  const headers = new Headers(init.headers);
+  const token = getAuthToken();
+  if (token) {
+    headers.set('X-Auth-Token', token);
+  }
+  return { ...init, headers };
+}
+
+// fetch с текущим токеном: на 401 обновляет токен и один раз повторяет запрос.
+// Таймер обновления в фоновой вкладке может сработать с опозданием
+export async function apiFetch(input: string, init: RequestInit = {}): Promise<Response> {
+  const sentToken = getAuthToken();
+  const response = await fetch(input, withAuthToken(init));
+  if (response.status !== 401 || !getRefreshToken()) {
+    return response;
+  }
+
+  // Токен мог уже обновить параллельный запрос: тогда достаточно повтора
+  if (getAuthToken() === sentToken) {
+    const expiresIn = await refreshAuthToken().catch(() => null);
+    if (!expiresIn) {
+      window.dispatchEvent(new Event(AUTH_EXPIRED_EVENT));
+      return response;
+    }
+  }
+  return fetch(input, withAuthToken(init));
+}
+
+const USERS_PAGE_SIZE = 500;
+
+// Список пользователей отдается страницами: обходим их до total
+export async function fetchAllUsers(params: Record<string, string> = {}): Promise<any[] | null> {
+  const users: any[] = [];
+  for (;;) {
+    const query = new URLSearchParams({ ...params, limit: String(USERS_PAGE_SIZE), offset: String(users.length) });
+    const response = await apiFetch(`${API_ENDPOINTS.USERS}?${query}`, { headers: getAuthHeaders() });
+    if (!response.ok) {
+      return null;
+    }
+    const data = await response.json();
+    const page = data.users || [];
+    users.push(...page);
+    if (page.length === 0 || users.length >= data.total) {
+      return users;
+    }
+  }
+}
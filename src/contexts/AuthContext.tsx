@@ -1,6 +1,19 @@
-import { createContext, useContext, useState, useEffect, ReactNode } from 'react';
+import { createContext, useContext, useState, useEffect, useRef, ReactNode } from 'react';
 import { User } from '@/types';
-import { API_ENDPOINTS, getAuthHeaders, setAuthToken, removeAuthToken } from '@/config/api';
+import {
+  API_ENDPOINTS,
+  getAuthHeaders,
+  setAuthToken,
+  removeAuthToken,
+  getRefreshToken,
+  setRefreshToken,
+  refreshAuthToken,
+  getTokenExpiresIn,
+  getAuthToken,
+  AUTH_EXPIRED_EVENT,
+} from '@/config/api';
+
+const DEFAULT_TOKEN_LIFETIME_SECONDS = 15 * 60;
 
 interface AuthContextType {
   user: User | null;
@@ -14,6 +27,63 @@ const AuthContext = createContext<AuthContextType | undefined>(undefined);
 export function AuthProvider({ children }: { children: ReactNode }) {
   const [user, setUser] = useState<User | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const refreshTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+
+  const clearSession = () => {
+    if (refreshTimer.current) {
+      clearTimeout(refreshTimer.current);
+    }
+    setUser(null);
+    localStorage.removeItem('currentUser');
+    removeAuthToken();
+  };
+
+  const refreshNow = async () => {
+    try {
+      const nextExpiresIn = await refreshAuthToken();
+      if (nextExpiresIn) {
+        scheduleRefresh(nextExpiresIn);
+        return;
+      }
+    } catch (error) {
+      console.error('Token refresh error:', error);
+    }
+    clearSession();
+  };
+
+  const scheduleRefresh = (expiresIn: number) => {
+    if (refreshTimer.current) {
+      clearTimeout(refreshTimer.current);
+    }
+    // Обновляем access-токен заранее, до истечения его срока
+    refreshTimer.current = setTimeout(refreshNow, Math.max(expiresIn - 60, 10) * 1000);
+  };
+
+  useEffect(() => {
+    // В фоновой вкладке таймеры замедляются: при возвращении проверяем срок токена сразу.
+    // Пропущенные обновления подхватывает apiFetch по ответу 401
+    const handleVisibilityChange = () => {
+      const token = getAuthToken();
+      if (document.visibilityState !== 'visible' || !token || !getRefreshToken()) {
+        return;
+      }
+      const expiresIn = getTokenExpiresIn(token);
+      if (expiresIn !== null && expiresIn <= 60) {
+        refreshNow();
+      }
+    };
+    const handleAuthExpired = () => clearSession();
+
+    document.addEventListener('visibilitychange', handleVisibilityChange);
+    window.addEventListener(AUTH_EXPIRED_EVENT, handleAuthExpired);
+    return () => {
+      document.removeEventListener('visibilitychange', handleVisibilityChange);
+      window.removeEventListener(AUTH_EXPIRED_EVENT, handleAuthExpired);
+      if (refreshTimer.current) {
+        clearTimeout(refreshTimer.current);
+      }
+    };
+  }, []);
 
   useEffect(() => {
     const initAuth = async () => {
@@ -32,14 +102,21 @@ export function AuthProvider({ children }: { children: ReactNode }) {
 
           if (response.ok) {
             setUser(JSON.parse(savedUser));
+            scheduleRefresh(getTokenExpiresIn(token) ?? DEFAULT_TOKEN_LIFETIME_SECONDS);
           } else {
-            localStorage.removeItem('currentUser');
-            localStorage.removeItem('authToken');
+            const expiresIn = await refreshAuthToken();
+            if (expiresIn) {
+              setUser(JSON.parse(savedUser));
+              scheduleRefresh(expiresIn);
+            } else {
+              localStorage.removeItem('currentUser');
+              removeAuthToken();
+            }
           }
         } catch (error) {
           console.error('Auth verification error:', error);
           localStorage.removeItem('currentUser');
-          localStorage.removeItem('authToken');
+          removeAuthToken();
         }
       }
       setIsLoading(false);
@@ -64,6 +141,10 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       
       if (data.token && data.user) {
         setAuthToken(data.token);
+        if (data.refreshToken) {
+          setRefreshToken(data.refreshToken);
+        }
+        scheduleRefresh(data.expiresIn || DEFAULT_TOKEN_LIFETIME_SECONDS);
         setUser(data.user);
         localStorage.setItem('currentUser', JSON.stringify(data.user));
         return true;
@@ -81,14 +162,13 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       await fetch(`${API_ENDPOINTS.AUTH}?action=logout`, {
         method: 'POST',
         headers: getAuthHeaders(),
+        body: JSON.stringify({ refreshToken: getRefreshToken() }),
       });
     } catch (error) {
       console.error('Logout error:', error);
     }
     
-    setUser(null);
-    localStorage.removeItem('currentUser');
-    removeAuthToken();
+    clearSession();
   };
 
   if (isLoading) {
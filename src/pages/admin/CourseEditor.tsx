@@ -4,7 +4,7 @@ import AdminLayout from '@/components/AdminLayout';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { ROUTES } from '@/constants/routes';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 import CourseInfoForm from '@/components/admin/CourseInfoForm';
 import CourseSummary from '@/components/admin/CourseSummary';
 import CourseLessonsList from '@/components/admin/CourseLessonsList';
@@ -75,8 +75,8 @@ export default function CourseEditor() {
     setLoadingCourse(true);
     try {
       const [courseRes, lessonsRes] = await Promise.all([
-        fetch(`${API_ENDPOINTS.COURSES}?id=${id}`, { headers: getAuthHeaders() }),
-        fetch(`${API_ENDPOINTS.LESSONS}?courseId=${id}`, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.COURSES}?id=${id}`, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.LESSONS}?courseId=${id}`, { headers: getAuthHeaders() }),
       ]);
 
       if (courseRes.ok && lessonsRes.ok) {
@@ -211,7 +211,7 @@ export default function CourseEditor() {
         published: formData.status === 'published',
       };
 
-      const courseRes = await fetch(url, {
+      const courseRes = await apiFetch(url, {
         method,
         headers: getAuthHeaders(),
         body: JSON.stringify(coursePayload),
@@ -225,7 +225,7 @@ export default function CourseEditor() {
       const savedCourseId = courseData.course.id;
 
       if (isEditMode) {
-        const existingLessonsRes = await fetch(`${API_ENDPOINTS.LESSONS}?courseId=${savedCourseId}`, {
+        const existingLessonsRes = await apiFetch(`${API_ENDPOINTS.LESSONS}?courseId=${savedCourseId}`, {
           headers: getAuthHeaders(),
         });
         const existingLessons = existingLessonsRes.ok ? (await existingLessonsRes.json()).lessons : [];
@@ -249,13 +249,13 @@ export default function CourseEditor() {
           };
 
           if (existingLessonIds.has(lesson.id)) {
-            await fetch(`${API_ENDPOINTS.LESSONS}?id=${lesson.id}`, {
+            await apiFetch(`${API_ENDPOINTS.LESSONS}?id=${lesson.id}`, {
               method: 'PUT',
               headers: getAuthHeaders(),
               body: JSON.stringify(lessonPayload),
             });
           } else {
-            await fetch(API_ENDPOINTS.LESSONS, {
+            await apiFetch(API_ENDPOINTS.LESSONS, {
               method: 'POST',
               headers: getAuthHeaders(),
               body: JSON.stringify(lessonPayload),
@@ -280,7 +280,7 @@ export default function CourseEditor() {
             finalTestRequiresAllTests: lesson.finalTestRequiresAllTests || false,
           };
 
-          await fetch(API_ENDPOINTS.LESSONS, {
+          await apiFetch(API_ENDPOINTS.LESSONS, {
             method: 'POST',
             headers: getAuthHeaders(),
             body: JSON.stringify(lessonPayload),
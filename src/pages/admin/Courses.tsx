@@ -6,7 +6,7 @@ import Icon from '@/components/ui/icon';
 import { getCategoryIcon, getCategoryGradient } from '@/utils/categoryIcons';
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 import AssignStudentsModal from '@/components/admin/AssignStudentsModal';
 
 interface Course {
@@ -38,7 +38,7 @@ export default function AdminCourses() {
   const loadCourses = async () => {
     try {
       setLoading(true);
-      const response = await fetch(API_ENDPOINTS.COURSES, {
+      const response = await apiFetch(API_ENDPOINTS.COURSES, {
         headers: getAuthHeaders(),
       });
 
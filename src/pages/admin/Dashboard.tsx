@@ -2,7 +2,7 @@ import AdminLayout from '@/components/AdminLayout';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import Icon from '@/components/ui/icon';
 import { useState, useEffect } from 'react';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 
 export default function AdminDashboard() {
   const [stats, setStats] = useState({
@@ -21,23 +21,25 @@ export default function AdminDashboard() {
     try {
       setLoading(true);
       
-      const [usersRes, coursesRes] = await Promise.all([
-        fetch(API_ENDPOINTS.USERS, { headers: getAuthHeaders() }),
-        fetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() }),
+      // Для счетчиков пользователей достаточно total, сами строки не нужны
+      const [studentsRes, activeRes, coursesRes] = await Promise.all([
+        apiFetch(`${API_ENDPOINTS.USERS}?role=student&fields=id&limit=1`, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.USERS}?isActive=true&fields=id&limit=1`, { headers: getAuthHeaders() }),
+        apiFetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() }),
       ]);
 
-      if (usersRes.ok && coursesRes.ok) {
-        const usersData = await usersRes.json();
+      if (studentsRes.ok && activeRes.ok && coursesRes.ok) {
+        const studentsData = await studentsRes.json();
+        const activeData = await activeRes.json();
         const coursesData = await coursesRes.json();
 
-        const users = usersData.users || [];
         const courses = coursesData.courses || [];
 
         setStats({
           totalCourses: courses.length,
           publishedCourses: courses.filter((c: any) => c.published).length,
-          totalStudents: users.filter((u: any) => u.role === 'student').length,
-          activeUsers: users.filter((u: any) => u.isActive).length,
+          totalStudents: studentsData.total || 0,
+          activeUsers: activeData.total || 0,
         });
       }
     } catch (error) {
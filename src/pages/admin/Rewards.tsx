@@ -3,7 +3,7 @@ import AdminLayout from '@/components/AdminLayout';
 import { Card, CardContent } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 import { Reward, Course } from '@/types';
 import RewardStatsCards from '@/components/admin/rewards/RewardStatsCards';
 import RewardCard from '@/components/admin/rewards/RewardCard';
@@ -30,7 +30,7 @@ export default function Rewards() {
 
   const loadRewards = async () => {
     try {
-      const response = await fetch(API_ENDPOINTS.REWARDS, { headers: getAuthHeaders() });
+      const response = await apiFetch(API_ENDPOINTS.REWARDS, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setRewards(data.rewards || []);
@@ -42,7 +42,7 @@ export default function Rewards() {
 
   const loadCourses = async () => {
     try {
-      const response = await fetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() });
+      const response = await apiFetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() });
       if (response.ok) {
         const data = await response.json();
         setCourses(data.courses || []);
@@ -60,7 +60,7 @@ export default function Rewards() {
     color: string;
   }) => {
     try {
-      const response = await fetch(API_ENDPOINTS.REWARDS, {
+      const response = await apiFetch(API_ENDPOINTS.REWARDS, {
         method: 'POST',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -94,7 +94,7 @@ export default function Rewards() {
     color: string;
   }) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.REWARDS}?id=${rewardData.id}`, {
+      const response = await apiFetch(`${API_ENDPOINTS.REWARDS}?id=${rewardData.id}`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -117,7 +117,7 @@ export default function Rewards() {
 
   const handleDeleteReward = async (rewardId: string) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.REWARDS}?id=${rewardId}`, {
+      const response = await apiFetch(`${API_ENDPOINTS.REWARDS}?id=${rewardId}`, {
         method: 'DELETE',
         headers: getAuthHeaders(),
       });
@@ -4,7 +4,7 @@ import AdminLayout from '@/components/AdminLayout';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { ROUTES } from '@/constants/routes';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 import TestInfoForm from '@/components/admin/TestInfoForm';
 import TestSummary from '@/components/admin/TestSummary';
 import TestQuestionsList from '@/components/admin/TestQuestionsList';
@@ -68,8 +68,8 @@ export default function TestEditor() {
     setLoadingTest(true);
     try {
       const [testRes, questionsRes] = await Promise.all([
-        fetch(`${API_ENDPOINTS.TESTS}?id=${id}`, { headers: getAuthHeaders() }),
-        fetch(`${API_ENDPOINTS.TESTS}?testId=${id}&action=questions`, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.TESTS}?id=${id}`, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.TESTS}?testId=${id}&action=questions`, { headers: getAuthHeaders() }),
       ]);
 
       if (testRes.ok && questionsRes.ok) {
@@ -222,7 +222,7 @@ export default function TestEditor() {
         status: formData.status,
       };
 
-      const testRes = await fetch(url, {
+      const testRes = await apiFetch(url, {
         method,
         headers: getAuthHeaders(),
         body: JSON.stringify(testPayload),
@@ -266,7 +266,7 @@ export default function TestEditor() {
           textCheckType: question.type === 'text' ? (question.textCheckType || 'manual') : undefined,
         };
 
-        await fetch(`${API_ENDPOINTS.TESTS}?action=question`, {
+        await apiFetch(`${API_ENDPOINTS.TESTS}?action=question`, {
           method: 'POST',
           headers: getAuthHeaders(),
           body: JSON.stringify(questionPayload),
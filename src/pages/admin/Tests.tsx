@@ -5,7 +5,7 @@ import { Card, CardContent } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
 import Icon from '@/components/ui/icon';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 
 interface Test {
   id: string;
@@ -35,7 +35,7 @@ export default function Tests() {
   const loadData = async () => {
     setLoading(true);
     try {
-      const testsRes = await fetch(API_ENDPOINTS.TESTS, { headers: getAuthHeaders() });
+      const testsRes = await apiFetch(API_ENDPOINTS.TESTS, { headers: getAuthHeaders() });
       if (testsRes.ok) {
         const testsData = await testsRes.json();
         setTests(testsData.tests || []);
@@ -9,7 +9,7 @@ import UserFilters, { FilterState } from '@/components/admin/UserFilters';
 import UserDetailsModal from '@/components/admin/UserDetailsModal';
 import AddUserModal, { NewUserData } from '@/components/admin/AddUserModal';
 import { User, CourseAssignment } from '@/types';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, fetchAllUsers, getAuthHeaders } from '@/config/api';
 
 export default function AdminUsers() {
   const [searchQuery, setSearchQuery] = useState('');
@@ -34,13 +34,10 @@ export default function AdminUsers() {
   const loadUsers = async () => {
     try {
       setLoading(true);
-      const response = await fetch(API_ENDPOINTS.USERS, {
-        headers: getAuthHeaders(),
-      });
+      const allUsers = await fetchAllUsers();
 
-      if (response.ok) {
-        const data = await response.json();
-        const formattedUsers = data.users.map((u: any) => ({
+      if (allUsers) {
+        const formattedUsers = allUsers.map((u: any) => ({
           id: u.id,
           email: u.email,
           name: u.name,
@@ -64,7 +61,7 @@ export default function AdminUsers() {
 
   const loadAssignments = async () => {
     try {
-      const response = await fetch(API_ENDPOINTS.ASSIGNMENTS, {
+      const response = await apiFetch(API_ENDPOINTS.ASSIGNMENTS, {
         headers: getAuthHeaders(),
       });
 
@@ -126,7 +123,7 @@ export default function AdminUsers() {
 
   const handleEditRole = async (userId: string, newRole: 'admin' | 'student') => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=role`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=role`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({ role: newRole }),
@@ -145,7 +142,7 @@ export default function AdminUsers() {
 
   const handleAddUser = async (userData: NewUserData) => {
     try {
-      const response = await fetch(API_ENDPOINTS.USERS, {
+      const response = await apiFetch(API_ENDPOINTS.USERS, {
         method: 'POST',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -169,7 +166,7 @@ export default function AdminUsers() {
 
   const handleEditPassword = async (userId: string, newPassword: string) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=password`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=password`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({ password: newPassword }),
@@ -185,7 +182,7 @@ export default function AdminUsers() {
 
   const handleEditUser = async (userId: string, userData: Partial<User>) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${userId}`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${userId}`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -210,7 +207,7 @@ export default function AdminUsers() {
 
   const handleToggleActive = async (userId: string, isActive: boolean) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=toggle`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${userId}&action=toggle`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({ isActive }),
@@ -229,7 +226,7 @@ export default function AdminUsers() {
 
   const handleAssignCourse = async (userId: string, courseId: string) => {
     try {
-      const response = await fetch(API_ENDPOINTS.ASSIGNMENTS, {
+      const response = await apiFetch(API_ENDPOINTS.ASSIGNMENTS, {
         method: 'POST',
         headers: getAuthHeaders(),
         body: JSON.stringify({ userId, courseId }),
@@ -245,7 +242,7 @@ export default function AdminUsers() {
 
   const handleRemoveAssignment = async (assignmentId: string) => {
     try {
-      const response = await fetch(`${API_ENDPOINTS.ASSIGNMENTS}?id=${assignmentId}`, {
+      const response = await apiFetch(`${API_ENDPOINTS.ASSIGNMENTS}?id=${assignmentId}`, {
         method: 'DELETE',
         headers: getAuthHeaders(),
       });
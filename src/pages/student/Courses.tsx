@@ -8,7 +8,7 @@ import { getCategoryIcon, getCategoryGradient } from '@/utils/categoryIcons';
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { ROUTES } from '@/constants/routes';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 
 interface Course {
   id: string;
@@ -48,8 +48,8 @@ export default function StudentCourses() {
     try {
       setLoading(true);
       const [coursesRes, progressRes] = await Promise.all([
-        fetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() }),
-        fetch(`${API_ENDPOINTS.PROGRESS}?userId=${userId}`, { headers: getAuthHeaders() }),
+        apiFetch(API_ENDPOINTS.COURSES, { headers: getAuthHeaders() }),
+        apiFetch(`${API_ENDPOINTS.PROGRESS}?userId=${userId}`, { headers: getAuthHeaders() }),
       ]);
 
       if (coursesRes.ok) {
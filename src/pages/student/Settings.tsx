@@ -5,7 +5,7 @@ import Icon from '@/components/ui/icon';
 import { useState, useEffect } from 'react';
 import { User } from '@/types';
 import { useAuth } from '@/contexts/AuthContext';
-import { API_ENDPOINTS, getAuthHeaders } from '@/config/api';
+import { API_ENDPOINTS, apiFetch, getAuthHeaders } from '@/config/api';
 import { toast } from 'sonner';
 
 export default function StudentSettings() {
@@ -60,7 +60,7 @@ export default function StudentSettings() {
 
     setIsLoading(true);
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${authUser.id}`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${authUser.id}`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({
@@ -96,7 +96,7 @@ export default function StudentSettings() {
 
     setIsLoading(true);
     try {
-      const response = await fetch(`${API_ENDPOINTS.USERS}?id=${authUser.id}&action=password`, {
+      const response = await apiFetch(`${API_ENDPOINTS.USERS}?id=${authUser.id}&action=password`, {
         method: 'PUT',
         headers: getAuthHeaders(),
         body: JSON.stringify({